@@ -1,4 +1,5 @@
 from django.db import models
+from Pharmarcy_Prescription_Tracker.inventory_events import InventoryQuerySet
 from datetime import date, timedelta
 from django.conf import settings
 
@@ -49,6 +50,8 @@ class Medicine(models.Model):
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     selling_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     image = models.ImageField(upload_to='medical_products/', blank=True, null=True)
+    # Content hash of `image`; names its thumbnails/WebP copies under media/derivatives/ (set by onlineStore.images)
+    image_digest = models.CharField(max_length=64, blank=True, editable=False)
     quantity_in_stock = models.PositiveIntegerField()
     reorder_level = models.PositiveIntegerField(default=10)
     manufacture_date = models.DateField()
@@ -65,6 +68,9 @@ class Medicine(models.Model):
         related_name='medicines'
     )
 
+    # bulk writes notify the online store too (see inventory_events)
+    objects = InventoryQuerySet.as_manager()
+
     def is_expired(self):
         return date.today() >= self.expiry_date
 
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Non_Medicine_inventory', '0004_alter_nonmedicalproduct_available_online'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nonmedicalproduct',
+            name='image_digest',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
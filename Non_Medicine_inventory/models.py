@@ -1,4 +1,5 @@
 from django.db import models
+from Pharmarcy_Prescription_Tracker.inventory_events import InventoryQuerySet
 from django.utils.text import slugify
 from django.db.models import F
 
@@ -21,11 +22,16 @@ class NonMedicalProduct(models.Model):
     selling_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='non_medical_products/', blank=True, null=True)
+    # Content hash of `image`; names its thumbnails/WebP copies under media/derivatives/ (set by onlineStore.images)
+    image_digest = models.CharField(max_length=64, blank=True, editable=False)
     available_online = models.BooleanField(default=True, help_text="Is this product available online?")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     reorder_level = models.PositiveIntegerField(default=5)
 
+    # bulk writes notify the online store too (see inventory_events)
+    objects = InventoryQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -0,0 +1,50 @@
+"""
+Change notifications for the inventory tables (Medicine, NonMedicalProduct).
+
+post_save only fires for Model.save(); bulk_create/bulk_update/update() write
+rows silently. The inventory managers use InventoryQuerySet, which sends
+`inventory_changed` once per bulk call with every affected primary key, so
+projections such as the online store's Product table can follow set-wise.
+"""
+from django.db import models
+from django.dispatch import Signal
+
+# Sent with: ids (list of pks), created (bool), fields (set of field names, None = new rows).
+# ids is None for an update() that didn't touch a PROJECTED_FIELDS column.
+inventory_changed = Signal()
+
+# Columns other apps mirror row by row. An update() that only touches other columns
+# (stock counters, prices) still notifies, but skips the id lookup, so hot paths
+# like checkout don't pay for an extra query.
+PROJECTED_FIELDS = frozenset({'available_online', 'image'})
+
+
+class InventoryQuerySet(models.QuerySet):
+    def _notify(self, ids, created, fields=None):
+        if ids or (ids is None and fields):
+            inventory_changed.send(sender=self.model, ids=ids, created=created, fields=fields)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._notify([obj.pk for obj in objs if obj.pk is not None], created=True)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        self._notify([obj.pk for obj in objs], created=False, fields=set(fields))
+        return rows
+
+    def update(self, **kwargs):
+        if not inventory_changed.has_listeners(self.model):
+            return super().update(**kwargs)
+        if not PROJECTED_FIELDS.intersection(kwargs):
+            rows = super().update(**kwargs)
+            if rows:
+                self._notify(None, created=False, fields=set(kwargs))
+            return rows
+        # Collect the ids first: after the UPDATE the filter may no longer match them
+        ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        self._notify(ids, created=False, fields=set(kwargs))
+        return rows
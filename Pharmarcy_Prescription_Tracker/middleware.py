@@ -5,8 +5,9 @@ class NoCacheMiddleware:
     def __call__(self, request):
         response = self.get_response(request)
         
-        # Add no-cache headers to authenticated requests
-        if request.user.is_authenticated:
+        # Add no-cache headers to authenticated requests,
+        # unless the view already chose its own caching (e.g. the revalidated catalog API)
+        if request.user.is_authenticated and not response.has_header('Cache-Control'):
             response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
             response['Pragma'] = 'no-cache'
             response['Expires'] = '0'
@@ -42,4 +43,20 @@ class RoleBasedAccessMiddleware:
                 raise PermissionDenied("You must be a customer to access this page.")
         
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+class GuestCartMiddleware:
+    """
+    Loads the anonymous shopper's signed-cookie cart onto request.guest_cart and
+    writes it back (or deletes it after a login merge) on the way out.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from onlineStore.cart import GuestCart
+
+        request.guest_cart = GuestCart.from_request(request)
+        response = self.get_response(request)
+        request.guest_cart.save(response)
+        return response
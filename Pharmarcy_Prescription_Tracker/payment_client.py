@@ -0,0 +1,244 @@
+"""
+Shared payment gateway client used by the online store and the cashier payments app.
+
+One GatewayClient per process, on a pooled requests session, with per-call
+timeouts, bounded retries with jittered backoff, a circuit breaker that fails
+fast while the provider is down, and simple latency/error counters. Breaker
+transitions are logged, and GatewayClient.status() (served to admins at
+/accounts/dashboard/admin/payment-gateway/) shows the pool, breaker and counters.
+Point PAYMENT_GATEWAY_CLIENT['API_BASE'] at a local mock server (e.g. stripe-mock)
+to exercise it without network access.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'TIMEOUT': (3.05, 10),        # (connect, read) seconds
+    'MAX_RETRIES': 2,             # extra attempts after the first one
+    'BACKOFF_BASE': 0.25,         # seconds, doubled each retry before jitter
+    'BACKOFF_MAX': 2.0,
+    'POOL_SIZE': 10,              # keep-alive connections per host
+    'BREAKER_THRESHOLD': 5,       # consecutive failures before the circuit opens
+    'BREAKER_RESET_TIMEOUT': 30,  # seconds to wait before letting a trial call through
+    'API_BASE': None,
+}
+
+# Worth retrying: the request may not have reached Stripe, or Stripe said "try again"
+RETRYABLE_ERRORS = (stripe.APIConnectionError, stripe.RateLimitError)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the gateway while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """
+        Closed lets everything through and open nothing. Half-open lets one trial
+        call through at a time, and its result decides whether we close or re-open.
+        A trial that never reports back (e.g. a 4xx, which says nothing about the
+        provider's health) frees the slot after another reset_timeout.
+        """
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.OPEN:
+                return False
+            now = self.clock()
+            if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+                return False
+            self.trial_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Payment gateway circuit closed after a successful trial call")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.trial_started_at = None
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning("Payment gateway circuit opened after %d consecutive failures", self.failures)
+                self.opened_at = self.clock()
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+class GatewayMetrics:
+    """In-process counters per operation: calls, errors, retries, short-circuits and latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def _op(self, operation):
+        return self._ops.setdefault(operation, {
+            'calls': 0, 'errors': 0, 'retries': 0, 'short_circuited': 0,
+            'total_ms': 0.0, 'max_ms': 0.0,
+        })
+
+    def record(self, operation, elapsed, error=False):
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            op = self._op(operation)
+            op['calls'] += 1
+            op['errors'] += int(error)
+            op['total_ms'] += elapsed_ms
+            op['max_ms'] = max(op['max_ms'], elapsed_ms)
+
+    def incr(self, operation, counter):
+        with self._lock:
+            self._op(operation)[counter] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: dict(op, avg_ms=op['total_ms'] / op['calls'] if op['calls'] else 0.0)
+                for name, op in self._ops.items()
+            }
+
+
+class GatewayClient:
+    def __init__(self, api_key, config=None):
+        self.config = {**DEFAULTS, **(config or {})}
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.config['POOL_SIZE'])
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        base_addresses = {'api': self.config['API_BASE']} if self.config['API_BASE'] else None
+        # Retries are handled here (so they count against the breaker), not by the SDK
+        self.stripe = stripe.StripeClient(
+            api_key,
+            http_client=stripe.RequestsClient(timeout=self.config['TIMEOUT'], session=session),
+            base_addresses=base_addresses,
+            max_network_retries=0,
+        )
+        self.breaker = CircuitBreaker(self.config['BREAKER_THRESHOLD'], self.config['BREAKER_RESET_TIMEOUT'])
+        self.metrics = GatewayMetrics()
+
+    def status(self):
+        """Connection pool settings, breaker state and per-operation counters, for the admin status page."""
+        return {
+            'pool_size': self.config['POOL_SIZE'],
+            'max_retries': self.config['MAX_RETRIES'],
+            'breaker': self.breaker.snapshot(),
+            'operations': self.metrics.snapshot(),
+        }
+
+    def _backoff(self, attempt):
+        # "Full jitter": sleep a random amount up to the capped exponential delay
+        cap = min(self.config['BACKOFF_MAX'], self.config['BACKOFF_BASE'] * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def call(self, operation, func, *args, mutating=False, options=None, **kwargs):
+        """
+        Run one SDK call with the breaker, retries and metrics around it.
+        Mutating calls get an idempotency key that is reused on every attempt,
+        so a retry after a timeout can't create a second charge/intent.
+        """
+        options = dict(options or {})
+        if mutating:
+            options.setdefault('idempotency_key', uuid.uuid4().hex)
+        if options:
+            kwargs['options'] = options
+
+        for attempt in range(self.config['MAX_RETRIES'] + 1):
+            if not self.breaker.allow():
+                self.metrics.incr(operation, 'short_circuited')
+                raise CircuitOpenError("Payment provider is unavailable right now, please try again shortly.")
+
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except stripe.StripeError as e:
+                elapsed = time.monotonic() - started
+                # 4xx card/validation errors are the caller's problem, not the provider's health
+                provider_fault = isinstance(e, RETRYABLE_ERRORS) or (e.http_status or 0) >= 500
+                self.metrics.record(operation, elapsed, error=True)
+                if not provider_fault:
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.config['MAX_RETRIES']:
+                    logger.warning("%s failed after %d attempts: %s", operation, attempt + 1, e)
+                    raise
+                self.metrics.incr(operation, 'retries')
+                time.sleep(self._backoff(attempt))
+            else:
+                self.metrics.record(operation, time.monotonic() - started)
+                self.breaker.record_success()
+                return result
+
+    # Thin wrappers for the calls the project makes
+
+    def create_payment_intent(self, idempotency_key=None, **params):
+        return self.call('payment_intent.create', self.stripe.v1.payment_intents.create, params,
+                         mutating=True, options={'idempotency_key': idempotency_key} if idempotency_key else None)
+
+    def retrieve_payment_intent(self, intent_id):
+        return self.call('payment_intent.retrieve', self.stripe.v1.payment_intents.retrieve, intent_id)
+
+    def create_refund(self, **params):
+        return self.call('refund.create', self.stripe.v1.refunds.create, params, mutating=True)
+
+    def create_checkout_session(self, **params):
+        return self.call('checkout_session.create', self.stripe.v1.checkout.sessions.create, params, mutating=True)
+
+    def construct_event(self, payload, signature, secret):
+        # Pure signature check, no network call
+        return self.stripe.construct_event(payload, signature, secret)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gateway_client():
+    """Process-wide client, so the connection pool and breaker are shared by all requests."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GatewayClient(
+                    settings.STRIPE_SECRET_KEY, getattr(settings, 'PAYMENT_GATEWAY_CLIENT', None)
+                )
+    return _client
@@ -72,7 +72,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'Pharmarcy_Prescription_Tracker.middleware.NoCacheMiddleware',
-    'Pharmarcy_Prescription_Tracker.middleware.RoleBasedAccessMiddleware'
+    'Pharmarcy_Prescription_Tracker.middleware.RoleBasedAccessMiddleware',
+    'Pharmarcy_Prescription_Tracker.middleware.GuestCartMiddleware',
 ]
 
 ROOT_URLCONF = 'Pharmarcy_Prescription_Tracker.urls'
@@ -88,7 +89,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'django.template.context_processors.csrf'
+                'django.template.context_processors.csrf',
+                'onlineStore.context_processors.cart_item_count',
             ]
         }
     }
@@ -162,8 +164,37 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Threads that build product thumbnails/WebP copies after an upload (0 = build inline)
+IMAGE_DERIVATIVE_WORKERS = 2
+
 STRIPE_PUBLISHABLE_KEY = 'pk_test_51RuS6kLxYGksYlO5cOHxyasQv42vYzERNmGu7gGnrd4T5uhHNtYZxDiLQIqYRAen1aMX0mp34VzuAmFPzv5mYgmq00kovaF8kT'
 STRIPE_SECRET_KEY = 'sk_test_51RuS6kLxYGksYlO5mMYeMxHMNY1d0C9gwaxTURULb7K6xtfYe49N1fakp7h2gQLOMMyUxkKytEzOGCfUKAQ2d9mY003oUw3FVb'
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+
+# Orders are confirmed by the payment webhook once STRIPE_WEBHOOK_SECRET is set; without it
+# no webhook can be verified, so the success page asks the gateway instead (local dev
+# without webhook forwarding). Switch the backend to onlineStore.gateway.FakeGateway to run
+# checkout fully offline.
+PAYMENT_GATEWAY_BACKEND = os.environ.get('PAYMENT_GATEWAY_BACKEND', 'onlineStore.gateway.StripeGateway')
+PAYMENT_CONFIRM_VIA_WEBHOOK = bool(STRIPE_WEBHOOK_SECRET)
+
+# Shared payment client (Pharmarcy_Prescription_Tracker/payment_client.py). Unset keys use
+# its defaults; set API_BASE to a local mock server such as stripe-mock for load tests.
+PAYMENT_GATEWAY_CLIENT = {
+    'TIMEOUT': (3.05, 10),
+    'MAX_RETRIES': 2,
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_RESET_TIMEOUT': 30,
+    'API_BASE': os.environ.get('PAYMENT_GATEWAY_API_BASE'),
+}
+
+# Minutes a pending online order holds its stock before the sweeper releases it
+STOCK_RESERVATION_TTL_MINUTES = 15
+# Seconds a product's cached stock availability may be served before it is re-read
+STOCK_AVAILABILITY_CACHE_TTL = 5
+
+# Memory-mapped recommender artifacts (see prescriptions/recommender.py)
+RECOMMENDER_ARTIFACT_DIR = os.path.join(BASE_DIR, 'prescriptions', 'data', 'recommender')
 
 
 # Email Backend Configuration
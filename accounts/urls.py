@@ -18,6 +18,7 @@ urlpatterns = [
     path("dashboard/customer/", views.customer_dashboard, name="customer_dashboard"),
     path("dashboard/customer/edit-profile/", views.edit_customer_profile, name="edit_customer_profile"),
     path("dashboard/admin/", views.admin_dashboard, name="admin_dashboard"),
+    path("dashboard/admin/payment-gateway/", views.payment_gateway_status, name="payment_gateway_status"),
     path('accounts/inactive-account/', views.inactive_account, name='inactive_account'),
     
     #Pharmacist
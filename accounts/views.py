@@ -8,7 +8,7 @@ from django.views.decorators.cache import never_cache
 from django.core.exceptions import PermissionDenied
 from django.conf import settings
 from django.urls import reverse_lazy
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.template.loader import render_to_string
 
 # Python standard library imports
@@ -28,6 +28,7 @@ from .forms import (
     CustomAuthenticationForm
 )
 from .models import User, Customer
+from Pharmarcy_Prescription_Tracker.payment_client import get_gateway_client
 
 
 # =============================================================================
@@ -110,6 +111,12 @@ def admin_dashboard(request):
     }
     return render(request, "accounts/admin_dashboard.html", context)
 
+# Payment gateway health (this process's connection pool, circuit breaker and call counters)
+@never_cache
+@admin_required
+def payment_gateway_status(request):
+    return JsonResponse(get_gateway_client().status())
+
 # Create new staff member (pharmacist or cashier)
 @admin_required
 def create_staff(request):
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Product, Order, OrderItem
+from .models import Product, Order, OrderItem, StockReservation, PaymentEvent
 
 # compute field names at module level so class-body comprehensions can access them
 ORDER_FIELD_NAMES = {f.name for f in Order._meta.get_fields()}
@@ -29,6 +29,19 @@ class ProductAdmin(admin.ModelAdmin):
     def stock(self, obj):
         return obj.stock
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('order', 'product', 'quantity', 'created_at', 'expires_at')
+    list_select_related = ('order', 'product')
+    raw_id_fields = ('order', 'product')
+    ordering = ('expires_at',)
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'received_at')
+    list_filter = ('event_type',)
+    search_fields = ('event_id',)
+
 # --- Orders admin below ---
 
 class OrderItemInline(admin.TabularInline):
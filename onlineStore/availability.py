@@ -0,0 +1,103 @@
+"""
+Batched stock availability for carts, product cards and the storefront API.
+
+get_availability() answers for many products at once: cached entries come
+from one cache.get_many(), and the misses are read with one query per
+AVAILABILITY_QUERY_BATCH ids. Each query takes on-hand stock from the
+inventory row and subtracts active reservations.
+
+Entries live for a few seconds and are dropped as soon as the stock moves in
+this process (reservations, payments, inventory saves, bulk writes with known
+ids). A queryset-wide update() of a stock column reports no ids, so its
+entries are not dropped; whoever runs one should call invalidate_availability()
+for the products it touched, as checkout does. The short TTL covers those and
+writes made elsewhere.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .catalog import invalidate_featured_products
+from .models import Product, product_reserved_expression, product_stock_expression
+from .product_sync import SOURCE_FIELDS
+
+DEFAULT_AVAILABILITY_CACHE_TTL = 5  # seconds
+AVAILABILITY_MAX_IDS = 500  # per /api/stock request
+AVAILABILITY_QUERY_BATCH = 500  # ids per IN (...) lookup; keeps under SQLite's parameter limit
+CACHE_PREFIX = 'stock:'
+
+
+def _key(product_id):
+    return f"{CACHE_PREFIX}{product_id}"
+
+
+def _ttl():
+    return getattr(settings, 'STOCK_AVAILABILITY_CACHE_TTL', DEFAULT_AVAILABILITY_CACHE_TTL)
+
+
+def load_availability(product_ids):
+    """Read availability straight from the database, one query per AVAILABILITY_QUERY_BATCH ids."""
+    product_ids = sorted(product_ids)
+    levels = {}
+    for start in range(0, len(product_ids), AVAILABILITY_QUERY_BATCH):
+        rows = Product.objects.filter(pk__in=product_ids[start:start + AVAILABILITY_QUERY_BATCH]).annotate(
+            on_hand=product_stock_expression(),
+            reserved=product_reserved_expression(),
+        ).values_list('pk', 'on_hand', 'reserved', 'available_online')
+        levels.update({
+            pk: {
+                'on_hand': on_hand,
+                'reserved': reserved,
+                # Hidden products can't be bought, whatever is on the shelf
+                'available': max(on_hand - reserved, 0) if online else 0,
+            }
+            for pk, on_hand, reserved, online in rows
+        })
+    return levels
+
+
+def get_availability(product_ids):
+    """
+    {product_id: {'on_hand', 'reserved', 'available'}}. Unknown ids are left out.
+    """
+    product_ids = {int(pk) for pk in product_ids}
+    if not product_ids:
+        return {}
+
+    cached = cache.get_many([_key(pk) for pk in product_ids])
+    result = {pk: cached[_key(pk)] for pk in product_ids if _key(pk) in cached}
+    missing = product_ids - result.keys()
+    if missing:
+        loaded = load_availability(missing)
+        cache.set_many({_key(pk): levels for pk, levels in loaded.items()}, _ttl())
+        result.update(loaded)
+    return result
+
+
+def attach_availability(products):
+    """
+    Batch-load availability onto Product instances for templates (product.stock
+    then shows what can actually be bought). Returns the products as a list.
+    """
+    products = list(products)
+    levels = get_availability(product.pk for product in products)
+    for product in products:
+        product._availability = levels.get(product.pk, {'on_hand': 0, 'reserved': 0, 'available': 0})
+    return products
+
+
+def invalidate_availability(product_ids):
+    """Forget cached availability (and a stale featured snapshot) once the current transaction commits."""
+    product_ids = set(product_ids)
+    if product_ids:
+        keys = [_key(pk) for pk in product_ids]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+        invalidate_featured_products(product_ids)  # an item may have sold out or come back
+
+
+def invalidate_inventory_availability(model, inventory_ids):
+    """Same, for the Products behind Medicine/NonMedicalProduct rows."""
+    field = SOURCE_FIELDS[model][0]
+    invalidate_availability(
+        Product.objects.filter(**{f'{field}_id__in': inventory_ids}).values_list('pk', flat=True)
+    )
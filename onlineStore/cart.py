@@ -0,0 +1,237 @@
+import json
+from decimal import Decimal
+
+from django.core import signing
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Sum, F, OuterRef, Subquery
+
+from .models import Cart, CartItem, Product, product_price_expression, product_available_expression
+
+GUEST_CART_COOKIE = 'guest_cart'
+GUEST_CART_SALT = 'onlineStore.guest_cart'
+GUEST_CART_MAX_AGE = 60 * 60 * 24 * 14  # two weeks
+GUEST_CART_MAX_LINES = 50  # keeps the signed cookie well under the 4KB browser limit
+
+
+def get_cart_summary(user):
+    """
+    Return (cart_items, cart_total) for a customer's cart.
+    Items carry unit_price, line_total and available_stock annotations, and the
+    total is summed from them, so the whole cart costs a single query.
+    """
+    cart_items = list(CartItem.objects.filter(cart__customer_user=user).with_pricing())
+    cart_total = sum((item.line_total for item in cart_items), Decimal('0.00'))
+    return cart_items, cart_total
+
+
+def get_cart_item_count(user):
+    """Total number of units in a customer's cart (used by the navbar badge)."""
+    count = CartItem.objects.filter(cart__customer_user=user).aggregate(count=Sum('quantity'))['count']
+    return count or 0
+
+
+def get_cart(user):
+    """
+    Return the customer's cart, creating it on first use. The unique constraint on
+    customer_user makes this race-safe: a concurrent create loses with an
+    IntegrityError and get_or_create re-reads the winner's cart.
+    """
+    cart, _ = Cart.objects.get_or_create(customer_user=user)
+    return cart
+
+
+def _stock_queryset(product_id):
+    # Available = on hand minus units reserved by pending orders
+    return Product.objects.filter(pk=product_id).annotate(
+        on_hand=product_available_expression()
+    ).values('on_hand')
+
+
+def add_item(cart, product_id, quantity):
+    """
+    Atomically add `quantity` units of a product to a cart.
+
+    The insert-or-increment and the stock check happen in the same statement, so
+    concurrent clicks cannot lose quantity or push the line past available stock.
+    Returns the new line quantity, or None if there isn't enough stock.
+    """
+    features = connection.features
+    if features.supports_update_conflicts_with_target and features.can_return_columns_from_insert:
+        return _add_item_upsert(cart.pk, product_id, quantity)
+    return _add_item_fallback(cart, product_id, quantity)
+
+
+def _add_item_upsert(cart_id, product_id, quantity):
+    # INSERT ... ON CONFLICT DO UPDATE (SQLite >= 3.35, PostgreSQL)
+    qn = connection.ops.quote_name
+    table = qn(CartItem._meta.db_table)
+    stock_sql, stock_params = _stock_queryset(product_id).query.sql_with_params()
+    sql = (
+        f"INSERT INTO {table} ({qn('cart_id')}, {qn('product_id')}, {qn('quantity')}) "
+        f"SELECT %s, %s, %s WHERE %s <= ({stock_sql}) "
+        f"ON CONFLICT ({qn('cart_id')}, {qn('product_id')}) DO UPDATE "
+        f"SET {qn('quantity')} = {table}.{qn('quantity')} + excluded.{qn('quantity')} "
+        f"WHERE {table}.{qn('quantity')} + excluded.{qn('quantity')} <= ({stock_sql}) "
+        f"RETURNING {qn('quantity')}"
+    )
+    params = [cart_id, product_id, quantity, quantity, *stock_params, *stock_params]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _add_item_fallback(cart, product_id, quantity):
+    # F()-based increment guarded by the stock subquery, then insert if the line is new
+    stock = Subquery(_stock_queryset(OuterRef('product_id'))[:1])
+    with transaction.atomic():
+        updated = CartItem.objects.filter(
+            cart=cart, product_id=product_id, quantity__lte=stock - quantity
+        ).update(quantity=F('quantity') + quantity)
+        if updated:
+            return CartItem.objects.values_list('quantity', flat=True).get(cart=cart, product_id=product_id)
+        if CartItem.objects.filter(cart=cart, product_id=product_id).exists():
+            return None
+        on_hand = _stock_queryset(product_id).first()
+        if on_hand is None or on_hand['on_hand'] < quantity:
+            return None
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+        except IntegrityError:
+            # Lost the race to a concurrent insert; retry as an increment
+            return _add_item_fallback(cart, product_id, quantity)
+    return quantity
+
+
+# --- Guest cart ---
+# Anonymous visitors keep their cart in a signed cookie ({product_id: quantity}),
+# so browsing and adding items never touches the database. The cart is merged
+# into the customer's DB cart when they log in.
+
+class GuestCart:
+    def __init__(self, lines=None):
+        self.lines = {}
+        for product_id, quantity in (lines or {}).items():
+            if int(quantity) > 0:
+                self.lines[int(product_id)] = int(quantity)
+        self.modified = False
+
+    @classmethod
+    def from_request(cls, request):
+        try:
+            raw = request.get_signed_cookie(GUEST_CART_COOKIE, salt=GUEST_CART_SALT, max_age=GUEST_CART_MAX_AGE)
+            return cls(json.loads(raw))
+        except (KeyError, signing.BadSignature, ValueError, TypeError, AttributeError):
+            return cls()
+
+    @property
+    def item_count(self):
+        return sum(self.lines.values())
+
+    def add(self, product_id, quantity, available_stock):
+        """Add units, returning the new line quantity or None if stock/size limits are hit."""
+        new_quantity = self.lines.get(product_id, 0) + quantity
+        if new_quantity > available_stock:
+            return None
+        if product_id not in self.lines and len(self.lines) >= GUEST_CART_MAX_LINES:
+            return None
+        self.lines[product_id] = new_quantity
+        self.modified = True
+        return new_quantity
+
+    def set(self, product_id, quantity):
+        if quantity > 0:
+            self.lines[product_id] = quantity
+        else:
+            self.lines.pop(product_id, None)
+        self.modified = True
+
+    def remove(self, product_id):
+        self.set(product_id, 0)
+
+    def clear(self):
+        self.lines = {}
+        self.modified = True
+
+    def save(self, response):
+        if not self.modified:
+            return
+        if self.lines:
+            response.set_signed_cookie(
+                GUEST_CART_COOKIE, json.dumps(self.lines), salt=GUEST_CART_SALT,
+                max_age=GUEST_CART_MAX_AGE, httponly=True, samesite='Lax',
+            )
+        else:
+            response.delete_cookie(GUEST_CART_COOKIE, samesite='Lax')
+
+
+class GuestCartItem:
+    """Mirrors the attributes templates read from a priced CartItem."""
+
+    def __init__(self, product, quantity):
+        self.id = product.pk  # guest lines are addressed by product id
+        self.product = product
+        self.quantity = quantity
+        self.unit_price = product.unit_price
+        self.available_stock = product.available_stock
+        self.line_total = product.unit_price * quantity
+        self.total_price = self.line_total
+
+
+def priced_products(product_ids):
+    """Online products annotated with unit_price and available_stock, in one query."""
+    return Product.objects.filter(pk__in=product_ids, available_online=True).select_related(
+        'medicine', 'non_medical_product'
+    ).annotate(
+        unit_price=product_price_expression(),
+        available_stock=product_available_expression(),
+    )
+
+
+def get_guest_cart_summary(guest_cart):
+    """Guest equivalent of get_cart_summary(): one query for all lines."""
+    products = {product.pk: product for product in priced_products(guest_cart.lines)}
+    cart_items = [
+        GuestCartItem(products[product_id], quantity)
+        for product_id, quantity in guest_cart.lines.items()
+        if product_id in products
+    ]
+    cart_total = sum((item.line_total for item in cart_items), Decimal('0.00'))
+    return cart_items, cart_total
+
+
+def add_lines_capped(cart, quantities):
+    """
+    Add {product_id: units} to a DB cart with a single bulk upsert. Units are
+    added to any existing line and the result is capped at available stock
+    (lines with nothing available are skipped). Returns the number of lines written.
+    """
+    with transaction.atomic():
+        existing = dict(
+            CartItem.objects.filter(cart=cart, product_id__in=quantities)
+            .values_list('product_id', 'quantity')
+        )
+        stock = dict(priced_products(quantities).values_list('pk', 'available_stock'))
+        items = []
+        for product_id, quantity in quantities.items():
+            merged = min(existing.get(product_id, 0) + quantity, stock.get(product_id, 0))
+            if merged > 0:
+                items.append(CartItem(cart=cart, product_id=product_id, quantity=merged))
+        CartItem.objects.bulk_create(
+            items, update_conflicts=True,
+            unique_fields=['cart', 'product'], update_fields=['quantity'],
+        )
+    return len(items)
+
+
+def merge_guest_cart(user, guest_cart):
+    """
+    Fold a guest cart into the customer's DB cart (see add_lines_capped).
+    Returns the number of lines written.
+    """
+    if not guest_cart.lines:
+        return 0
+    written = add_lines_capped(get_cart(user), guest_cart.lines)
+    guest_cart.clear()
+    return written
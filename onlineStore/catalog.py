@@ -0,0 +1,222 @@
+"""
+Read path for the JSON catalog API used by the React storefront.
+
+Rows are read with .values() (no model instances) and serialized to small
+dicts. Every response carries an ETag/Last-Modified taken from the single
+CatalogVersion row, which the signal receivers bump whenever something the
+catalog shows changes, so a client polling with If-None-Match gets a 304 after
+one primary-key lookup. Stock is left out of the catalog payload on purpose:
+it changes with every sale and has its own endpoint.
+
+The homepage's featured products are a cached snapshot built from the same
+rows. It is dropped whenever the catalog version moves or a featured product's
+stock does, and rebuilt by the next homepage hit.
+"""
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import CharField, Count, F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from Medicine_inventory.models import Medicine
+from Non_Medicine_inventory.models import NonMedicalProduct
+from .images import derivative_url, srcset
+from .models import CatalogVersion, Product, product_price_expression, product_stock_expression
+
+CATALOG_PAGE_SIZE = 24
+CATALOG_MAX_PAGE_SIZE = 100
+
+FEATURED_CACHE_KEY = 'catalog:featured'
+FEATURED_LIMIT = 6
+# Invalidation is per process (see invalidate_featured_products); this bounds how stale other workers get
+FEATURED_SNAPSHOT_TTL = 300
+
+# Inventory columns the catalog serves; saves that change none of them keep the ETag
+CATALOG_SOURCE_FIELDS = {
+    Medicine: ('name', 'brand', 'category', 'medicine_type', 'description', 'dosage',
+               'selling_price', 'image', 'image_digest', 'available_online'),
+    NonMedicalProduct: ('name', 'brand', 'category', 'description',
+                        'selling_price', 'image', 'image_digest', 'available_online'),
+}
+
+
+def catalog_fields_changed(model, fields):
+    """Whether a write to `fields` of an inventory model can change the catalog."""
+    return fields is None or bool(set(CATALOG_SOURCE_FIELDS[model]).intersection(fields))
+
+
+def bump_catalog_version():
+    now = timezone.now()
+    if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, changed_at=now):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'changed_at': now})
+    invalidate_featured_products()
+
+
+def get_catalog_version(request=None):
+    """(version, changed_at), read once per request."""
+    cached = getattr(request, '_catalog_version', None)
+    if cached:
+        return cached
+    row = CatalogVersion.objects.filter(pk=1).values_list('version', 'changed_at').first()
+    if row is None:
+        obj, _ = CatalogVersion.objects.get_or_create(pk=1, defaults={'changed_at': timezone.now()})
+        row = (obj.version, obj.changed_at)
+    if request is not None:
+        request._catalog_version = row
+    return row
+
+
+# Signatures match django.views.decorators.http.condition
+def catalog_etag(request, *args, **kwargs):
+    return f"catalog-{get_catalog_version(request)[0]}"
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return get_catalog_version(request)[1]
+
+
+def _coalesce(field, output_field=None):
+    return Coalesce(f'medicine__{field}', f'non_medical_product__{field}', output_field=output_field)
+
+
+def catalog_rows():
+    """Online products, annotated with the inventory columns the API serves."""
+    return Product.objects.filter(available_online=True).filter(
+        Q(medicine__available_online=True) | Q(non_medical_product__available_online=True)
+    ).annotate(
+        item_name=_coalesce('name'),
+        item_brand=_coalesce('brand'),
+        item_category=_coalesce('category'),
+        item_image=_coalesce('image', CharField()),
+        item_digest=_coalesce('image_digest'),
+        item_price=product_price_expression(),
+    ).order_by('pk')
+
+
+LIST_VALUES = ('pk', 'product_type', 'featured', 'item_name', 'item_brand', 'item_category',
+               'item_image', 'item_digest', 'item_price')
+
+
+def filter_catalog(rows, product_type='', category='', search='', featured=False):
+    """Same filters as the HTML product pages."""
+    if product_type:
+        rows = rows.filter(product_type=product_type)
+    if category:
+        rows = rows.filter(item_category=category)
+    if search:
+        rows = rows.filter(
+            Q(medicine__name__icontains=search) | Q(medicine__brand__icontains=search) |
+            Q(non_medical_product__name__icontains=search) | Q(non_medical_product__brand__icontains=search)
+        )
+    if featured:
+        rows = rows.filter(featured=True)
+    return rows
+
+
+def serialize_product(row):
+    image, digest = row['item_image'] or '', row['item_digest'] or ''
+    image_url = default_storage.url(image) if image else ''
+    return {
+        'id': row['pk'],
+        'type': row['product_type'],
+        'name': row['item_name'],
+        'brand': row['item_brand'],
+        'category': row['item_category'],
+        'price': format(row['item_price'], '.2f'),  # SQLite drops trailing zeros from the CASE
+        'featured': row['featured'],
+        'image': image_url,
+        'thumbnail': derivative_url(digest, 320, 'jpg') if image and digest else image_url,
+        'srcset': srcset(digest, 'webp') if image and digest else '',
+    }
+
+
+def get_catalog_product(pk):
+    """One product with its detail-only fields, or None if it isn't on sale online."""
+    row = catalog_rows().filter(pk=pk).annotate(
+        item_description=_coalesce('description'),
+        item_dosage=F('medicine__dosage'),
+        item_medicine_type=F('medicine__medicine_type'),
+    ).values(*LIST_VALUES, 'item_description', 'item_dosage', 'item_medicine_type').first()
+    if row is None:
+        return None
+    data = serialize_product(row)
+    data['description'] = row['item_description'] or ''
+    if row['product_type'] == 'Medicine':
+        data['dosage'] = row['item_dosage']
+        data['medicine_type'] = row['item_medicine_type']
+    return data
+
+
+def catalog_categories():
+    """Category choices per product type, with how many online products each has (one query)."""
+    counts = {
+        (row['product_type'], row['item_category']): row['n']
+        for row in catalog_rows().order_by().values('product_type', 'item_category').annotate(n=Count('pk'))
+    }
+    return {
+        product_type: [
+            {'value': value, 'label': label, 'count': counts.get((product_type, value), 0)}
+            for value, label in choices
+        ]
+        for product_type, choices in (
+            ('Medicine', Medicine.CATEGORY_CHOICES),
+            ('NonMedicalProduct', NonMedicalProduct.CATEGORY_CHOICES),
+        )
+    }
+
+
+
+def build_featured_snapshot(limit=FEATURED_LIMIT):
+    """
+    The homepage's featured products, already in the shape the template reads.
+    Out-of-stock items are skipped. `candidate_ids` holds every featured online
+    product, in stock or not, so stock changes know whether they matter.
+    """
+    rows = list(
+        filter_catalog(catalog_rows(), featured=True)
+        .annotate(on_hand=product_stock_expression())
+        .values(*LIST_VALUES, 'on_hand')
+    )
+    products = []
+    for row in rows:
+        if row['on_hand'] <= 0 or len(products) >= limit:
+            continue
+        image, digest = row['item_image'] or '', row['item_digest'] or ''
+        image_url = default_storage.url(image) if image else ''
+        products.append({
+            'pk': row['pk'],
+            'name': row['item_name'],
+            'brand': row['item_brand'],
+            'price': row['item_price'],
+            'thumbnail_url': derivative_url(digest, 320, 'jpg') if image and digest else image_url,
+            'image_srcset': srcset(digest, 'jpg') if image and digest else '',
+            'image_webp_srcset': srcset(digest, 'webp') if image and digest else '',
+        })
+    return {'candidate_ids': frozenset(row['pk'] for row in rows), 'products': products}
+
+
+def get_featured_products():
+    """Featured products for the homepage: one cache read, rebuilt on the first hit after a change."""
+    snapshot = cache.get(FEATURED_CACHE_KEY)
+    if snapshot is None:
+        snapshot = build_featured_snapshot()
+        cache.set(FEATURED_CACHE_KEY, snapshot, FEATURED_SNAPSHOT_TTL)
+    return snapshot['products']
+
+
+def invalidate_featured_products(product_ids=None):
+    """
+    Drop the snapshot after the current transaction commits. With `product_ids`
+    (a stock movement) it is only dropped if one of them is a featured product.
+    """
+    product_ids = None if product_ids is None else set(product_ids)
+
+    def forget():
+        if product_ids is not None:
+            snapshot = cache.get(FEATURED_CACHE_KEY)
+            if snapshot is None or snapshot['candidate_ids'].isdisjoint(product_ids):
+                return
+        cache.delete(FEATURED_CACHE_KEY)
+
+    transaction.on_commit(forget)
@@ -0,0 +1,179 @@
+import logging
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from Medicine_inventory.models import Medicine
+from Non_Medicine_inventory.models import NonMedicalProduct
+from .availability import invalidate_availability
+from .cart import add_lines_capped, get_cart
+from .models import (
+    CartItem, Order, OrderItem, PaymentEvent, Product, StockReservation, product_available_expression,
+)
+from .reservations import (
+    lock_inventory_rows, create_reservations, release_order_reservations, InsufficientStock,
+)
+
+logger = logging.getLogger(__name__)
+
+# Payment states an order can still move out of when the gateway reports back
+UNSETTLED_PAYMENT_STATUSES = ('pending', 'failed')
+# A late success (failed order, or lapsed holds) whose units have gone since: paid, but staff must refund it
+NEEDS_REFUND_STATUS = 'needs_refund'
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def place_order(user, shipping):
+    """
+    Turn the customer's cart into a Pending order in one transaction.
+
+    Runs a fixed number of queries whatever the cart size: read the cart's
+    inventory ids, lock those stock rows in a deterministic order, read priced
+    lines and availability once, insert the order, bulk-insert its items and
+    stock holds, and empty the cart with a single DELETE.
+
+    `shipping` holds the Order.shipping_* values. Raises EmptyCart or
+    InsufficientStock, in which case nothing is written.
+    """
+    cart_lines = CartItem.objects.filter(cart__customer_user=user)
+
+    with transaction.atomic():
+        inventory_ids = list(cart_lines.values_list('product__medicine_id', 'product__non_medical_product_id'))
+        if not inventory_ids:
+            raise EmptyCart("Your cart is empty")
+        lock_inventory_rows([m for m, _ in inventory_ids], [n for _, n in inventory_ids])
+
+        # Prices and availability are computed once, after the locks are held
+        cart_items = list(cart_lines.with_pricing())
+        for item in cart_items:
+            if item.quantity > item.available_stock:
+                raise InsufficientStock(item.product, item.available_stock)
+
+        order = Order.objects.create(
+            customer_user=user,
+            total_amount=sum((item.line_total for item in cart_items), Decimal('0.00')),
+            status='Pending',
+            payment_status='pending',
+            **shipping,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=item.product_id, quantity=item.quantity, price=item.unit_price)
+            for item in cart_items
+        ])
+        create_reservations(order, {item.product_id: item.quantity for item in cart_items})
+        cart_lines.delete()
+
+    return order
+
+
+def restore_cart_from_order(order):
+    """
+    Put an unpaid order's lines back in the customer's cart (e.g. after a cancelled
+    payment). Added to anything re-added since checkout and capped at available stock,
+    so release the order's holds first. Returns the number of lines written.
+    """
+    quantities = {}
+    for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return add_lines_capped(get_cart(order.customer_user), quantities)
+
+
+def confirm_order_payment(order_id):
+    """
+    Mark an order paid and take its units out of stock. Safe to call any number
+    of times (webhook redelivery, success page reload): only the call that flips
+    the order from unsettled to paid touches inventory. Returns True if it did.
+
+    The inventory rows are locked first. If the order still holds all its units
+    (a pending order paid in time) they are simply taken. Otherwise (a 'failed'
+    order released its holds, or a pending order's holds expired) stock is
+    re-checked: if the units have since been sold or held by other orders, the
+    order is marked Payment_Failed / NEEDS_REFUND instead of over-selling, and
+    False is returned.
+    """
+    with transaction.atomic():
+        unsettled = (
+            Order.objects.select_for_update().filter(pk=order_id, payment_status__in=UNSETTLED_PAYMENT_STATUSES)
+            .values_list('pk', flat=True).first()
+        )
+        if unsettled is None:
+            return False
+
+        lines = list(OrderItem.objects.filter(order_id=order_id).values_list(
+            'product__medicine_id', 'product__non_medical_product_id', 'quantity', 'product_id'
+        ))
+        lock_inventory_rows([line[0] for line in lines], [line[1] for line in lines])
+        needed = {}
+        for _, _, quantity, product_id in lines:
+            needed[product_id] = needed.get(product_id, 0) + quantity
+        held = dict(
+            StockReservation.objects.filter(order_id=order_id, expires_at__gt=Now())
+            .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+        )
+        if any(quantity > held.get(product_id, 0) for product_id, quantity in needed.items()):
+            # Whatever is left of our holds must not count against us
+            release_order_reservations(order_id)
+            available = dict(
+                Product.objects.filter(pk__in=needed)
+                .annotate(available=product_available_expression())
+                .values_list('pk', 'available')
+            )
+            if any(quantity > available.get(product_id, 0) for product_id, quantity in needed.items()):
+                Order.objects.filter(pk=order_id).update(status='Payment_Failed', payment_status=NEEDS_REFUND_STATUS)
+                logger.warning("Order #%s was paid after its stock hold lapsed and the stock is gone; refund it", order_id)
+                return False
+
+        Order.objects.filter(pk=order_id).update(status='Paid', payment_status='succeeded', paid_at=timezone.now())
+        for medicine_id, non_medical_id, quantity, _ in lines:
+            if medicine_id:
+                Medicine.objects.filter(pk=medicine_id).update(quantity_in_stock=F('quantity_in_stock') - quantity)
+            elif non_medical_id:
+                NonMedicalProduct.objects.filter(pk=non_medical_id).update(stock=F('stock') - quantity)
+
+        invalidate_availability(line[3] for line in lines)
+        # Stock is now decremented, so the holds are no longer needed
+        release_order_reservations(order_id)
+    return True
+
+
+def fail_order_payment(order_id):
+    """Mark an unsettled order's payment as failed and free its stock holds."""
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order_id, payment_status='pending').update(
+            status='Payment_Failed', payment_status='failed'
+        )
+        if updated:
+            release_order_reservations(order_id)
+    return bool(updated)
+
+
+def handle_payment_event(event):
+    """
+    Apply a parsed gateway webhook event exactly once. The event id is stored in
+    the same transaction as the order update, so a redelivered event is a no-op.
+    Returns False for duplicates.
+    """
+    intent = event.get('data', {}).get('object', {})
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                PaymentEvent.objects.create(event_id=event['id'], event_type=event.get('type', ''))
+        except IntegrityError:
+            return False
+
+        order_id = (
+            Order.objects.filter(stripe_payment_intent_id=intent.get('id'))
+            .values_list('order_id', flat=True).first()
+        )
+        if order_id is not None:
+            if event.get('type') == 'payment_intent.succeeded':
+                confirm_order_payment(order_id)
+            elif event.get('type') == 'payment_intent.payment_failed':
+                fail_order_payment(order_id)
+    return True
@@ -0,0 +1,15 @@
+from .cart import get_cart_item_count
+
+
+def cart_item_count(request):
+    """Expose the mini-cart badge count to every template."""
+    user = getattr(request, 'user', None)
+    if user is None:
+        return {'cart_item_count': 0}
+    if not user.is_authenticated:
+        # Guest carts live in a signed cookie, so no query is needed
+        guest_cart = getattr(request, 'guest_cart', None)
+        return {'cart_item_count': guest_cart.item_count if guest_cart else 0}
+    if getattr(user, 'role', None) != 'customer':
+        return {'cart_item_count': 0}
+    return {'cart_item_count': get_cart_item_count(user)}
@@ -0,0 +1,142 @@
+import hashlib
+import hmac
+import json
+import uuid
+
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from Pharmarcy_Prescription_Tracker.payment_client import get_gateway_client
+from .models import FakePaymentIntent
+
+# Which backend get_gateway() returns; point it at FakeGateway to run checkout offline
+DEFAULT_GATEWAY_BACKEND = 'onlineStore.gateway.StripeGateway'
+
+
+class InvalidWebhook(Exception):
+    """The webhook body could not be parsed or its signature did not match."""
+
+
+class PaymentIntent:
+    """The few intent fields the store cares about, whatever the backend."""
+
+    def __init__(self, id, client_secret, status, amount, metadata=None):
+        self.id = id
+        self.client_secret = client_secret
+        self.status = status
+        self.amount = amount
+        self.metadata = metadata or {}
+
+
+class StripeGateway:
+    name = 'stripe'
+
+    def __init__(self):
+        # Pooled session, timeouts, retries and the circuit breaker live in the shared client
+        self.client = get_gateway_client()
+        self.webhook_secret = getattr(settings, 'STRIPE_WEBHOOK_SECRET', '')
+
+    @staticmethod
+    def _intent(obj):
+        return PaymentIntent(obj.id, obj.client_secret, obj.status, obj.amount, dict(obj.metadata or {}))
+
+    def create_intent(self, amount, currency, metadata, idempotency_key=None):
+        # The idempotency key makes a retried create return the same intent
+        intent = self.client.create_payment_intent(
+            amount=amount, currency=currency, metadata=metadata, idempotency_key=idempotency_key,
+        )
+        return self._intent(intent)
+
+    def retrieve_intent(self, intent_id):
+        return self._intent(self.client.retrieve_payment_intent(intent_id))
+
+    def refund(self, intent_id):
+        return self.client.create_refund(payment_intent=intent_id)
+
+    def parse_webhook(self, payload, signature):
+        try:
+            event = self.client.construct_event(payload, signature, self.webhook_secret)
+        except (ValueError, stripe.SignatureVerificationError) as e:
+            raise InvalidWebhook(str(e))
+        return event.to_dict()
+
+
+class FakeGateway:
+    """
+    Local stand-in for Stripe. Intents are rows in the database (FakePaymentIntent),
+    so any worker can complete an intent another one created, and webhooks are
+    signed with an HMAC of the body, so the whole checkout -> webhook -> confirmation
+    flow can be exercised (or load-tested) without network access.
+    """
+    name = 'fake'
+
+    def __init__(self):
+        self.webhook_secret = getattr(settings, 'FAKE_GATEWAY_WEBHOOK_SECRET', 'fake-webhook-secret')
+
+    @staticmethod
+    def _intent(row):
+        return PaymentIntent(row.intent_id, row.client_secret, row.status, row.amount, row.metadata)
+
+    def _set_status(self, intent_id, status):
+        if not FakePaymentIntent.objects.filter(pk=intent_id).update(status=status):
+            raise LookupError(f"No such payment intent: {intent_id}")
+        return self.retrieve_intent(intent_id)
+
+    def create_intent(self, amount, currency, metadata, idempotency_key=None):
+        intent_id = f"pi_fake_{uuid.uuid4().hex[:24]}"
+        values = {'intent_id': intent_id, 'client_secret': f"{intent_id}_secret",
+                  'status': 'requires_payment_method', 'amount': amount, 'metadata': metadata or {}}
+        if idempotency_key:
+            # get_or_create retries the read if a concurrent create with the same key wins
+            row, _ = FakePaymentIntent.objects.get_or_create(idempotency_key=idempotency_key, defaults=values)
+        else:
+            row = FakePaymentIntent.objects.create(**values)
+        return self._intent(row)
+
+    def retrieve_intent(self, intent_id):
+        row = FakePaymentIntent.objects.filter(pk=intent_id).first()
+        if row is None:
+            raise LookupError(f"No such payment intent: {intent_id}")
+        return self._intent(row)
+
+    def refund(self, intent_id):
+        return self._set_status(intent_id, 'refunded')
+
+    def sign(self, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        return hmac.new(self.webhook_secret.encode(), payload, hashlib.sha256).hexdigest()
+
+    def parse_webhook(self, payload, signature):
+        if not hmac.compare_digest(self.sign(payload), signature or ''):
+            raise InvalidWebhook("Bad signature")
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            raise InvalidWebhook(str(e))
+
+    def complete_intent(self, intent_id, succeeded=True):
+        """
+        Simulate the customer finishing (or failing) payment. Returns the signed
+        webhook (payload, signature) the real gateway would have sent.
+        """
+        intent = self._set_status(intent_id, 'succeeded' if succeeded else 'requires_payment_method')
+        payload = json.dumps({
+            'id': f"evt_fake_{uuid.uuid4().hex[:24]}",
+            'type': 'payment_intent.succeeded' if succeeded else 'payment_intent.payment_failed',
+            'data': {'object': {'id': intent.id, 'status': intent.status, 'metadata': intent.metadata}},
+        })
+        return payload, self.sign(payload)
+
+
+_gateway = None
+
+
+def get_gateway():
+    """Return the configured gateway backend (built once per process)."""
+    global _gateway
+    path = getattr(settings, 'PAYMENT_GATEWAY_BACKEND', DEFAULT_GATEWAY_BACKEND)
+    if _gateway is None or _gateway.__class__.__module__ + '.' + _gateway.__class__.__name__ != path:
+        _gateway = import_string(path)()
+    return _gateway
@@ -0,0 +1,148 @@
+"""
+Resized JPEG thumbnails and WebP copies of product images.
+
+Derivatives are named after a hash of the source file's content
+(media/derivatives/ab/<digest>-320.webp), so identical uploads share files,
+re-processing is a no-op and the URLs can be cached forever. The digest is
+stored on the inventory row (image_digest), which is all Product needs to
+build srcset strings without touching the filesystem.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_ROOT = 'derivatives'
+DERIVATIVE_WIDTHS = (160, 320, 640)
+# extension -> (Pillow format, save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DEFAULT_WORKERS = 2
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def derivative_name(digest, width, ext):
+    return f"{DERIVATIVE_ROOT}/{digest[:2]}/{digest}-{width}.{ext}"
+
+
+def derivative_url(digest, width, ext):
+    return default_storage.url(derivative_name(digest, width, ext))
+
+
+def srcset(digest, ext):
+    """'url 160w, url 320w, ...' for one format."""
+    return ", ".join(f"{derivative_url(digest, width, ext)} {width}w" for width in DERIVATIVE_WIDTHS)
+
+
+def _flatten(image):
+    # JPEG has no alpha channel; put transparent product shots on white rather than black
+    if image.mode != 'RGBA':
+        return image.convert('RGB')
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_derivatives(data):
+    """
+    Build every derivative for one source image. Pure bytes in, bytes out, so it
+    can run in a thread or a separate process. Returns (digest, {name: bytes}).
+    """
+    digest = content_digest(data)
+    with Image.open(io.BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source)  # phone photos carry their rotation in EXIF
+        source = source.convert('RGBA' if source.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        files = {}
+        for width in DERIVATIVE_WIDTHS:
+            resized = source.copy()
+            resized.thumbnail((width, width * 4), Image.LANCZOS)  # never upscales
+            for ext, (fmt, options) in DERIVATIVE_FORMATS.items():
+                image = _flatten(resized) if fmt == 'JPEG' else resized
+                buffer = io.BytesIO()
+                image.save(buffer, fmt, **options)
+                files[derivative_name(digest, width, ext)] = buffer.getvalue()
+    return digest, files
+
+
+def store_derivatives(files):
+    """Write derivatives that don't exist yet (content-hashed names never change)."""
+    written = 0
+    for name, data in files.items():
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(data))
+            written += 1
+    return written
+
+
+def process_image(model_label, pk):
+    """Generate derivatives for one Medicine/NonMedicalProduct row and record its digest."""
+    model = apps.get_model(model_label)
+    row = model.objects.filter(pk=pk).only('image', 'image_digest').first()
+    if row is None or not row.image:
+        return None
+    with row.image.open('rb') as f:
+        data = f.read()
+    digest, files = render_derivatives(data)
+    store_derivatives(files)
+    # Only stamp the digest if the image wasn't replaced while we were working
+    model.objects.filter(pk=pk, image=row.image.name).update(image_digest=digest)
+    return digest
+
+
+def _process_image_safely(model_label, pk):
+    try:
+        return process_image(model_label, pk)
+    except Exception:
+        logger.exception("Could not build image derivatives for %s #%s", model_label, pk)
+
+
+def _process_in_worker(model_label, pk):
+    try:
+        return _process_image_safely(model_label, pk)
+    finally:
+        connections.close_all()  # worker threads get their own DB connections
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', DEFAULT_WORKERS)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-derivatives')
+    return _executor
+
+
+def schedule_derivatives(model, pks):
+    """
+    Queue derivative generation for saved rows once the transaction commits, so
+    uploads (including CSV bulk uploads) return without waiting on Pillow.
+    IMAGE_DERIVATIVE_WORKERS = 0 processes inline instead.
+    """
+    model_label = model._meta.label
+    pks = list(pks)
+
+    def run():
+        inline = getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', DEFAULT_WORKERS) == 0
+        for pk in pks:
+            if inline:
+                _process_image_safely(model_label, pk)
+            else:
+                _get_executor().submit(_process_in_worker, model_label, pk)
+
+    transaction.on_commit(run)
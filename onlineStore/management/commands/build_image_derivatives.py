@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+
+from Medicine_inventory.models import Medicine
+from Non_Medicine_inventory.models import NonMedicalProduct
+from onlineStore.images import render_derivatives, store_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Backfills thumbnails and WebP copies for existing medicine and non-medical product images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Worker processes used for resizing')
+        parser.add_argument('--force', action='store_true', help='Rebuild images that already have derivatives')
+
+    def handle(self, *args, **options):
+        # Group rows by image file so each file is decoded once even if several rows share it
+        jobs = {}
+        for model in (Medicine, NonMedicalProduct):
+            rows = model.objects.exclude(image='').exclude(image__isnull=True)
+            if not options['force']:
+                rows = rows.filter(image_digest='')
+            for pk, name in rows.values_list('pk', 'image'):
+                jobs.setdefault((model, name), []).append(pk)
+
+        self.stdout.write(f'Processing {len(jobs)} image(s) with {options["workers"]} worker(s)...')
+        done = failed = written = 0
+        pending = {}
+        queue = iter(jobs.items())
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                # Keep a bounded number of images in flight so memory stays flat
+                while len(pending) < options['workers'] * 2:
+                    try:
+                        (model, name), pks = next(queue)
+                    except StopIteration:
+                        break
+                    try:
+                        with model._meta.get_field('image').storage.open(name, 'rb') as f:
+                            pending[pool.submit(render_derivatives, f.read())] = (model, name, pks)
+                    except OSError as e:
+                        failed += 1
+                        self.stderr.write(f'  {name}: {e}')
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    model, name, pks = pending.pop(future)
+                    try:
+                        digest, files = future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'  {name}: {e}')
+                        continue
+                    written += store_derivatives(files)
+                    model.objects.filter(pk__in=pks, image=name).update(image_digest=digest)
+                    done += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built derivatives for {done} image(s) ({written} new file(s)); {failed} failed.'
+        ))
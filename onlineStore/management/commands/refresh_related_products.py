@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from onlineStore.related import refresh_related_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the "frequently bought together" table from paid orders and cashier invoices. Incremental unless --full is given; run it periodically (e.g. from cron every 15 minutes).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every product instead of only those bought since the last run')
+
+    def handle(self, *args, **options):
+        updated = refresh_related_products(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Updated related products for {updated} product(s).'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from onlineStore.reservations import release_expired_reservations
+
+
+# Expired holds already stop counting against stock; this only deletes the rows. Schedule it, e.g.
+#   * * * * * cd /path/to/project && python manage.py release_expired_reservations
+class Command(BaseCommand):
+    help = 'Releases stock reservations held by pending orders whose hold has expired. Run periodically (e.g. from cron every minute).'
+
+    def handle(self, *args, **kwargs):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired stock reservation(s).'))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlineStore', '0010_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished_at', models.DateTimeField(auto_now_add=True)),
+                ('last_medicine_id', models.BigIntegerField(default=0)),
+                ('last_non_medical_id', models.BigIntegerField(default=0)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('availability_fixed', models.PositiveIntegerField(default=0)),
+                ('orphans_deleted', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:19
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def create_version_row(apps, schema_editor):
+    CatalogVersion = apps.get_model('onlineStore', 'CatalogVersion')
+    CatalogVersion.objects.get_or_create(pk=1, defaults={'changed_at': timezone.now()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlineStore', '0011_productsyncrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=1)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
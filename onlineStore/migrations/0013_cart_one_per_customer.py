@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    # Older get_cart() could create two carts for a customer; fold the extras into the oldest one
+    Cart = apps.get_model('onlineStore', 'Cart')
+    CartItem = apps.get_model('onlineStore', 'CartItem')
+    duplicated = (Cart.objects.values('customer_user').annotate(n=models.Count('cart_id'))
+                  .filter(n__gt=1).values_list('customer_user', flat=True))
+    for user_id in list(duplicated):
+        keep, *extras = Cart.objects.filter(customer_user_id=user_id).order_by('cart_id')
+        for item in CartItem.objects.filter(cart__in=extras):
+            line, created = CartItem.objects.get_or_create(
+                cart=keep, product_id=item.product_id, defaults={'quantity': item.quantity}
+            )
+            if not created:
+                line.quantity += item.quantity
+                line.save(update_fields=['quantity'])
+        Cart.objects.filter(pk__in=[cart.pk for cart in extras]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlineStore', '0012_catalogversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('customer_user',), name='cart_one_per_customer'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlineStore', '0013_cart_one_per_customer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FakePaymentIntent',
+            fields=[
+                ('intent_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('idempotency_key', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('client_secret', models.CharField(max_length=128)),
+                ('status', models.CharField(max_length=50)),
+                ('amount', models.PositiveBigIntegerField()),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1,8 +1,48 @@
+from decimal import Decimal
 from django.conf import settings
 from django.db import models
+from django.db.models import Case, When, F, Value, ExpressionWrapper, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
 from django.core.exceptions import ObjectDoesNotExist
 from Medicine_inventory.models import Medicine
 from Non_Medicine_inventory.models import NonMedicalProduct
+from .images import srcset, derivative_url
+
+# SQL expressions that resolve a Product's price/stock from whichever inventory row it points to.
+# `prefix` is the lookup path to the Product (e.g. 'product__' when querying CartItem).
+def product_price_expression(prefix=''):
+    return Case(
+        When(**{f'{prefix}product_type': 'Medicine'}, then=F(f'{prefix}medicine__selling_price')),
+        When(**{f'{prefix}product_type': 'NonMedicalProduct'}, then=F(f'{prefix}non_medical_product__selling_price')),
+        default=Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def product_stock_expression(prefix=''):
+    return Case(
+        When(**{f'{prefix}product_type': 'Medicine'}, then=F(f'{prefix}medicine__quantity_in_stock')),
+        When(**{f'{prefix}product_type': 'NonMedicalProduct'}, then=F(f'{prefix}non_medical_product__stock')),
+        default=Value(0),
+        output_field=models.IntegerField(),
+    )
+
+
+def product_reserved_expression(prefix=''):
+    """Units held by active (unexpired) stock reservations for the product."""
+    reserved = StockReservation.objects.filter(
+        product=OuterRef(f'{prefix}pk'), expires_at__gt=Now()
+    ).order_by().values('product').annotate(total=Sum('quantity')).values('total')[:1]
+    return Coalesce(Subquery(reserved, output_field=models.IntegerField()), Value(0))
+
+
+def product_available_expression(prefix=''):
+    """On-hand stock minus active reservations."""
+    return ExpressionWrapper(
+        product_stock_expression(prefix) - product_reserved_expression(prefix),
+        output_field=models.IntegerField(),
+    )
+
 
 # Model to represent both Medicine and Non-Medicines
 class Product(models.Model):
@@ -63,6 +103,9 @@ class Product(models.Model):
 
     @property
     def stock(self):
+        # Set by onlineStore.availability.attach_availability: on-hand minus reservations
+        if hasattr(self, '_availability'):
+            return self._availability['available']
         if self.product_type == 'Medicine' and self.medicine:
             return self.medicine.quantity_in_stock
         elif self.product_type == 'NonMedicalProduct' and self.non_medical_product:
@@ -77,6 +120,28 @@ class Product(models.Model):
             return self.non_medical_product.image.url if self.non_medical_product.image else ""
         return ""
 
+    # Responsive images, built from the derivatives in onlineStore.images.
+    # Empty until the derivatives exist, so templates fall back to image_url.
+    @property
+    def _image_digest(self):
+        item = self.medicine if self.product_type == 'Medicine' else self.non_medical_product
+        return getattr(item, 'image_digest', '') if item and item.image else ''
+
+    @property
+    def image_srcset(self):
+        digest = self._image_digest
+        return srcset(digest, 'jpg') if digest else ""
+
+    @property
+    def image_webp_srcset(self):
+        digest = self._image_digest
+        return srcset(digest, 'webp') if digest else ""
+
+    @property
+    def thumbnail_url(self):
+        digest = self._image_digest
+        return derivative_url(digest, 320, 'jpg') if digest else self.image_url
+
     @property
     def description(self):
         if self.product_type == 'Medicine' and self.medicine:
@@ -91,12 +156,38 @@ class Cart(models.Model):
     customer_user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # one cart per customer, so get_cart() can't create a second one under concurrent first adds
+            models.UniqueConstraint(fields=['customer_user'], name='cart_one_per_customer'),
+        ]
+
     def __str__(self):
         return f"Cart({self.customer_user.username}, {self.created_at})"
     
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        total = self.items.with_pricing().aggregate(total=Sum('line_total'))['total']
+        return total or Decimal('0.00')
+
+
+class CartItemQuerySet(models.QuerySet):
+    def with_pricing(self):
+        """
+        Annotate each item with unit_price, line_total and available_stock, resolved in SQL
+        so a whole cart is read in one query instead of lazy-loading every product.
+        """
+        return self.select_related(
+            'product__medicine', 'product__non_medical_product'
+        ).annotate(
+            unit_price=product_price_expression('product__'),
+            available_stock=product_available_expression('product__'),
+        ).annotate(
+            line_total=ExpressionWrapper(
+                F('unit_price') * F('quantity'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+        ).order_by('id')
 
 # CartItem adds products to cart 
 class CartItem(models.Model):
@@ -104,6 +195,8 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ('cart', 'product')  #to prevent duplicate items
 
@@ -112,6 +205,9 @@ class CartItem(models.Model):
     
     @property
     def total_price(self):
+        # Prefer the SQL-computed value when the item came from with_pricing()
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.product.price * self.quantity
 
 # Order model for checkout
@@ -133,8 +229,11 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     
     # Payment fields
-    stripe_payment_intent_id = models.CharField(max_length=200, blank=True, null=True)
+    stripe_payment_intent_id = models.CharField(max_length=200, blank=True, null=True, db_index=True)
+    # Kept so reloading the payment page reuses the intent instead of creating a new one
+    payment_client_secret = models.CharField(max_length=255, blank=True)
     payment_status = models.CharField(max_length=50, default='pending')
+    paid_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     # ADD THESE MISSING SHIPPING FIELDS:
     shipping_first_name = models.CharField(max_length=100, blank=True)
@@ -146,6 +245,12 @@ class Order(models.Model):
     shipping_postal_code = models.CharField(max_length=20, blank=True)
     shipping_country = models.CharField(max_length=100, default='Sri Lanka')
 
+    class Meta:
+        indexes = [
+            # order history: WHERE customer_user = ? ORDER BY created_at DESC
+            models.Index(fields=['customer_user', '-created_at'], name='order_customer_created'),
+        ]
+
     def __str__(self):
         return f"Order #{self.order_id} - {self.customer_user.username}"
     
@@ -191,4 +296,97 @@ class OrderItem(models.Model):
         return f"OrderItem({self.product.name}, Qty: {self.quantity})"
 
 
+# StockReservation holds units for a pending order until it is paid or the hold expires
+class StockReservation(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # available stock = on hand - SUM(quantity) WHERE product = ? AND expires_at > now
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_expiry'),
+            # sweeper: DELETE WHERE expires_at <= now
+            models.Index(fields=['expires_at'], name='reservation_expiry'),
+        ]
 
+    def __str__(self):
+        return f"StockReservation(Order #{self.order_id}, Product {self.product_id}, Qty: {self.quantity})"
+
+
+# PaymentEvent records every gateway webhook event we have processed, so redeliveries are ignored
+class PaymentEvent(models.Model):
+    event_id = models.CharField(max_length=255, primary_key=True)
+    event_type = models.CharField(max_length=100)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"PaymentEvent({self.event_id}, {self.event_type})"
+
+
+# FakePaymentIntent stores the offline FakeGateway's intents (see gateway.py). They live in the
+# database rather than the per-process cache so every worker sees the same intent.
+class FakePaymentIntent(models.Model):
+    intent_id = models.CharField(max_length=64, primary_key=True)
+    # Same key -> same intent, like Stripe's Idempotency-Key header
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    client_secret = models.CharField(max_length=128)
+    status = models.CharField(max_length=50)
+    amount = models.PositiveBigIntegerField()
+    metadata = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"FakePaymentIntent({self.intent_id}, {self.status})"
+
+
+# RelatedProduct is the precomputed "frequently bought together" list: top-k neighbours per product
+class RelatedProduct(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField()  # number of baskets containing both products
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"RelatedProduct({self.product_id} -> {self.related_id}, #{self.rank}, score {self.score})"
+
+
+# RelatedProductsRefresh logs each run of the co-purchase job; the last start time is the incremental cursor
+class RelatedProductsRefresh(models.Model):
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(auto_now_add=True)
+    full = models.BooleanField(default=False)
+    products_updated = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"RelatedProductsRefresh({self.started_at:%Y-%m-%d %H:%M}, {self.products_updated} products)"
+
+
+# ProductSyncRun records each sync_products pass; its inventory ids are the high-water marks for the next run
+class ProductSyncRun(models.Model):
+    finished_at = models.DateTimeField(auto_now_add=True)
+    last_medicine_id = models.BigIntegerField(default=0)
+    last_non_medical_id = models.BigIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    availability_fixed = models.PositiveIntegerField(default=0)
+    orphans_deleted = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"ProductSyncRun({self.finished_at:%Y-%m-%d %H:%M}, +{self.created} ~{self.availability_fixed} -{self.orphans_deleted})"
+
+
+# CatalogVersion is a single row bumped whenever anything the catalog API serves changes.
+# Its version/changed_at are the API's ETag and Last-Modified, shared by every worker process.
+class CatalogVersion(models.Model):
+    version = models.PositiveBigIntegerField(default=1)
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"CatalogVersion({self.version}, {self.changed_at:%Y-%m-%d %H:%M:%S})"
@@ -0,0 +1,29 @@
+from django.core.paginator import Paginator
+from django.db.models import Prefetch
+
+from .models import Order, OrderItem
+
+ORDER_HISTORY_PAGE_SIZE = 10
+
+
+def order_history_queryset(user):
+    """
+    A customer's orders, newest first, with everything the history page reads
+    loaded up front: the prescription (reverse one-to-one) is joined in, and the
+    items come back with their products in one extra query for the whole page.
+    """
+    items = OrderItem.objects.select_related(
+        'product__medicine', 'product__non_medical_product'
+    ).order_by('id')
+    return (
+        Order.objects.filter(customer_user=user)
+        .select_related('prescription')
+        .prefetch_related(Prefetch('items', queryset=items))
+        .order_by('-created_at', '-order_id')
+    )
+
+
+def get_order_history_page(user, page_number, per_page=ORDER_HISTORY_PAGE_SIZE):
+    """Paginated order history: a COUNT, one page of orders and one items query."""
+    paginator = Paginator(order_history_queryset(user), per_page)
+    return paginator.get_page(page_number)
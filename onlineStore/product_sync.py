@@ -0,0 +1,145 @@
+"""
+Reconcile the store's Product table with the two inventory tables.
+
+Everything is set-based: missing products are found with NOT EXISTS anti-joins
+and inserted in batches, availability drift is fixed with one UPDATE per
+inventory type, and orphans are removed with one DELETE. Repeated runs only
+scan inventory rows above the high-water mark recorded by the previous run.
+"""
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.utils import timezone
+
+from Medicine_inventory.models import Medicine
+from Non_Medicine_inventory.models import NonMedicalProduct
+from .catalog import bump_catalog_version
+from .models import OrderItem, Product, ProductSyncRun
+
+SYNC_BATCH_SIZE = 5000
+
+# (inventory model, Product FK name, Product.product_type)
+INVENTORY_SOURCES = (
+    (Medicine, 'medicine', 'Medicine'),
+    (NonMedicalProduct, 'non_medical_product', 'NonMedicalProduct'),
+)
+SOURCE_FIELDS = {model: (field, product_type) for model, field, product_type in INVENTORY_SOURCES}
+
+
+def missing_products(model, field, since_id=0):
+    """Inventory rows above `since_id` with no Product pointing at them (anti-join)."""
+    linked = Product.objects.filter(**{field: OuterRef('pk')})
+    return model.objects.filter(pk__gt=since_id).filter(~Exists(linked)).order_by('pk')
+
+
+def inventory_availability(model, field):
+    return Subquery(model.objects.filter(pk=OuterRef(f'{field}_id')).values('available_online')[:1])
+
+
+def drifted_products(model, field):
+    """Products whose available_online disagrees with their inventory row."""
+    return Product.objects.filter(**{f'{field}__isnull': False}).exclude(
+        available_online=inventory_availability(model, field)
+    )
+
+
+def orphan_products():
+    """Products not linked to any inventory row. Kept if an order still references them."""
+    return Product.objects.filter(medicine__isnull=True, non_medical_product__isnull=True).filter(
+        ~Exists(OrderItem.objects.filter(product=OuterRef('pk')))
+    )
+
+
+def sync_products(full=False, dry_run=False, batch_size=SYNC_BATCH_SIZE):
+    """
+    Run one reconciliation pass and return a report dict:
+    {'created': {type: n}, 'availability_fixed': {type: n}, 'orphans_deleted': n, 'full': bool}.
+    With dry_run nothing is written and the counts are what would change.
+    """
+    last_run = None if full else ProductSyncRun.objects.order_by('-pk').first()
+    marks = {
+        'medicine': last_run.last_medicine_id if last_run else 0,
+        'non_medical_product': last_run.last_non_medical_id if last_run else 0,
+    }
+    report = {'created': {}, 'availability_fixed': {}, 'orphans_deleted': 0, 'full': last_run is None}
+    new_marks = {}
+
+    with transaction.atomic():
+        for model, field, product_type in INVENTORY_SOURCES:
+            new_marks[field] = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+            if dry_run:
+                created = missing_products(model, field, marks[field]).count()
+            else:
+                # INSERT ... SELECT over consecutive id ranges: set-based like a single
+                # statement, but each batch keeps the transaction log and locks small
+                created, low = 0, marks[field]
+                while low < new_marks[field]:
+                    high = low + batch_size
+                    created += _insert_missing(model, field, product_type, model.objects.filter(pk__gt=low, pk__lte=high))
+                    low = high
+            report['created'][product_type] = created
+
+            drifted = drifted_products(model, field)
+            if dry_run:
+                report['availability_fixed'][product_type] = drifted.count()
+            else:
+                report['availability_fixed'][product_type] = drifted.update(
+                    available_online=inventory_availability(model, field), updated_at=timezone.now(),
+                )
+
+        orphans = orphan_products()
+        if dry_run:
+            report['orphans_deleted'] = orphans.count()
+        else:
+            report['orphans_deleted'] = orphans.delete()[1].get(Product._meta.label, 0)
+            ProductSyncRun.objects.create(
+                last_medicine_id=new_marks['medicine'],
+                last_non_medical_id=new_marks['non_medical_product'],
+                created=sum(report['created'].values()),
+                availability_fixed=sum(report['availability_fixed'].values()),
+                orphans_deleted=report['orphans_deleted'],
+            )
+            if sum(report['created'].values()) or sum(report['availability_fixed'].values()) or report['orphans_deleted']:
+                bump_catalog_version()
+    return report
+
+
+
+def _insert_missing(model, field, product_type, rows):
+    """Create Products for the inventory rows in `rows` that lack one. Returns rows inserted."""
+    qn = connection.ops.quote_name
+    linked = Product.objects.filter(**{field: OuterRef('pk')})
+    select_sql, select_params = (
+        rows.filter(~Exists(linked)).order_by()
+        .values(inventory_id=F('pk'), online=F('available_online')).query.sql_with_params()
+    )
+    columns = ', '.join(qn(c) for c in (
+        'product_type', f'{field}_id', 'featured', 'available_online', 'created_at', 'updated_at'
+    ))
+    sql = (
+        f"INSERT INTO {qn(Product._meta.db_table)} ({columns}) "
+        f"SELECT %s, missing.{qn('inventory_id')}, %s, missing.{qn('online')}, %s, %s "
+        f"FROM ({select_sql}) missing"
+    )
+    stamp = Product._meta.get_field('created_at').get_db_prep_value(timezone.now(), connection)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [product_type, False, stamp, stamp, *select_params])
+        return cursor.rowcount
+
+
+def sync_inventory_rows(model, ids, batch_size=SYNC_BATCH_SIZE):
+    """
+    Bring the Products for specific inventory rows up to date: create the missing
+    ones and copy availability, a couple of statements per batch of ids.
+    Used by the save/bulk-write hooks. Returns (created, availability_fixed).
+    """
+    field, product_type = SOURCE_FIELDS[model]
+    ids = list(ids)
+    created = fixed = 0
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        created += _insert_missing(model, field, product_type, model.objects.filter(pk__in=chunk))
+        fixed += drifted_products(model, field).filter(**{f'{field}_id__in': chunk}).update(
+            available_online=inventory_availability(model, field), updated_at=timezone.now(),
+        )
+    return created, fixed
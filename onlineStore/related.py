@@ -0,0 +1,167 @@
+"""
+"Frequently bought together" from purchase history.
+
+Every paid online order and every paid cashier invoice is a basket. Two products
+co-occur when they share a basket; for each product we keep its top-k
+co-occurring products in RelatedProduct, so the product page needs one indexed
+lookup. Refreshes are incremental: only products that appear in baskets paid
+since the last run get their rows recomputed (their counts are the only ones
+that can have changed).
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from payments.models import PaymentItem
+from .models import OrderItem, Product, RelatedProduct, RelatedProductsRefresh
+
+RELATED_PRODUCTS_TOP_K = 8
+PURCHASED_ORDER_STATUSES = ('Paid', 'Processing', 'Shipped', 'Delivered')
+
+
+def _medicine_to_product():
+    # Cashier invoices reference Medicine directly; map them onto the store's Product rows
+    rows = Product.objects.filter(medicine__isnull=False).order_by('-pk').values_list('medicine_id', 'pk')
+    return dict(rows)
+
+
+def _order_lines(order_filter):
+    return OrderItem.objects.filter(order__status__in=PURCHASED_ORDER_STATUSES).filter(order_filter)
+
+
+def _payment_lines(payment_filter):
+    return PaymentItem.objects.filter(payment__status='paid').filter(payment_filter)
+
+
+def load_baskets(product_ids=None):
+    """
+    (basket, product) pairs as two int64 arrays, deduplicated. Orders and
+    invoices get disjoint basket ids (2n and 2n+1). With `product_ids`, only
+    baskets that contain at least one of those products are loaded.
+    """
+    medicine_map = _medicine_to_product()
+    order_filter, payment_filter = Q(), Q()
+    if product_ids is not None:
+        product_ids = set(product_ids)
+        medicine_ids = [m for m, p in medicine_map.items() if p in product_ids]
+        order_filter = Q(order__in=_order_lines(Q(product_id__in=product_ids)).values('order_id'))
+        payment_filter = Q(payment__in=_payment_lines(Q(medicine_id__in=medicine_ids)).values('payment_id'))
+
+    baskets, products = [], []
+    for order_id, product_id in _order_lines(order_filter).values_list('order_id', 'product_id').iterator():
+        baskets.append(order_id * 2)
+        products.append(product_id)
+    for payment_id, medicine_id in _payment_lines(payment_filter).values_list('payment_id', 'medicine_id').iterator():
+        if medicine_id in medicine_map:
+            baskets.append(payment_id * 2 + 1)
+            products.append(medicine_map[medicine_id])
+
+    if not baskets:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.unique(np.column_stack([baskets, products]).astype(np.int64), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def top_related(baskets, products, product_ids, k=RELATED_PRODUCTS_TOP_K):
+    """
+    Rows of the co-occurrence matrix C = B^T B (B is the basket/product incidence
+    matrix) for `product_ids`, each reduced to its top-k entries:
+    {product_id: [(related_id, count), ...]}. Ties are broken by product id so
+    results are stable.
+
+    All rows come out of one pass: B is laid out CSR-style (pairs sorted by
+    basket, so each basket's products are one slice), every (basket, product)
+    entry of a wanted product is expanded into that basket's slice, and the
+    resulting (product, related) pairs are counted with a single np.unique. The
+    work is the sum of the wanted products' basket sizes, not products x pairs.
+    """
+    if not len(baskets):
+        return {}
+    order = np.lexsort((products, baskets))
+    baskets, products = baskets[order], products[order]
+    product_ids_sorted, product_index = np.unique(products, return_inverse=True)
+    # CSR over baskets: basket i's products are products[starts[i]:starts[i] + sizes[i]]
+    _, starts, basket_row, sizes = np.unique(baskets, return_index=True, return_inverse=True, return_counts=True)
+
+    wanted = np.flatnonzero(np.isin(products, np.fromiter(product_ids, dtype=np.int64)))
+    rows = basket_row[wanted]
+    lengths = sizes[rows]
+    # Positions of every product in each wanted entry's basket, without a Python loop
+    offsets = np.repeat(starts[rows] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    left = np.repeat(product_index[wanted], lengths)
+    right = product_index[offsets]
+    keep = left != right
+    if not keep.any():
+        return {}
+    n = len(product_ids_sorted)
+    keys, counts = np.unique(left[keep].astype(np.int64) * n + right[keep], return_counts=True)
+    left, right = keys // n, keys % n
+
+    # Group by product, best count first, then by related id; keep the first k of each group
+    order = np.lexsort((product_ids_sorted[right], -counts, left))
+    left, right, counts = left[order], right[order], counts[order]
+    group_start = np.flatnonzero(np.r_[True, left[1:] != left[:-1]])
+    rank = np.arange(len(left)) - np.repeat(group_start, np.diff(np.r_[group_start, len(left)]))
+    top = {}
+    for i in np.flatnonzero(rank < k):
+        top.setdefault(int(product_ids_sorted[left[i]]), []).append(
+            (int(product_ids_sorted[right[i]]), int(counts[i]))
+        )
+    return top
+
+
+def changed_products(since):
+    """Products in baskets paid since `since`."""
+    medicine_map = _medicine_to_product()
+    product_ids = set(
+        OrderItem.objects.filter(order__paid_at__gte=since).values_list('product_id', flat=True)
+    )
+    medicine_ids = PaymentItem.objects.filter(
+        payment__status='paid', payment__paid_at__gte=since
+    ).values_list('medicine_id', flat=True)
+    product_ids.update(medicine_map[m] for m in medicine_ids if m in medicine_map)
+    return product_ids
+
+
+def refresh_related_products(full=False, k=RELATED_PRODUCTS_TOP_K):
+    """
+    Recompute RelatedProduct rows. Incremental by default (products touched
+    since the previous run); `full=True` rebuilds the whole table.
+    Returns the number of products whose rows were rewritten.
+    """
+    started_at = timezone.now()
+    last_run = RelatedProductsRefresh.objects.order_by('-started_at').first()
+    full = full or last_run is None
+
+    if full:
+        baskets, products = load_baskets()
+        affected = set(np.unique(products).tolist())
+    else:
+        affected = changed_products(last_run.started_at)
+        baskets, products = load_baskets(affected)
+
+    top = top_related(baskets, products, affected, k)
+    rows = [
+        RelatedProduct(product_id=product_id, related_id=related_id, rank=rank, score=score)
+        for product_id in sorted(top)
+        for rank, (related_id, score) in enumerate(top[product_id], start=1)
+    ]
+
+    with transaction.atomic():
+        stale = RelatedProduct.objects.all() if full else RelatedProduct.objects.filter(product_id__in=affected)
+        stale.delete()
+        RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+        RelatedProductsRefresh.objects.create(started_at=started_at, full=full, products_updated=len(affected))
+    return len(affected)
+
+
+def frequently_bought_together(product, limit=4):
+    """Online products most often bought with `product`, from the precomputed table (one query)."""
+    links = RelatedProduct.objects.filter(
+        product=product, related__available_online=True,
+    ).filter(
+        Q(related__medicine__available_online=True) |
+        Q(related__non_medical_product__available_online=True)
+    ).select_related('related__medicine', 'related__non_medical_product').order_by('rank')[:limit]
+    return [link.related for link in links]
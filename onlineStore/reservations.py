@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from Medicine_inventory.models import Medicine
+from Non_Medicine_inventory.models import NonMedicalProduct
+from .availability import invalidate_availability
+from .models import StockReservation
+
+# How long a pending order may hold stock before the sweeper releases it
+DEFAULT_RESERVATION_TTL_MINUTES = 15
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product, available):
+        self.product = product
+        self.available = max(available, 0)
+        super().__init__(f"Sorry, only {self.available} units of {product.name} available")
+
+
+def reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_TTL_MINUTES', DEFAULT_RESERVATION_TTL_MINUTES))
+
+
+def lock_inventory_rows(medicine_ids, non_medical_ids):
+    """
+    SELECT ... FOR UPDATE the inventory rows behind an order, always in the same
+    order (medicines then non-medical items, by primary key) so concurrent
+    checkouts cannot deadlock on each other.
+    """
+    medicine_ids = sorted(set(filter(None, medicine_ids)))
+    non_medical_ids = sorted(set(filter(None, non_medical_ids)))
+    if medicine_ids:
+        list(Medicine.objects.select_for_update().filter(pk__in=medicine_ids).order_by('pk').values_list('pk', flat=True))
+    if non_medical_ids:
+        list(NonMedicalProduct.objects.select_for_update().filter(pk__in=non_medical_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def create_reservations(order, quantities, ttl=None):
+    """Insert the holds for an order in one statement. `quantities` maps product id -> units."""
+    expires_at = timezone.now() + (ttl or reservation_ttl())
+    invalidate_availability(quantities)
+    return StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def release_order_reservations(order):
+    """Drop an order's holds (payment captured, cancelled or failed)."""
+    holds = StockReservation.objects.filter(order=order)
+    invalidate_availability(holds.values_list('product_id', flat=True))
+    return holds.delete()[0]
+
+
+def release_expired_reservations(now=None):
+    """Bulk-delete every hold whose expiry has passed. Returns the number released."""
+    return StockReservation.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
@@ -1,38 +1,153 @@
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
 from Medicine_inventory.models import Medicine
 from Non_Medicine_inventory.models import NonMedicalProduct
-from .models import Product # Use your actual Product model name
+from Pharmarcy_Prescription_Tracker.inventory_events import inventory_changed
+from .availability import invalidate_inventory_availability
+from .cart import merge_guest_cart
+from .catalog import CATALOG_SOURCE_FIELDS, bump_catalog_version, catalog_fields_changed
+from .images import schedule_derivatives
+from .models import Product
+from .product_sync import sync_inventory_rows
+
+# The on-hand column of each inventory model
+STOCK_FIELDS = {Medicine: 'quantity_in_stock', NonMedicalProduct: 'stock'}
 
 @receiver(post_save, sender=Medicine)
-def create_or_update_product_from_medicine(sender, instance, created, **kwargs):
+@receiver(post_save, sender=NonMedicalProduct)
+def sync_product_on_save(sender, instance, created, **kwargs):
     """
-    Listen for when a Medicine object is saved.
-    If it's a new medicine, create a corresponding Product.
-    If an existing medicine is updated, we don't need to do anything
-    because the Product model just points to it.
+    A new inventory item gets its store Product; an existing one only needs
+    syncing when its online availability was switched (the Product just points
+    to the row for everything else).
     """
-    if created:  # 'created' is True only the first time the object is saved
-        Product.objects.create(
-            product_type='Medicine',
-            medicine=instance,
-            # Set default availability. You can change this to False if you
-            # want a manager to manually approve products for the store.
-            available_online=True 
-        )
-        print(f"SIGNAL: Automatically created a Product for new medicine '{instance.name}'.")
+    if created or getattr(instance, '_availability_changed', False):
+        sync_inventory_rows(sender, [instance.pk])
 
-@receiver(post_save, sender=NonMedicalProduct)
-def create_or_update_product_from_non_medical(sender, instance, created, **kwargs):
+
+@receiver(inventory_changed, sender=Medicine)
+@receiver(inventory_changed, sender=NonMedicalProduct)
+def sync_products_on_bulk_write(sender, ids, created, fields=None, **kwargs):
     """
-    Listen for when a NonMedicalProduct object is saved.
-    If it's new, create a corresponding Product.
+    bulk_create / bulk_update / update() on inventory: one set-wise sync for all the ids.
+    A stock-only update() comes with ids=None and cached availability is left to
+    its TTL; callers that know the products invalidate them (see availability.py).
     """
-    if created:
-        Product.objects.create(
-            product_type='NonMedicalProduct',
-            non_medical_product=instance,
-            available_online=True
-        )
-        print(f"SIGNAL: Automatically created a Product for new non-medical item '{instance.name}'.")
\ No newline at end of file
+    if created or 'available_online' in fields:
+        sync_inventory_rows(sender, ids)
+    if catalog_fields_changed(sender, fields):
+        bump_catalog_version()
+    if ids is None:
+        return
+    if not created and STOCK_FIELDS[sender] in fields:
+        invalidate_inventory_availability(sender, ids)
+    if created or 'image' in fields:
+        with_images = sender.objects.filter(pk__in=ids, image_digest='').exclude(image='').exclude(image__isnull=True)
+        schedule_derivatives(sender, with_images.values_list('pk', flat=True))
+
+@receiver(user_logged_in)
+def merge_guest_cart_on_login(sender, request, user, **kwargs):
+    """
+    Move whatever the visitor put in their guest cart into their DB cart.
+    GuestCartMiddleware deletes the cookie on the way out.
+    """
+    guest_cart = getattr(request, 'guest_cart', None)
+    if guest_cart is None or not guest_cart.lines or getattr(user, 'role', None) != 'customer':
+        return
+    merge_guest_cart(user, guest_cart)
+
+
+def _tracked_fields(sender):
+    return (*CATALOG_SOURCE_FIELDS[sender], STOCK_FIELDS[sender])
+
+
+def _loaded_values(sender, instance, fields):
+    # Read straight from __dict__ so deferred fields are skipped rather than fetched
+    values = {}
+    for name in fields:
+        if name in instance.__dict__:
+            value = instance.__dict__[name]
+            values[name] = (getattr(value, 'name', value) or '') if name == 'image' else value
+    return values
+
+
+@receiver(post_init, sender=Medicine)
+@receiver(post_init, sender=NonMedicalProduct)
+def remember_loaded_values(sender, instance, **kwargs):
+    """Snapshot the catalog/stock columns so pre_save can tell what changed without a SELECT."""
+    instance._loaded_values = _loaded_values(sender, instance, _tracked_fields(sender))
+
+
+@receiver(pre_save, sender=Medicine)
+@receiver(pre_save, sender=NonMedicalProduct)
+def note_image_and_availability_changes(sender, instance, update_fields=None, **kwargs):
+    """Remember what changed for the post_save hooks; a new image also drops the old derivatives."""
+    catalog_fields = CATALOG_SOURCE_FIELDS[sender]
+    stock_field = STOCK_FIELDS[sender]
+    if instance.pk and not instance._state.adding:
+        fields = _tracked_fields(sender)
+        if update_fields is not None:
+            # Columns left out of update_fields aren't written, so they can't change
+            fields = [name for name in fields if name in update_fields]
+        old = getattr(instance, '_loaded_values', {})
+        if any(name not in old for name in fields):
+            # Deferred when loaded (or built by hand): fall back to reading the row
+            old = sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+            if old.get('image') is None and 'image' in old:
+                old['image'] = ''
+        new = _loaded_values(sender, instance, fields)
+        changed = {name for name in fields if old.get(name) != new.get(name)}
+        image_changed = 'image' in changed
+        availability_changed = 'available_online' in changed
+        catalog_changed = bool(changed.intersection(catalog_fields))
+        stock_changed = stock_field in changed
+    else:
+        image_changed = bool(instance.image)
+        availability_changed = False
+        catalog_changed = True
+        stock_changed = False
+    if image_changed:
+        instance.image_digest = ''
+    instance._image_changed = image_changed
+    instance._availability_changed = availability_changed
+    instance._catalog_changed = catalog_changed
+    instance._stock_changed = stock_changed
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_save, sender=NonMedicalProduct)
+def refresh_loaded_values(sender, instance, update_fields=None, **kwargs):
+    """What was just written is the new baseline for the next save of this instance."""
+    fields = _tracked_fields(sender)
+    if update_fields is not None:
+        fields = [name for name in fields if name in update_fields]
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **_loaded_values(sender, instance, fields)}
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_save, sender=NonMedicalProduct)
+def build_image_derivatives(sender, instance, **kwargs):
+    """Thumbnails/WebP copies are built off the request, after the row is committed."""
+    if instance.image and (getattr(instance, '_image_changed', False) or not instance.image_digest):
+        schedule_derivatives(sender, [instance.pk])
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_save, sender=NonMedicalProduct)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Medicine)
+@receiver(post_delete, sender=NonMedicalProduct)
+def bump_catalog_on_change(sender, instance, **kwargs):
+    """New ETag for the catalog API. Inventory saves that only move stock don't count."""
+    if getattr(instance, '_catalog_changed', True):
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_save, sender=NonMedicalProduct)
+def invalidate_availability_on_stock_change(sender, instance, created, **kwargs):
+    """Restocks, dispensing and cashier sales save the inventory row; drop its cached availability."""
+    if not created and getattr(instance, '_stock_changed', True):
+        invalidate_inventory_availability(sender, [instance.pk])
@@ -1,3 +1,817 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
 
-# Create your tests here.
+import stripe
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404, HttpResponse
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from Medicine_inventory.models import Medicine
+from Non_Medicine_inventory.models import NonMedicalProduct
+from payments.models import Payment, PaymentItem
+from prescriptions.models import Doctor, Patient, Prescription
+from Pharmarcy_Prescription_Tracker.payment_client import GatewayClient, CircuitBreaker, CircuitOpenError
+from .cart import (
+    get_cart, get_cart_summary, get_cart_item_count, add_item, _add_item_fallback,
+    GuestCart, GUEST_CART_COOKIE, get_guest_cart_summary, merge_guest_cart,
+)
+from .checkout import (
+    place_order, restore_cart_from_order, EmptyCart, confirm_order_payment, fail_order_payment,
+    handle_payment_event,
+)
+from .availability import AVAILABILITY_QUERY_BATCH, attach_availability, get_availability
+from .catalog import get_catalog_version, get_featured_products
+from .gateway import FakeGateway, InvalidWebhook
+from .images import DERIVATIVE_WIDTHS, derivative_name
+from .orders import get_order_history_page
+from .product_sync import sync_products
+from .related import refresh_related_products, frequently_bought_together
+from .models import Cart, CartItem, Order, OrderItem, PaymentEvent, Product, RelatedProduct, StockReservation
+from .views import api_products, api_stock, fake_gateway_pay, payment_cancel
+from .reservations import (
+    release_order_reservations, release_expired_reservations, InsufficientStock,
+)
+
+
+def make_medicine(name="Panadol", price="12.50", stock=20, **kwargs):
+    defaults = dict(
+        name=name,
+        brand="GSK",
+        category="Analgesic",
+        medicine_type="OTC",
+        dosage="500mg",
+        selling_price=Decimal(price),
+        quantity_in_stock=stock,
+        manufacture_date=date.today() - timedelta(days=30),
+        expiry_date=date.today() + timedelta(days=365),
+        batch_number=f"{name.upper()}-{stock}-{price}",
+        available_online=True,
+    )
+    defaults.update(kwargs)
+    return Medicine.objects.create(**defaults)
+
+
+def make_non_medical(name="Face Mask", price="3.00", stock=50, **kwargs):
+    defaults = dict(
+        name=name,
+        brand="3M",
+        category="Personal care",
+        selling_price=Decimal(price),
+        stock=stock,
+    )
+    defaults.update(kwargs)
+    return NonMedicalProduct.objects.create(**defaults)
+
+
+def make_customer(username="shopper"):
+    return get_user_model().objects.create_user(
+        username=username, email=f"{username}@example.com", password="pass12345", role="customer"
+    )
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        self.user = make_customer()
+        self.cart = Cart.objects.create(customer_user=self.user)
+        self.medicine_product = Product.objects.get(medicine=make_medicine())
+        self.non_medical_product = Product.objects.get(non_medical_product=make_non_medical())
+        CartItem.objects.create(cart=self.cart, product=self.medicine_product, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.non_medical_product, quantity=3)
+
+    def test_summary_annotates_prices_and_stock(self):
+        cart_items, cart_total = get_cart_summary(self.user)
+
+        self.assertEqual([item.unit_price for item in cart_items], [Decimal("12.50"), Decimal("3.00")])
+        self.assertEqual([item.line_total for item in cart_items], [Decimal("25.00"), Decimal("9.00")])
+        self.assertEqual([item.available_stock for item in cart_items], [20, 50])
+        self.assertEqual(cart_total, Decimal("34.00"))
+        self.assertEqual(self.cart.total_price, Decimal("34.00"))
+
+    def test_summary_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            cart_items, _ = get_cart_summary(self.user)
+            [(item.product.name, item.product.image_url) for item in cart_items]
+
+    def test_cart_item_count(self):
+        self.assertEqual(get_cart_item_count(self.user), 5)
+        self.assertEqual(get_cart_item_count(make_customer("empty")), 0)
+
+
+class AddToCartTests(TestCase):
+    def setUp(self):
+        self.user = make_customer()
+        self.cart = get_cart(self.user)
+        self.product = Product.objects.get(medicine=make_medicine(stock=5))
+
+    def test_upsert_inserts_then_increments(self):
+        self.assertEqual(add_item(self.cart, self.product.pk, 2), 2)
+        self.assertEqual(add_item(self.cart, self.product.pk, 3), 5)
+        self.assertEqual(CartItem.objects.get(cart=self.cart, product=self.product).quantity, 5)
+
+    def test_upsert_rejects_quantity_beyond_stock(self):
+        self.assertIsNone(add_item(self.cart, self.product.pk, 6))
+        self.assertEqual(add_item(self.cart, self.product.pk, 4), 4)
+        self.assertIsNone(add_item(self.cart, self.product.pk, 2))
+        self.assertEqual(CartItem.objects.get(cart=self.cart, product=self.product).quantity, 4)
+
+    def test_fallback_matches_upsert(self):
+        self.assertEqual(_add_item_fallback(self.cart, self.product.pk, 2), 2)
+        self.assertEqual(_add_item_fallback(self.cart, self.product.pk, 3), 5)
+        self.assertIsNone(_add_item_fallback(self.cart, self.product.pk, 1))
+
+    def test_get_cart_reuses_existing_cart(self):
+        self.assertEqual(get_cart(self.user).pk, self.cart.pk)
+        # a racing second create can't slip a duplicate cart in
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(customer_user=self.user)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.medicine_product = Product.objects.get(medicine=make_medicine(stock=5))
+        self.non_medical_product = Product.objects.get(non_medical_product=make_non_medical(stock=10))
+
+    def test_signed_cookie_round_trip(self):
+        guest_cart = GuestCart()
+        self.assertEqual(guest_cart.add(self.medicine_product.pk, 2, available_stock=5), 2)
+        self.assertIsNone(guest_cart.add(self.medicine_product.pk, 4, available_stock=5))
+        response = HttpResponse()
+        guest_cart.save(response)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[GUEST_CART_COOKIE] = response.cookies[GUEST_CART_COOKIE].value
+        self.assertEqual(GuestCart.from_request(request).lines, {self.medicine_product.pk: 2})
+
+    def test_tampered_cookie_is_ignored(self):
+        request = RequestFactory().get('/')
+        request.COOKIES[GUEST_CART_COOKIE] = '{"1": 99}'
+        self.assertEqual(GuestCart.from_request(request).lines, {})
+
+    def test_guest_summary_is_a_single_query(self):
+        guest_cart = GuestCart({self.medicine_product.pk: 2, self.non_medical_product.pk: 1})
+        with self.assertNumQueries(1):
+            cart_items, cart_total = get_guest_cart_summary(guest_cart)
+        self.assertEqual(cart_total, Decimal("28.00"))
+
+    def test_merge_adds_to_existing_lines_and_caps_at_stock(self):
+        user = make_customer()
+        cart = get_cart(user)
+        CartItem.objects.create(cart=cart, product=self.medicine_product, quantity=4)
+        guest_cart = GuestCart({self.medicine_product.pk: 3, self.non_medical_product.pk: 2})
+
+        self.assertEqual(merge_guest_cart(user, guest_cart), 2)
+
+        quantities = dict(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.medicine_product.pk: 5, self.non_medical_product.pk: 2})
+        self.assertEqual(guest_cart.lines, {})
+
+
+def hold_stock(product, quantity, username):
+    """Check out `quantity` units for a new customer, which holds them for the order."""
+    user = make_customer(username)
+    CartItem.objects.create(cart=get_cart(user), product=product, quantity=quantity)
+    return place_order(user, {})
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = make_customer()
+        self.product = Product.objects.get(medicine=make_medicine(stock=5))
+
+    def test_reservations_reduce_available_stock(self):
+        hold_stock(self.product, 3, "buyer1")
+
+        cart = get_cart(self.user)
+        self.assertIsNone(add_item(cart, self.product.pk, 3))
+        self.assertEqual(add_item(cart, self.product.pk, 2), 2)
+        cart_items, _ = get_cart_summary(self.user)
+        self.assertEqual(cart_items[0].available_stock, 2)
+
+    def test_reserving_more_than_available_rolls_back(self):
+        hold_stock(self.product, 4, "buyer1")
+
+        with self.assertRaises(InsufficientStock) as ctx:
+            hold_stock(self.product, 2, "buyer2")
+        self.assertEqual(ctx.exception.available, 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_expired_reservations_are_released(self):
+        with override_settings(STOCK_RESERVATION_TTL_MINUTES=-1):
+            order = hold_stock(self.product, 5, "buyer1")
+        self.assertEqual(release_expired_reservations(), 1)
+        hold_stock(self.product, 5, "buyer2")  # the expired hold no longer counts
+
+        self.assertEqual(release_order_reservations(order), 0)
+        self.assertEqual(StockReservation.objects.filter(expires_at__gt=timezone.now()).count(), 1)
+
+
+class PlaceOrderTests(TestCase):
+    shipping = {'shipping_first_name': 'Ann', 'shipping_last_name': 'Perera', 'shipping_city': 'Kandy'}
+
+    def setUp(self):
+        self.user = make_customer()
+        self.cart = get_cart(self.user)
+
+    def fill_cart(self, count):
+        for i in range(count):
+            product = Product.objects.get(medicine=make_medicine(name=f"Med{count}x{i}", stock=10))
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def count_checkout_queries(self, lines):
+        self.fill_cart(lines)
+        with CaptureQueriesContext(connection) as queries:
+            place_order(self.user, self.shipping)
+        return len(queries)
+
+    def test_order_items_reservations_and_cart_written_together(self):
+        self.fill_cart(2)
+        order = place_order(self.user, self.shipping)
+
+        self.assertEqual(order.total_amount, Decimal("50.00"))
+        self.assertEqual(order.shipping_city, "Kandy")
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+        self.assertEqual(StockReservation.objects.filter(order=order).count(), 2)
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+
+        self.assertEqual(restore_cart_from_order(order), 2)
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+
+    def test_restore_adds_to_re_added_lines_and_caps_at_stock(self):
+        product = Product.objects.get(medicine=make_medicine(name="Restore", stock=5))
+        CartItem.objects.create(cart=self.cart, product=product, quantity=3)
+        order = place_order(self.user, self.shipping)
+        release_order_reservations(order)
+        add_item(self.cart, product.pk, 1)  # re-added after checkout
+
+        self.assertEqual(restore_cart_from_order(order), 1)
+        self.assertEqual(CartItem.objects.get(cart=self.cart, product=product).quantity, 4)
+        product.medicine.quantity_in_stock = 2
+        product.medicine.save()
+        restore_cart_from_order(order)
+        self.assertEqual(CartItem.objects.get(cart=self.cart, product=product).quantity, 2)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        small = self.count_checkout_queries(1)
+        CartItem.objects.all().delete()
+        large = self.count_checkout_queries(6)
+        self.assertEqual(small, large)
+
+    def test_empty_cart(self):
+        with self.assertRaises(EmptyCart):
+            place_order(self.user, self.shipping)
+
+    def test_insufficient_stock_writes_nothing(self):
+        product = Product.objects.get(medicine=make_medicine(stock=1))
+        CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        with self.assertRaises(InsufficientStock):
+            place_order(self.user, self.shipping)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(CartItem.objects.filter(cart=self.cart).exists())
+
+
+class PaymentConfirmationTests(TestCase):
+    def setUp(self):
+        self.user = make_customer()
+        self.medicine = make_medicine(stock=10)
+        CartItem.objects.create(cart=get_cart(self.user), product=Product.objects.get(medicine=self.medicine), quantity=3)
+        self.order = place_order(self.user, {'shipping_city': 'Kandy'})
+        self.gateway = FakeGateway()
+        intent = self.gateway.create_intent(1000, 'usd', {'order_id': self.order.pk}, idempotency_key=f"order-{self.order.pk}")
+        Order.objects.filter(pk=self.order.pk).update(stripe_payment_intent_id=intent.id)
+        self.intent_id = intent.id
+
+    def test_fake_gateway_reuses_intent_for_same_key(self):
+        again = self.gateway.create_intent(1000, 'usd', {}, idempotency_key=f"order-{self.order.pk}")
+        self.assertEqual(again.id, self.intent_id)
+
+    def test_webhook_event_is_applied_once(self):
+        payload, signature = self.gateway.complete_intent(self.intent_id)
+        event = self.gateway.parse_webhook(payload, signature)
+
+        self.assertTrue(handle_payment_event(event))
+        self.assertFalse(handle_payment_event(event))
+        self.assertFalse(confirm_order_payment(self.order.pk))
+
+        self.order.refresh_from_db()
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'succeeded')
+        self.assertEqual(self.medicine.quantity_in_stock, 7)
+        self.assertFalse(StockReservation.objects.filter(order=self.order).exists())
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+    def test_failed_payment_releases_holds(self):
+        payload, signature = self.gateway.complete_intent(self.intent_id, succeeded=False)
+        handle_payment_event(self.gateway.parse_webhook(payload, signature))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'failed')
+        self.assertFalse(StockReservation.objects.filter(order=self.order).exists())
+
+    @override_settings(PAYMENT_GATEWAY_BACKEND='onlineStore.gateway.FakeGateway')
+    def test_fake_intents_are_shared_between_workers(self):
+        cache.clear()  # another worker has none of this process's cache
+        request = RequestFactory().post('/', {'outcome': 'succeed'})
+        request.user = self.user
+        with patch('onlineStore.views.redirect', return_value=HttpResponse(status=302)):
+            self.assertEqual(fake_gateway_pay(request, self.order.pk).status_code, 302)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'succeeded')
+
+        Order.objects.filter(pk=self.order.pk).update(stripe_payment_intent_id='pi_unknown')
+        with self.assertRaises(Http404):
+            fake_gateway_pay(request, self.order.pk)
+
+    def test_late_success_after_failure_rechecks_stock(self):
+        fail_order_payment(self.order.pk)
+        hold_stock(self.order.items.get().product, 8, "buyer2")  # takes the released units
+
+        self.assertFalse(confirm_order_payment(self.order.pk))
+        self.order.refresh_from_db()
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'needs_refund')
+        self.assertEqual(self.medicine.quantity_in_stock, 10)
+
+    def test_late_success_after_failure_confirms_when_stock_is_there(self):
+        fail_order_payment(self.order.pk)
+        self.assertTrue(confirm_order_payment(self.order.pk))
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity_in_stock, 7)
+
+    def test_success_after_the_hold_expired_rechecks_stock(self):
+        StockReservation.objects.filter(order=self.order).update(expires_at=timezone.now() - timedelta(minutes=1))
+        hold_stock(self.order.items.get().product, 8, "buyer2")  # the sweeper hasn't run; the units are taken anyway
+
+        self.assertFalse(confirm_order_payment(self.order.pk))
+        self.order.refresh_from_db()
+        self.medicine.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ('Payment_Failed', 'needs_refund'))
+        self.assertEqual(self.medicine.quantity_in_stock, 10)
+
+    def test_success_after_the_hold_expired_confirms_when_stock_is_there(self):
+        StockReservation.objects.filter(order=self.order).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertTrue(confirm_order_payment(self.order.pk))
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity_in_stock, 7)
+        self.assertFalse(StockReservation.objects.filter(order=self.order).exists())
+
+    def test_payment_cancel_only_acts_once_and_only_on_pending_orders(self):
+        request = RequestFactory().post('/')
+        request.user = self.user
+        line = CartItem.objects.filter(cart__customer_user=self.user)
+
+        def cancel():
+            with patch('onlineStore.views.redirect', return_value=HttpResponse(status=302)), \
+                    patch('onlineStore.views.messages'):
+                payment_cancel(request, self.order.pk)
+
+        cancel()
+        self.assertEqual(line.get().quantity, 3)
+        cancel()  # refresh / back button
+        self.assertEqual(line.get().quantity, 3)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).payment_status, 'cancelled')
+
+        line.delete()
+        Order.objects.filter(pk=self.order.pk).update(status='Paid', payment_status='succeeded')
+        cancel()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ('Paid', 'succeeded'))
+        self.assertFalse(line.exists())
+
+    def test_bad_signature_is_rejected(self):
+        payload, _ = self.gateway.complete_intent(self.intent_id)
+        with self.assertRaises(InvalidWebhook):
+            self.gateway.parse_webhook(payload, 'not-a-signature')
+
+
+class MockGatewayHandler(BaseHTTPRequestHandler):
+    # Each request pops the next (status, body) from the server's script
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.requests.append(self.headers.get('Idempotency-Key'))
+        status, body = self.server.script.pop(0) if self.server.script else (500, {})
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class GatewayClientTests(SimpleTestCase):
+    intent = {'id': 'pi_123', 'object': 'payment_intent', 'status': 'requires_payment_method', 'client_secret': 'pi_123_secret'}
+    server_error = {'error': {'type': 'api_error', 'message': 'boom'}}
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockGatewayHandler)
+        self.server.script, self.server.requests = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = GatewayClient('sk_test_mock', {
+            'API_BASE': f"http://127.0.0.1:{self.server.server_port}",
+            'TIMEOUT': 2, 'BACKOFF_BASE': 0, 'MAX_RETRIES': 2, 'BREAKER_THRESHOLD': 3,
+        })
+
+    def test_retries_server_errors_with_one_idempotency_key(self):
+        self.server.script = [(500, self.server_error), (200, self.intent)]
+        intent = self.client.create_payment_intent(amount=1000, currency='usd')
+
+        self.assertEqual(intent.id, 'pi_123')
+        self.assertEqual(len(set(self.server.requests)), 1)
+        stats = self.client.metrics.snapshot()['payment_intent.create']
+        self.assertEqual((stats['calls'], stats['errors'], stats['retries']), (2, 1, 1))
+
+    def test_breaker_opens_and_fails_fast(self):
+        self.server.script = [(500, self.server_error)] * 3
+        with self.assertLogs('Pharmarcy_Prescription_Tracker.payment_client', 'WARNING') as logs:
+            with self.assertRaises(stripe.APIError):
+                self.client.create_payment_intent(amount=1000, currency='usd')
+        self.assertIn("circuit opened after 3 consecutive failures", logs.output[0])
+        with self.assertRaises(CircuitOpenError):
+            self.client.create_payment_intent(amount=1000, currency='usd')
+        self.assertEqual(len(self.server.requests), 3)
+
+        status = self.client.status()
+        self.assertEqual(status['breaker'], {'state': 'open', 'failures': 3})
+        self.assertEqual(status['operations']['payment_intent.create']['short_circuited'], 1)
+
+    def test_card_errors_are_not_retried(self):
+        self.server.script = [(402, {'error': {'type': 'card_error', 'message': 'declined'}})]
+        with self.assertRaises(stripe.CardError):
+            self.client.create_payment_intent(amount=1000, currency='usd')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_after_reset_timeout(self):
+        now = [0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 31
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # one trial call at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens_the_circuit(self):
+        now = [0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 31
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        now[0] = 62
+        self.assertTrue(breaker.allow())
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = make_customer()
+        self.product = Product.objects.get(medicine=make_medicine(stock=100))
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(customer_user=self.user, total_amount=Decimal("12.50"))
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price=Decimal("12.50"))
+
+    def render_page(self):
+        page = get_order_history_page(self.user, 1, per_page=5)
+        return [
+            (order.prescription_status, [(item.product.name, item.product.price) for item in order.items.all()])
+            for order in page
+        ]
+
+    def test_query_count_is_fixed_per_page(self):
+        self.add_orders(2)
+        with self.assertNumQueries(3):
+            self.render_page()
+        self.add_orders(10)
+        with self.assertNumQueries(3):
+            rows = self.render_page()
+        self.assertEqual(len(rows), 5)
+
+
+class RelatedProductsTests(TestCase):
+    def setUp(self):
+        self.user = make_customer()
+        self.a, self.b, self.c, self.d = [
+            Product.objects.get(medicine=make_medicine(name=name)) for name in ("Alpha", "Beta", "Gamma", "Delta")
+        ]
+
+    def buy(self, *products):
+        order = Order.objects.create(customer_user=self.user, total_amount=Decimal("0"))
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=Decimal("1"))
+        confirm_order_payment(order.pk)
+
+    def test_ranked_by_co_purchase_count(self):
+        self.buy(self.a, self.b)
+        self.buy(self.a, self.b, self.c)
+        self.assertEqual(refresh_related_products(full=True), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(frequently_bought_together(self.a), [self.b, self.c])
+        self.assertEqual(frequently_bought_together(self.c), [self.a, self.b])
+
+    def test_incremental_refresh_only_touches_new_baskets(self):
+        self.buy(self.a, self.b)
+        refresh_related_products()
+        self.buy(self.c, self.d)
+        self.assertEqual(refresh_related_products(), 2)
+        self.assertEqual(frequently_bought_together(self.d), [self.c])
+        self.assertEqual(frequently_bought_together(self.a), [self.b])
+        self.assertEqual(RelatedProduct.objects.count(), 4)
+
+    def test_invoice_paid_days_after_creation_is_picked_up(self):
+        self.buy(self.a, self.b)
+        refresh_related_products()
+        patient = Patient.objects.create(first_name="Ann", last_name="Perera", date_of_birth=date(1990, 1, 1),
+                                         email="ann@example.com")
+        doctor = Doctor.objects.create(first_name="Sam", last_name="Silva", medical_code="MC-1")
+        payment = Payment.objects.create(
+            patient=patient, prescription=Prescription.objects.create(patient=patient, doctor=doctor)
+        )
+        Payment.objects.filter(pk=payment.pk).update(payment_date=timezone.now() - timedelta(days=3))
+        for product in (self.c, self.d):
+            PaymentItem.objects.create(payment=payment, medicine=product.medicine, quantity=1, price=Decimal("1"))
+        Payment.objects.filter(pk=payment.pk).update(status='paid', paid_at=timezone.now())
+
+        self.assertEqual(refresh_related_products(), 2)
+        self.assertEqual(frequently_bought_together(self.c), [self.d])
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_DERIVATIVE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def png(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (1200, 800), color).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), name='photo.png')
+
+    def test_upload_builds_content_hashed_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            medicine = make_medicine(image=self.png('red'))
+        medicine.refresh_from_db()
+        digest = medicine.image_digest
+        self.assertEqual(len(digest), 32)
+        for width in DERIVATIVE_WIDTHS:
+            for ext in ('webp', 'jpg'):
+                self.assertTrue(default_storage.exists(derivative_name(digest, width, ext)))
+        with default_storage.open(derivative_name(digest, 320, 'jpg')) as f:
+            self.assertEqual(Image.open(f).size, (320, 213))
+
+        product = Product.objects.select_related('medicine').get(medicine=medicine)
+        self.assertIn(f"{digest}-640.webp 640w", product.image_webp_srcset)
+        self.assertTrue(product.thumbnail_url.endswith(f"{digest}-320.jpg"))
+
+    def test_replacing_the_image_resets_the_digest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            medicine = make_medicine(image=self.png('red'))
+        medicine.refresh_from_db()
+        first = medicine.image_digest
+
+        with self.captureOnCommitCallbacks(execute=True):
+            medicine.image = self.png('blue')
+            medicine.save()
+        medicine.refresh_from_db()
+        self.assertNotIn(medicine.image_digest, ('', first))
+
+
+class SyncProductsTests(TestCase):
+    def bulk_medicines(self, *names, **kwargs):
+        return Medicine.objects.bulk_create([
+            Medicine(
+                name=name, brand="GSK", category="Analgesic", dosage="500mg", quantity_in_stock=5,
+                manufacture_date=date.today(), expiry_date=date.today() + timedelta(days=365),
+                batch_number=f"BULK-{name}", **kwargs
+            )
+            for name in names
+        ])
+
+    def unsynced_medicines(self, *names, **kwargs):
+        # Rows the store never saw (e.g. loaded straight into the database)
+        medicines = self.bulk_medicines(*names, **kwargs)
+        Product.objects.filter(medicine__in=medicines).delete()
+        return medicines
+
+    def test_creates_missing_fixes_drift_and_removes_orphans(self):
+        self.unsynced_medicines("A", "B", "C", available_online=True)
+        drifted = Product.objects.get(medicine=make_medicine(available_online=False))
+        Product.objects.filter(pk=drifted.pk).update(available_online=True)
+        Product.objects.create(product_type='Medicine')  # orphan
+
+        preview = sync_products(dry_run=True, batch_size=2)
+        self.assertEqual(preview['created']['Medicine'], 3)
+        self.assertEqual(Product.objects.count(), 2)
+
+        report = sync_products(batch_size=2)
+        self.assertEqual(report, preview)
+        self.assertEqual(report['availability_fixed']['Medicine'], 1)
+        self.assertEqual(report['orphans_deleted'], 1)
+        self.assertEqual(Product.objects.filter(medicine__name__in=["A", "B", "C"], available_online=True).count(), 3)
+        self.assertFalse(Product.objects.get(pk=drifted.pk).available_online)
+
+    def test_repeat_runs_only_scan_new_rows(self):
+        self.unsynced_medicines("A")
+        sync_products()
+        self.unsynced_medicines("B")
+        report = sync_products()
+        self.assertFalse(report['full'])
+        self.assertEqual(report['created']['Medicine'], 1)
+        self.assertEqual(sync_products()['created']['Medicine'], 0)
+
+    def test_bulk_writes_sync_products_once_per_call(self):
+        # INSERT medicines, INSERT ... SELECT products, availability UPDATE, catalog version bump,
+        # rows-with-images lookup
+        with self.assertNumQueries(5):
+            medicines = self.bulk_medicines("A", "B", "C", available_online=True)
+        self.assertEqual(Product.objects.filter(medicine__in=medicines, available_online=True).count(), 3)
+
+        Medicine.objects.filter(pk__in=[m.pk for m in medicines[:2]]).update(available_online=False)
+        self.assertEqual(Product.objects.filter(medicine__in=medicines, available_online=True).count(), 1)
+
+    def test_saving_other_fields_keeps_manual_product_visibility(self):
+        medicine = make_medicine()
+        Product.objects.filter(medicine=medicine).update(available_online=False)
+        medicine.quantity_in_stock = 3
+        medicine.save()
+        self.assertFalse(Product.objects.get(medicine=medicine).available_online)
+        medicine.available_online = False
+        medicine.save()
+        medicine.available_online = True
+        medicine.save()
+        self.assertTrue(Product.objects.get(medicine=medicine).available_online)
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.medicine = make_medicine()
+        self.mask = make_non_medical()
+        self.products = list(Product.objects.order_by('pk'))
+
+    def get(self, view, path, **headers):
+        response = view(self.factory.get(path, **headers))
+        body = json.loads(response.content) if response.status_code == 200 else None
+        return response, body
+
+    def test_list_is_revalidated_against_the_catalog_version(self):
+        response, body = self.get(api_products, '/api/products/')
+        self.assertEqual(body['count'], 2)
+        self.assertEqual(body['results'][0]['name'], 'Panadol')
+        self.assertEqual(body['results'][0]['price'], '12.50')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response, _ = self.get(api_products, '/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Selling stock doesn't change the catalog; a new price does
+        self.medicine.quantity_in_stock = 5
+        self.medicine.save()
+        Medicine.objects.filter(pk=self.medicine.pk).update(quantity_in_stock=4)
+        self.assertEqual(self.get(api_products, '/api/products/', HTTP_IF_NONE_MATCH=etag)[0].status_code, 304)
+
+        self.medicine.selling_price = Decimal('9.99')
+        self.medicine.save()
+        response, body = self.get(api_products, '/api/products/?type=Medicine', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['price'] for p in body['results']], ['9.99'])
+
+    def test_large_responses_are_gzipped(self):
+        for i in range(20):
+            make_medicine(name=f"Gz{i}", available_online=True)
+        response = api_products(self.factory.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_stock_check_reads_many_products_in_one_query(self):
+        version = get_catalog_version()
+        ids = ','.join(str(p.pk) for p in self.products)
+        with self.assertNumQueries(1):
+            response, body = self.get(api_stock, f'/api/stock/?ids={ids},999999')
+        self.assertEqual(body['stock'][str(self.products[0].pk)]['available'], 20)
+        self.assertEqual(body['stock'][str(self.products[1].pk)]['available'], 50)
+        self.assertNotIn('999999', body['stock'])
+        self.assertEqual(self.get(api_stock, '/api/stock/?ids=1,x')[0].status_code, 400)
+        self.assertEqual(get_catalog_version(), version)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_customer()
+        self.medicine = make_medicine(stock=10)
+        self.products = [Product.objects.get(medicine=self.medicine)] + [
+            Product.objects.get(non_medical_product=make_non_medical(name=f"Item {i}", stock=i)) for i in range(3)
+        ]
+        self.ids = [p.pk for p in self.products]
+
+    def test_one_query_for_all_misses_then_served_from_cache(self):
+        with self.assertNumQueries(1):
+            levels = get_availability(self.ids)
+        self.assertEqual(levels[self.ids[0]], {'on_hand': 10, 'reserved': 0, 'available': 10})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_availability(self.ids), levels)
+
+    def test_stock_movements_invalidate_the_cache(self):
+        get_availability(self.ids)
+        with self.captureOnCommitCallbacks(execute=True):
+            hold_stock(self.products[0], 4, "buyer1")
+        self.assertEqual(get_availability([self.ids[0]])[self.ids[0]]['available'], 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.medicine.quantity_in_stock = 20
+            self.medicine.save()
+        product = attach_availability(Product.objects.filter(pk=self.ids[0]))[0]
+        self.assertEqual(product.stock, 16)
+
+    def test_listing_more_products_than_one_lookup_holds(self):
+        NonMedicalProduct.objects.bulk_create([
+            NonMedicalProduct(name=f"Bulk {i}", slug=f"bulk-{i}", brand="3M", category="Personal care", selling_price=Decimal('1.00'), stock=2)
+            for i in range(AVAILABILITY_QUERY_BATCH + 20)
+        ])
+        cache.clear()
+        products = Product.objects.all()
+        with self.assertNumQueries(3):  # the listing, then two availability batches
+            listed = attach_availability(products)
+        self.assertEqual(len(listed), AVAILABILITY_QUERY_BATCH + 24)
+        self.assertEqual({p.stock for p in listed if p.name.startswith("Bulk")}, {2})
+
+    def test_inventory_saves_compare_against_loaded_values(self):
+        medicine = Medicine.objects.get(pk=self.medicine.pk)
+        with CaptureQueriesContext(connection) as queries:
+            medicine.quantity_in_stock = 7
+            medicine.save()
+        # No re-read of the row to find out what changed
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and '"selling_price"' in q['sql']])
+        self.assertTrue(medicine._stock_changed)
+        self.assertFalse(medicine._catalog_changed)
+
+        medicine.selling_price = Decimal('9.00')
+        medicine.save(update_fields=['quantity_in_stock'])
+        self.assertFalse(medicine._stock_changed)
+        self.assertFalse(medicine._catalog_changed)
+        medicine.save()
+        self.assertTrue(medicine._catalog_changed)
+        self.assertFalse(medicine._stock_changed)
+
+
+class FeaturedProductsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.medicine = make_medicine(stock=3)
+        self.product = Product.objects.get(medicine=self.medicine)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.featured = True
+            self.product.save()
+
+    def test_snapshot_is_served_from_one_cache_read(self):
+        self.assertEqual([p['name'] for p in get_featured_products()], ['Panadol'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_featured_products()[0]['price'], Decimal('12.50'))
+
+    def test_price_and_stock_changes_rebuild_the_snapshot(self):
+        get_featured_products()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.medicine.selling_price = Decimal('8.00')
+            self.medicine.save()
+        self.assertEqual(get_featured_products()[0]['price'], Decimal('8.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.medicine.quantity_in_stock = 0
+            self.medicine.save()
+        self.assertEqual(get_featured_products(), [])
+
+        # Stock moving on a product that isn't featured leaves the snapshot alone
+        other = make_non_medical()
+        with self.captureOnCommitCallbacks(execute=True):
+            other.stock = 7
+            other.save()
+        with self.assertNumQueries(0):
+            get_featured_products()
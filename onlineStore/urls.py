@@ -33,8 +33,16 @@ urlpatterns = [
     path('payment/<int:order_id>/', views.payment_view, name='payment'),
     path('payment-success/<int:order_id>/', views.payment_success, name='payment_success'),
     path('payment-cancel/<int:order_id>/', views.payment_cancel, name='payment_cancel'),
+    path('payment-webhook/', views.payment_webhook, name='payment_webhook'),
+    path('fake-gateway-pay/<int:order_id>/', views.fake_gateway_pay, name='fake_gateway_pay'),
     path('cancel-order/<int:order_id>/', views.cancel_order, name='cancel_order'),
     
     path('order-confirmation/<int:order_id>/', views.order_confirmation, name='order_confirmation'),
+
+    # JSON catalog API (React storefront)
+    path('api/products/', views.api_products, name='api_products'),
+    path('api/products/<int:pk>/', views.api_product_detail, name='api_product_detail'),
+    path('api/categories/', views.api_categories, name='api_categories'),
+    path('api/stock/', views.api_stock, name='api_stock'),
     
 ]
\ No newline at end of file
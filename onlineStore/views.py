@@ -1,6 +1,22 @@
 from multiprocessing import context
 from django.shortcuts import get_object_or_404, render, redirect
 from .models import Cart, Order, Product, CartItem, OrderItem
+from .cart import get_cart, get_cart_summary, get_cart_item_count, add_item, get_guest_cart_summary
+from .reservations import release_order_reservations, InsufficientStock
+from .checkout import (
+    place_order, restore_cart_from_order, EmptyCart,
+    confirm_order_payment, fail_order_payment, handle_payment_event, UNSETTLED_PAYMENT_STATUSES,
+)
+from .gateway import get_gateway, InvalidWebhook
+from .orders import get_order_history_page
+from .related import frequently_bought_together
+from .catalog import (
+    CATALOG_MAX_PAGE_SIZE, CATALOG_PAGE_SIZE, LIST_VALUES,
+    catalog_categories, catalog_etag, catalog_last_modified, catalog_rows, filter_catalog,
+    get_catalog_product, get_featured_products, serialize_product,
+)
+from .availability import AVAILABILITY_MAX_IDS, attach_availability, get_availability
+from django.db import transaction
 from django.db.models import Q
 from django.db.models.functions import Coalesce
 
@@ -12,18 +28,24 @@ from Non_Medicine_inventory.models import NonMedicalProduct
 
 
 #payments
-import stripe
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 import json
-from django.views.decorators.http import require_POST
-# Configure Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.gzip import gzip_page
+from django.core.paginator import Paginator
+from functools import wraps
 
 # Customer required
 def customer_required(view_func):
     return user_passes_test(lambda u: u.is_authenticated and u.role == "customer")(view_func)
 
+# Customers or anonymous visitors (who shop with a guest cart)
+def shopper_required(view_func):
+    return user_passes_test(lambda u: not u.is_authenticated or u.role == "customer")(view_func)
+
 def about_us(request):
     return render(request, 'onlineStore/about_us.html')
 
@@ -31,22 +53,19 @@ def about_us(request):
 # Customer Order View
 @customer_required
 def order_history(request):
-    orders = Order.objects.filter(customer_user=request.user).order_by('-created_at')
-    return render(request, 'onlineStore/order_history.html', {'orders': orders})
+    page_obj = get_order_history_page(request.user, request.GET.get('page'))
+    return render(request, 'onlineStore/order_history.html', {
+        'orders': page_obj.object_list,
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
+    })
 
 
 # Homepage view
 def online_store_homepage(request):
-    featured_products = Product.objects.filter(
-        featured=True, 
-        available_online=True
-    ).filter(
-        Q(medicine__available_online=True) |  # Medicine must be available_online
-        Q(non_medical_product__available_online=True)  # NonMedicalProduct must be available_online
-    ).select_related('medicine', 'non_medical_product')[:6]
-    
+    # Precomputed snapshot (onlineStore.catalog), rebuilt after featured flags, prices or stock change
     context = {
-        'featured_products': featured_products
+        'featured_products': get_featured_products()
     }
     return render(request, 'onlineStore/homepage.html', context)
 
@@ -91,7 +110,7 @@ def products(request):
         )
 
     context = {
-        'products': products,
+        'products': attach_availability(products),
         'medicine_categories': Medicine.CATEGORY_CHOICES,
         'non_medical_categories': NonMedicalProduct.CATEGORY_CHOICES,
         'current_type': product_type,
@@ -144,7 +163,7 @@ def medicine_products(request):
     non_medical_categories = NonMedicalProduct.CATEGORY_CHOICES
     
     context = {
-        'products': products,
+        'products': attach_availability(products),
         'medicine_categories': medicine_categories,
         'non_medical_categories': non_medical_categories,
         'current_type': product_type,
@@ -222,7 +241,7 @@ def medical_devices_view(request):
     non_medical_categories = NonMedicalProduct.CATEGORY_CHOICES
 
     context = {
-        'products': products,
+        'products': attach_availability(products),
         'medicine_categories': medicine_categories,
         'non_medical_categories': non_medical_categories,
         'current_type': product_type,
@@ -253,10 +272,12 @@ def product_detail(request, pk):
         messages.error(request, "This product is currently not available online.")
         return redirect('onlineStore:products')
     
-    related_products = []
+    # Precomputed co-purchases first; fall back to same-category products for items nobody has bought yet
+    related_products = frequently_bought_together(product)
+    bought_together = bool(related_products)
     inventory_item = product.medicine or product.non_medical_product
 
-    if inventory_item:
+    if not related_products and inventory_item:
         product_type_field_name = 'medicine' if product.product_type == 'Medicine' else 'non_medical_product'
 
         related_products = Product.objects.filter(
@@ -266,88 +287,130 @@ def product_detail(request, pk):
         ).filter(
             Q(medicine__available_online=True) |  # Medicine must be available_online
             Q(non_medical_product__available_online=True)  # NonMedicalProduct must be available_online
-        ).exclude(pk=pk)[:4]
+        ).select_related('medicine', 'non_medical_product').exclude(pk=pk)[:4]
 
+    attach_availability([product])
     context = {
         'product': product,
-        'related_products': related_products,
+        'related_products': attach_availability(related_products),
+        'bought_together': bought_together,
     }
     
     return render(request, 'onlineStore/productDetail.html', context)
 
 
 
-@customer_required
+def wants_json(request):
+    return (
+        request.headers.get('x-requested-with') == 'XMLHttpRequest'
+        or 'application/json' in request.headers.get('accept', '')
+    )
+
+
+@shopper_required
 def add_to_cart(request, pk):
     if request.method == 'POST':
-        product = get_object_or_404(Product, pk=pk, available_online=True)
+        product = get_object_or_404(
+            Product.objects.select_related('medicine', 'non_medical_product'),
+            pk=pk, available_online=True
+        )
+        as_json = wants_json(request)
         
         # Additional check for both Medicine and NonMedicalProduct
-        if product.medicine and not product.medicine.available_online:
-            messages.error(request, "This medicine is not available for online purchase.")
-            return redirect('onlineStore:products')
-        elif product.non_medical_product and not product.non_medical_product.available_online:
-            messages.error(request, "This product is not available for online purchase.")
+        inventory_item = product.medicine or product.non_medical_product
+        if inventory_item is None or not inventory_item.available_online:
+            error = "This product is not available for online purchase."
+            if as_json:
+                return JsonResponse({'ok': False, 'error': error}, status=400)
+            messages.error(request, error)
             return redirect('onlineStore:products')
         
-        quantity = int(request.POST.get('quantity'))
+        try:
+            quantity = int(request.POST.get('quantity', 1))
+        except (TypeError, ValueError):
+            quantity = 0
         
         if quantity <= 0:
+            if as_json:
+                return JsonResponse({'ok': False, 'error': "Invalid quantity"}, status=400)
             messages.error(request, "Invalid quantity")
             return redirect('onlineStore:product_detail', pk=pk)
         
-        if quantity > product.stock:
-            messages.error(request, f"Only {product.stock} items available in stock")
-            return redirect('onlineStore:product_detail', pk=pk)
+        if request.user.is_authenticated:
+            # Insert-or-increment with the stock check in the same statement
+            cart = get_cart(request.user)
+            new_quantity = add_item(cart, product.pk, quantity)
+            cart_item_count = get_cart_item_count(request.user) if as_json else None
+        else:
+            # Guests keep their cart in a signed cookie until they log in
+            attach_availability([product])  # reservations count against what guests can add
+            new_quantity = request.guest_cart.add(product.pk, quantity, product.stock)
+            cart_item_count = request.guest_cart.item_count
         
-        # create cart 
-        cart, created = Cart.objects.get_or_create(customer_user=request.user)
+        if new_quantity is None:
+            error = f"Cannot add more. Only {product.stock} items available"
+            if as_json:
+                return JsonResponse({'ok': False, 'error': error, 'stock': product.stock}, status=409)
+            messages.error(request, error)
+            return redirect('onlineStore:product_detail', pk=pk)
         
-        # create cart item
-        cart_item, item_created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
+        if as_json:
+            return JsonResponse({
+                'ok': True,
+                'product_id': product.pk,
+                'quantity': new_quantity,
+                'cart_item_count': cart_item_count,
+            })
         
-        if not item_created:
-            # if item already exists, update quantity
-            new_quantity = cart_item.quantity + quantity
-            if new_quantity > product.stock:
-                messages.error(request, f"Cannot add more. Only {product.stock} items available")
-                return redirect('onlineStore:product_detail', pk=pk)
-            cart_item.quantity = new_quantity
-            cart_item.save()
-            messages.success(request, f"Updated {product.name} quantity to {cart_item.quantity}")
-        else:
+        if new_quantity == quantity:
             messages.success(request, f"Added {product.name} to cart")
-        
+        else:
+            messages.success(request, f"Updated {product.name} quantity to {new_quantity}")
         return redirect('onlineStore:cart')
     
     return redirect('onlineStore:product_detail', pk=pk)
 
-@customer_required
+@shopper_required
 def cart_view(request):
-    try:
-        cart = Cart.objects.get(customer_user=request.user)  
-        cart_items = cart.items.all()
-    except Cart.DoesNotExist:
-        cart = None
-        cart_items = []
+    if request.user.is_authenticated:
+        cart_items, cart_total = get_cart_summary(request.user)
+    else:
+        cart_items, cart_total = get_guest_cart_summary(request.guest_cart)
     
     context = {
-        'cart': cart,
         'cart_items': cart_items,
-        'cart_total': cart.total_price if cart else 0,
+        'cart_total': cart_total,
     }
     
     return render(request, 'onlineStore/cart.html', context)
 
-@customer_required
+@shopper_required
 def update_cart_item(request, item_id):
     if request.method == 'POST':
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__customer_user=request.user)  # Changed to customer_user
-        quantity = int(request.POST.get('quantity', 1))
+        try:
+            quantity = int(request.POST.get('quantity', 1))
+        except (TypeError, ValueError):
+            messages.error(request, "Invalid quantity")
+            return redirect('onlineStore:cart')
+        
+        if not request.user.is_authenticated:
+            # Guest cart lines are addressed by product id
+            product = get_object_or_404(Product.objects.select_related('medicine', 'non_medical_product'), pk=item_id)
+            attach_availability([product])
+            if quantity <= 0:
+                request.guest_cart.remove(product.pk)
+                messages.success(request, f"Removed {product.name} from cart")
+            elif quantity > product.stock:
+                messages.error(request, f"Only {product.stock} items available")
+            else:
+                request.guest_cart.set(product.pk, quantity)
+                messages.success(request, f"Updated {product.name} quantity")
+            return redirect('onlineStore:cart')
+        
+        cart_item = get_object_or_404(
+            CartItem.objects.select_related('product__medicine', 'product__non_medical_product'),
+            id=item_id, cart__customer_user=request.user
+        )
         
         if quantity <= 0:
             cart_item.delete()
@@ -356,14 +419,22 @@ def update_cart_item(request, item_id):
             messages.error(request, f"Only {cart_item.product.stock} items available")
         else:
             cart_item.quantity = quantity
-            cart_item.save()
+            cart_item.save(update_fields=['quantity'])
             messages.success(request, f"Updated {cart_item.product.name} quantity")
     
     return redirect('onlineStore:cart')
 
-@customer_required
+@shopper_required
 def remove_from_cart(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__customer_user=request.user)  # Changed to customer_user
+    if not request.user.is_authenticated:
+        request.guest_cart.remove(item_id)
+        messages.success(request, "Removed item from cart")
+        return redirect('onlineStore:cart')
+    
+    cart_item = get_object_or_404(
+        CartItem.objects.select_related('product__medicine', 'product__non_medical_product'),
+        id=item_id, cart__customer_user=request.user
+    )
     product_name = cart_item.product.name
     cart_item.delete()
     messages.success(request, f"Removed {product_name} from cart")
@@ -377,38 +448,30 @@ from accounts.models import Customer
 
 @customer_required
 def checkout_view(request):
-    try:
-        cart = Cart.objects.get(customer_user=request.user)
-        cart_items = cart.items.all()
-    except Cart.DoesNotExist:
-        messages.error(request, "Your cart is empty")
-        return redirect('onlineStore:cart')
-    
-    # Check if cart is empty
-    if not cart_items:
-        messages.error(request, "Your cart is empty")
-        return redirect('onlineStore:cart')
-    
     # Get or create customer profile
     customer, created = Customer.objects.get_or_create(user=request.user)
     
     # Handle POST request (form submission)
     if request.method == 'POST':
-        return process_checkout(request, cart, cart_items, customer)
+        return process_checkout(request, customer)
+    
+    cart_items, cart_total = get_cart_summary(request.user)
+    
+    # Check if cart is empty
+    if not cart_items:
+        messages.error(request, "Your cart is empty")
+        return redirect('onlineStore:cart')
     
     # Show checkout form (GET request)
     context = {
-        'cart': cart,
         'cart_items': cart_items,
-        'cart_total': cart.total_price,
+        'cart_total': cart_total,
         'customer': customer,  # Pass customer data to pre-fill form
     }
     return render(request, 'onlineStore/checkout.html', context)
 
-# Update your process_checkout function
-# Remove the duplicate process_checkout function and keep only this one:
 
-def process_checkout(request, cart, cart_items, customer):
+def process_checkout(request, customer):
     """Process the checkout form submission"""
     
     # Extract form data from POST request
@@ -431,11 +494,6 @@ def process_checkout(request, cart, cart_items, customer):
         messages.error(request, "Please enter a valid email address")
         return redirect('onlineStore:checkout')
     
-    for item in cart_items:
-        if item.quantity > item.product.stock:
-            messages.error(request, f"Sorry, only {item.product.stock} units of {item.product.name} available")
-            return redirect('onlineStore:cart')
-    
     try:
         # Update customer profile if requested
         if update_profile:
@@ -450,34 +508,24 @@ def process_checkout(request, cart, cart_items, customer):
             request.user.email = email
             request.user.save()
         
-        # Create Order FIRST (before payment)
-        order = Order.objects.create(
-            customer_user=request.user,
-            total_amount=cart.total_price,
-            status='Pending',
-            payment_status='pending',
-            shipping_first_name=first_name,
-            shipping_last_name=last_name,
-            shipping_email=email,
-            shipping_phone=phone,
-            shipping_address=address,
-            shipping_city=city,
-            shipping_postal_code=postal_code,
-            shipping_country=country,
-        )
-        
-        # Create OrderItems (before payment)
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
+        # Order, items and stock holds are written atomically and the cart is emptied
+        order = place_order(request.user, {
+            'shipping_first_name': first_name,
+            'shipping_last_name': last_name,
+            'shipping_email': email,
+            'shipping_phone': phone,
+            'shipping_address': address,
+            'shipping_city': city,
+            'shipping_postal_code': postal_code,
+            'shipping_country': country,
+        })
         
         # REDIRECT TO PAYMENT PAGE instead of completing order
         return redirect('onlineStore:payment', order_id=order.order_id)
         
+    except (EmptyCart, InsufficientStock) as e:
+        messages.error(request, str(e))
+        return redirect('onlineStore:cart')
     except Exception as e:
         messages.error(request, f"There was an error processing your order: {str(e)}")
         return redirect('onlineStore:checkout')
@@ -486,26 +534,31 @@ def process_checkout(request, cart, cart_items, customer):
 def payment_view(request, order_id):
     """Display payment page with Stripe integration"""
     order = get_object_or_404(Order, order_id=order_id, customer_user=request.user, status='Pending')
+    gateway = get_gateway()
     
     try:
-        # Create Stripe PaymentIntent
-        intent = stripe.PaymentIntent.create(
-            amount=int(order.total_amount * 100),  # Stripe uses cents
-            currency='usd',  # Sri Lankan Rupee
-            metadata={
-                'order_id': order.order_id,
-                'customer_email': order.shipping_email,
-            }
-        )
-        
-        # Save the payment intent ID
-        order.stripe_payment_intent_id = intent.id
-        order.save()
+        # Reuse the order's intent on reload instead of creating a new one every time
+        if not (order.stripe_payment_intent_id and order.payment_client_secret):
+            intent = gateway.create_intent(
+                amount=int(order.total_amount * 100),  # Stripe uses cents
+                currency='usd',  # Sri Lankan Rupee
+                metadata={
+                    'order_id': order.order_id,
+                    'customer_email': order.shipping_email,
+                },
+                idempotency_key=f"order-{order.order_id}-intent",
+            )
+            
+            # Save the payment intent ID
+            order.stripe_payment_intent_id = intent.id
+            order.payment_client_secret = intent.client_secret
+            order.save(update_fields=['stripe_payment_intent_id', 'payment_client_secret'])
         
         context = {
             'order': order,
-            'client_secret': intent.client_secret,
+            'client_secret': order.payment_client_secret,
             'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
+            'fake_gateway': gateway.name == 'fake',
         }
         
         return render(request, 'onlineStore/payment.html', context)
@@ -517,58 +570,91 @@ def payment_view(request, order_id):
 
 @customer_required
 def payment_success(request, order_id):
-    """Handle successful payment"""
+    """
+    Landing page after the payment form. The webhook confirms the order, so this
+    only reads the order back; the gateway is only asked directly when webhooks
+    are switched off (e.g. local dev without a forwarding tunnel).
+    """
     order = get_object_or_404(Order, order_id=order_id, customer_user=request.user)
     
     try:
-        # Verify payment with Stripe
-        if order.stripe_payment_intent_id:
-            intent = stripe.PaymentIntent.retrieve(order.stripe_payment_intent_id)
-            
+        if (order.payment_status in UNSETTLED_PAYMENT_STATUSES and order.stripe_payment_intent_id
+                and not getattr(settings, 'PAYMENT_CONFIRM_VIA_WEBHOOK', True)):
+            intent = get_gateway().retrieve_intent(order.stripe_payment_intent_id)
             if intent.status == 'succeeded':
-                # Payment successful - complete the order
-                order.status = 'Paid'
-                order.payment_status = 'succeeded'
-                order.save()
-                
-                # Now update inventory
-                cart = Cart.objects.get(customer_user=request.user)
-                for order_item in order.items.all():
-                    if order_item.product.product_type == 'Medicine':
-                        medicine = order_item.product.medicine
-                        medicine.quantity_in_stock -= order_item.quantity
-                        medicine.save()
-                    elif order_item.product.product_type == 'NonMedicalProduct':
-                        non_medical = order_item.product.non_medical_product
-                        non_medical.stock -= order_item.quantity
-                        non_medical.save()
-                
-                # Clear cart
-                cart.items.all().delete()
-                
-                messages.success(request, f"Payment successful! Order #{order.order_id} confirmed.")
-                return redirect('onlineStore:order_confirmation', order_id=order.order_id)
+                confirm_order_payment(order.order_id)
             else:
-                order.payment_status = 'failed'
-                order.status = 'Payment_Failed'
-                order.save()
-                messages.error(request, "Payment was not completed. Please try again.")
-                return redirect('onlineStore:payment', order_id=order.order_id)
-                
+                fail_order_payment(order.order_id)
+            order.refresh_from_db()
     except Exception as e:
         messages.error(request, f"Payment verification failed: {str(e)}")
         return redirect('onlineStore:payment', order_id=order.order_id)
+    
+    if order.payment_status == 'succeeded':
+        messages.success(request, f"Payment successful! Order #{order.order_id} confirmed.")
+    elif order.payment_status == 'failed' or request.GET.get('redirect_status') == 'failed':
+        messages.error(request, "Payment was not completed. Please try again.")
+        return redirect('onlineStore:payment', order_id=order.order_id)
+    else:
+        # Webhook hasn't landed yet; the order page shows the status once it does
+        messages.info(request, f"Thanks! We're confirming the payment for Order #{order.order_id}.")
+    return redirect('onlineStore:order_confirmation', order_id=order.order_id)
+
+
+@csrf_exempt
+@require_POST
+def payment_webhook(request):
+    """Gateway webhook: confirms or fails orders, ignoring events we've already seen."""
+    gateway = get_gateway()
+    try:
+        event = gateway.parse_webhook(request.body, request.META.get('HTTP_STRIPE_SIGNATURE'))
+    except InvalidWebhook:
+        return HttpResponse(status=400)
+    handle_payment_event(event)
+    return HttpResponse(status=200)
+
+
+@customer_required
+@require_POST
+def fake_gateway_pay(request, order_id):
+    """Stands in for the Stripe payment form when the fake gateway is configured."""
+    gateway = get_gateway()
+    if gateway.name != 'fake':
+        return HttpResponse(status=404)
+    order = get_object_or_404(
+        Order, order_id=order_id, customer_user=request.user, stripe_payment_intent_id__isnull=False
+    )
+    succeeded = request.POST.get('outcome') != 'fail'
+    try:
+        payload, signature = gateway.complete_intent(order.stripe_payment_intent_id, succeeded=succeeded)
+    except LookupError:
+        # The order points at an intent the fake gateway never created (e.g. made by the real one)
+        raise Http404("No such payment intent")
+    handle_payment_event(gateway.parse_webhook(payload, signature))
+    return redirect('onlineStore:payment_success', order_id=order.order_id)
 
 
-@customer_required 
+@customer_required
+@require_POST
 def payment_cancel(request, order_id):
-    """Handle cancelled payment"""
+    """
+    Handle cancelled payment. Only a pending order is cancelled, with a conditional
+    update, so a repeated request (or one for a paid order) changes nothing.
+    """
     order = get_object_or_404(Order, order_id=order_id, customer_user=request.user)
-    order.status = 'Payment_Failed'
-    order.payment_status = 'cancelled'
-    order.save()
-    
-    messages.warning(request, "Payment was cancelled. You can try again.")
+    with transaction.atomic():
+        cancelled = Order.objects.filter(pk=order.pk, payment_status='pending').update(
+            status='Payment_Failed', payment_status='cancelled'
+        )
+        if cancelled:
+            release_order_reservations(order)
+            # Checkout emptied the cart; give the items back so the customer can retry
+            restore_cart_from_order(order)
+
+    if cancelled:
+        messages.warning(request, "Payment was cancelled. You can try again.")
+    else:
+        messages.info(request, f"Order #{order.order_id} can no longer be cancelled here.")
     return redirect('onlineStore:cart')
 
 @customer_required
@@ -608,7 +694,7 @@ def cancel_order(request, order_id):
 
         if payment_status == 'succeeded' and intent_id:
             try:
-                stripe.Refund.create(payment_intent=intent_id)
+                get_gateway().refund(intent_id)
                 setattr(order, 'payment_status', 'refunded')
             except Exception as e:
                 messages.error(request, f"Refund failed: {e}")
@@ -620,6 +706,7 @@ def cancel_order(request, order_id):
         if getattr(order, 'payment_status', None) not in ('refunded', 'refund_failed'):
             setattr(order, 'payment_status', 'cancelled')
         order.save()
+        release_order_reservations(order)
 
         messages.success(request, f"Order #{order.order_id} has been cancelled.")
     except Exception as e:
@@ -627,6 +714,75 @@ def cancel_order(request, order_id):
 
     return redirect('onlineStore:order_history')
 
+
+# JSON catalog API for the React storefront.
+# Catalog responses are revalidated against the catalog version, so polling mostly gets 304s.
+def catalog_api(view_func):
+    @wraps(view_func)
+    @gzip_page
+    @cache_control(public=True, no_cache=True)
+    @require_GET
+    @condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+    def wrapper(request, *args, **kwargs):
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def compact_json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+@catalog_api
+def api_products(request):
+    rows = filter_catalog(
+        catalog_rows(),
+        product_type=request.GET.get('type', ''),
+        category=request.GET.get('category', '').strip(),
+        search=request.GET.get('search', '').strip(),
+        featured=request.GET.get('featured') in ('1', 'true'),
+    )
+    try:
+        page_size = min(max(int(request.GET.get('page_size', CATALOG_PAGE_SIZE)), 1), CATALOG_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = CATALOG_PAGE_SIZE
+    page = Paginator(rows.values(*LIST_VALUES), page_size).get_page(request.GET.get('page'))
+    return compact_json({
+        'count': page.paginator.count,
+        'page': page.number,
+        'num_pages': page.paginator.num_pages,
+        'results': [serialize_product(row) for row in page],
+    })
+
+
+@catalog_api
+def api_product_detail(request, pk):
+    product = get_catalog_product(pk)
+    if product is None:
+        return compact_json({'error': 'Product not found'}, status=404)
+    return compact_json(product)
+
+
+@catalog_api
+def api_categories(request):
+    return compact_json(catalog_categories())
+
+
+@gzip_page
+@never_cache
+@require_GET
+def api_stock(request):
+    """
+    Stock for many products in one call:
+    ?ids=1,2,3 -> {"stock": {"1": {"on_hand": 5, "reserved": 1, "available": 4}, ...}}
+    """
+    try:
+        ids = {int(i) for i in request.GET.get('ids', '').split(',') if i.strip()}
+    except ValueError:
+        return compact_json({'error': 'ids must be a comma-separated list of integers'}, status=400)
+    if len(ids) > AVAILABILITY_MAX_IDS:
+        return compact_json({'error': f'At most {AVAILABILITY_MAX_IDS} ids per request'}, status=400)
+    return compact_json({'stock': get_availability(ids)})
+
 # ...existing code...
 
 
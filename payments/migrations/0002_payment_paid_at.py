@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:12
+
+from django.db import migrations, models
+
+
+def backfill_paid_at(apps, schema_editor):
+    # Best guess for invoices paid before the field existed
+    Payment = apps.get_model('payments', 'Payment')
+    Payment.objects.filter(status='paid', paid_at__isnull=True).update(paid_at=models.F('payment_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_paid_at, migrations.RunPython.noop),
+    ]
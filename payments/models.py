@@ -24,6 +24,8 @@ class Payment(models.Model):
     
     # Timestamp for when the payment was created.
     payment_date = models.DateTimeField(auto_now_add=True)
+    # When the payment was marked paid (the related-products refresh picks up invoices by this).
+    paid_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     def __str__(self):
         # Change this line
@@ -5,7 +5,7 @@ from django.shortcuts import redirect, get_object_or_404, render
 from django.conf import settings
 from django.contrib import messages
 from prompt_toolkit import HTML
-import stripe
+from Pharmarcy_Prescription_Tracker.payment_client import get_gateway_client
 from prescriptions.models import Prescription, PrescriptionItem
 from .models import *
 from django.core.paginator import Paginator
@@ -14,8 +14,8 @@ from django.template.loader import render_to_string
 from django.core.mail import send_mail
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.decorators import user_passes_test
+from django.utils import timezone
 from payments.models import Payment  # Import your Payment model
-stripe.api_key = settings.STRIPE_SECRET_KEY
 
 def is_cashier(user):
     """Check if user is a cashier"""
@@ -82,7 +82,8 @@ def checkout_prescription(request, pk):
     payment.calculate_total()
     
     try:
-        checkout_session = stripe.checkout.Session.create(
+        # Shared client: pooled connections, timeouts, retries and circuit breaker
+        checkout_session = get_gateway_client().create_checkout_session(
             payment_method_types=['card'],
             line_items=line_items,
             mode='payment',
@@ -105,7 +106,9 @@ def success_payment(request, pk):
     Updates the Payment object's status and shows a success message.
     """
     payment = get_object_or_404(Payment, pk=pk)
-    payment.status = 'paid'
+    if payment.status != 'paid':
+        payment.status = 'paid'
+        payment.paid_at = timezone.now()
     payment.save()
     
     messages.success(request, f"Payment #{payment.id} for Prescription #{payment.prescription.id} was successful!")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PrescriptionsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "prescriptions"
+
+    def ready(self):
+        # Connects the DrugInteraction receivers that keep the interaction checker fresh
+        import prescriptions.signals  # noqa: F401
@@ -0,0 +1,319 @@
+"""
+Drug interaction checks for prescriptions, answered from memory.
+
+All DrugInteraction rows are loaded once into a dict keyed by the normalized,
+order-independent pair of names ("aspirin", "warfarin"), so checking a
+prescription is a handful of dict lookups per medicine pair, plus one query for
+the descriptions of whatever was found.
+Names are normalized to their ingredient-ish part ("Warfarin 5mg Tablet" ->
+"warfarin"), and DRUG_INTERACTION_ALIASES maps brand names to ingredients
+({"panadol": ["paracetamol"]}) so a brand on the prescription still hits an
+interaction recorded under its ingredient.
+
+The table is reloaded in this process as soon as a DrugInteraction is saved or
+deleted (see signals.py), and every INTERACTION_RELOAD_SECONDS otherwise, which
+bounds how long other worker processes can run on an old copy.
+"""
+import csv
+import gzip
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from itertools import combinations
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+
+from .models import DrugInteraction
+
+DEFAULT_RELOAD_SECONDS = 60
+IMPORT_BATCH_SIZE = 5000
+# Interactions at or above this rank leave the prescription unvalidated
+BLOCKING_RANK = 3
+SEVERITY_RANKS = {
+    'contraindicated': 4,
+    'severe': 3, 'major': 3, 'high': 3,
+    'moderate': 2, 'medium': 2,
+    'mild': 1, 'minor': 1, 'low': 1,
+}
+
+FORM_WORDS = frozenset(
+    'tablet tablets tab capsule capsules cap syrup suspension injection infusion drops cream gel ointment '
+    'lotion solution powder spray inhaler sachet'.split()
+)
+_parenthetical = re.compile(r'\([^)]*\)')
+_token = re.compile(r'[a-z][a-z0-9]*|\d[\w.%/]*')
+
+
+def normalize_drug(name):
+    """Lower-cased name words up to the first strength or dosage form: "Warfarin 5mg Tablet" -> "warfarin"."""
+    words = []
+    for token in _token.findall(_parenthetical.sub(' ', str(name)).lower()):
+        if token[0].isdigit() or token in FORM_WORDS:
+            break
+        words.append(token)
+    return ' '.join(words)
+
+
+def pair_key(a, b):
+    return (a, b) if a <= b else (b, a)
+
+
+def severity_rank(severity):
+    return SEVERITY_RANKS.get(str(severity or '').strip().lower(), 0)
+
+
+class InteractionChecker:
+    def __init__(self, rows=(), aliases=None):
+        """
+        `rows` are (id, drug1_name, drug2_name, severity) tuples. Only the severity and
+        id of each pair are kept; descriptions stay in the database until a pair is hit
+        (see describe()), which keeps a few million pairs affordable in memory.
+        """
+        self.pairs = {}
+        normalized = {}  # raw name -> normalized, so repeated names share one string
+        severities = {}
+        for pk, drug1, drug2, severity in rows:
+            a = normalized.get(drug1)
+            if a is None:
+                a = normalized[drug1] = normalize_drug(drug1)
+            b = normalized.get(drug2)
+            if b is None:
+                b = normalized[drug2] = normalize_drug(drug2)
+            if not a or not b or a == b:
+                continue
+            key = pair_key(a, b)
+            severity = severities.setdefault(severity, severity or 'Unknown')
+            entry = (severity_rank(severity), severity, pk)
+            # The same pair can be recorded more than once (different spellings); keep the worst
+            if key not in self.pairs or entry[0] > self.pairs[key][0]:
+                self.pairs[key] = entry
+        self.aliases = {
+            normalize_drug(name): {normalize_drug(ingredient) for ingredient in ingredients}
+            for name, ingredients in (aliases or {}).items()
+        }
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def ingredients(self, name):
+        key = normalize_drug(name)
+        return {key} | self.aliases.get(key, set()) if key else set()
+
+    def check(self, medicine_names):
+        """
+        Every known interaction between two different medicines in the list, worst
+        first: [{'medicines': (name, name), 'severity', 'rank', 'id'}].
+        """
+        medicines = list(dict.fromkeys(medicine_names))
+        ingredients = [self.ingredients(name) for name in medicines]
+        found = {}
+        for i, j in combinations(range(len(medicines)), 2):
+            for a in ingredients[i]:
+                for b in ingredients[j]:
+                    entry = self.pairs.get(pair_key(a, b))
+                    if entry is None:
+                        continue
+                    # A brand with several ingredients can hit more than once; report the worst
+                    previous = found.get((i, j))
+                    if previous is None or entry[0] > previous['rank']:
+                        found[(i, j)] = {'medicines': (medicines[i], medicines[j]), 'rank': entry[0],
+                                         'severity': entry[1], 'id': entry[2]}
+        return sorted(found.values(), key=lambda hit: (-hit['rank'], hit['medicines']))
+
+
+def describe(hits):
+    """Fill in each hit's 'description' with one query (only the hit pairs are fetched)."""
+    if hits:
+        descriptions = dict(
+            DrugInteraction.objects.filter(pk__in=[hit['id'] for hit in hits])
+            .values_list('pk', 'interaction_description')
+        )
+        for hit in hits:
+            hit['description'] = descriptions.get(hit['id'], '')
+    return hits
+
+
+_checker = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def get_checker():
+    """This process's checker, (re)loaded with one query when it is missing or older than the reload interval."""
+    global _checker, _loaded_at
+    ttl = getattr(settings, 'INTERACTION_RELOAD_SECONDS', DEFAULT_RELOAD_SECONDS)
+    if _checker is None or time.monotonic() - _loaded_at > ttl:
+        with _lock:
+            if _checker is None or time.monotonic() - _loaded_at > ttl:
+                # order_by(): the model's default severity ordering would sort the whole table for nothing
+                rows = DrugInteraction.objects.order_by().values_list(
+                    'pk', 'drug1_name', 'drug2_name', 'severity'
+                ).iterator(chunk_size=10000)
+                _checker = InteractionChecker(rows, getattr(settings, 'DRUG_INTERACTION_ALIASES', {}))
+                _loaded_at = time.monotonic()
+    return _checker
+
+
+def invalidate_interactions():
+    """Reload the table on next use, once the current transaction commits."""
+    def forget():
+        global _checker
+        _checker = None
+
+    transaction.on_commit(forget)
+
+
+def format_warning(hits):
+    """One line per interaction for Prescription.interaction_warning, or None if there are none."""
+    if not hits:
+        return None
+    return '\n'.join(
+        f"{hit['severity']}: {hit['medicines'][0]} + {hit['medicines'][1]} - {hit['description']}" for hit in hits
+    )
+
+
+def validate_prescription(prescription, save=True):
+    """
+    Check a prescription's medicines against each other and record the result:
+    interaction_warning lists what was found, and is_validated is False if any
+    interaction is severe (BLOCKING_RANK) or worse. Returns the interactions.
+    """
+    names = prescription.items.values_list('medicine__name', flat=True) if prescription.pk else []
+    hits = describe(get_checker().check(names))
+    prescription.interaction_warning = format_warning(hits)
+    prescription.is_validated = not any(hit['rank'] >= BLOCKING_RANK for hit in hits)
+    if save:
+        prescription.save(update_fields=['interaction_warning', 'is_validated'])
+    return hits
+
+
+# Header names public interaction datasets use for each column, tried in order (case-insensitive)
+IMPORT_COLUMNS = {
+    'drug1': ('drug1_name', 'drug1', 'drug_a', 'drug 1', 'drug1 name'),
+    'drug2': ('drug2_name', 'drug2', 'drug_b', 'drug 2', 'drug2 name'),
+    'description': ('interaction_description', 'description', 'interaction', 'effect'),
+    'severity': ('severity', 'level', 'risk'),
+}
+
+
+def read_interaction_rows(path, columns=None):
+    """
+    Streams (drug1, drug2, description, severity) from a CSV (or .csv.gz) file, one
+    row at a time. `columns` overrides the header names in IMPORT_COLUMNS; the
+    description and severity columns are optional. The header is checked here,
+    before anything is read (or deleted), rather than on the first row.
+    """
+    opener = gzip.open if str(path).endswith('.gz') else open
+    f = opener(path, 'rt', newline='', encoding='utf-8')
+    try:
+        reader = csv.reader(f)
+        header = [name.strip().lower() for name in next(reader, [])]
+        positions = {}
+        for field, candidates in IMPORT_COLUMNS.items():
+            wanted = [columns[field]] if columns and columns.get(field) else candidates
+            positions[field] = next((header.index(name.lower()) for name in wanted if name.lower() in header), None)
+        missing = [field for field in ('drug1', 'drug2') if positions[field] is None]
+        if missing:
+            raise ValueError(f"{path} has no {' or '.join(missing)} column (header: {', '.join(header)})")
+    except BaseException:
+        f.close()
+        raise
+    return _stream_rows(f, reader, [positions[field] for field in IMPORT_COLUMNS])
+
+
+def _stream_rows(f, reader, positions):
+    with f:
+        for row in reader:
+            yield tuple(row[i] if i is not None and i < len(row) else '' for i in positions)
+
+
+def import_interactions(rows, batch_size=IMPORT_BATCH_SIZE, replace=False):
+    """
+    Bulk-loads (drug1, drug2, description, severity) rows into DrugInteraction.
+
+    Names are whitespace-cleaned and every spelling of a name (ignoring case) is
+    stored as the first one seen, so a pair always comes out the same way round.
+    Duplicates are dropped in memory within a batch (keeping the most severe) and
+    by the unique pair in the database across batches and earlier imports, so
+    memory stays at one batch plus the distinct drug names whatever the file size.
+    Names already in the table are the first spellings seen, so re-importing a pair
+    in a different case adds nothing.
+
+    With replace=True the delete and the whole load run in one transaction: a file
+    that fails part-way leaves the old interactions in place. Otherwise each batch
+    commits on its own.
+    Returns counts: read, skipped, duplicates, inserted.
+    """
+    table = DrugInteraction._meta.db_table
+    field_max = {f: DrugInteraction._meta.get_field(f).max_length for f in ('drug1_name', 'severity')}
+    stats = Counter(read=0, skipped=0, duplicates=0, inserted=0)
+    spellings = {}
+    batch = {}
+
+    def clean(value):
+        return ' '.join(str(value or '').split())
+
+    def spelling(name):
+        name = clean(name)
+        return spellings.setdefault(name.casefold(), name) if name else ''
+
+    def count():
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
+
+    # bulk_create(ignore_conflicts=True) spends most of its time building model instances and SQL;
+    # one parameterized INSERT ... ignore-conflicts statement run over the batch is several times faster
+    fields = [DrugInteraction._meta.get_field(name) for name in
+              ('drug1_name', 'drug2_name', 'interaction_description', 'severity')]
+    insert = ' '.join(filter(None, [
+        connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+        f"{connection.ops.quote_name(table)} ({', '.join(connection.ops.quote_name(f.column) for f in fields)})",
+        f"VALUES ({', '.join(['%s'] * len(fields))})",
+        connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None),
+    ]))
+
+    def flush():
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(insert, list(batch.values()))
+        batch.clear()
+
+    with transaction.atomic() if replace else nullcontext():
+        if replace:
+            # Raw DELETE: a queryset delete() would fetch every row to send post_delete signals
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(table)}')
+        else:
+            stored = DrugInteraction.objects.order_by()
+            for name in stored.values_list('drug1_name', flat=True).union(
+                stored.values_list('drug2_name', flat=True)
+            ).order_by('drug1_name').iterator():
+                spellings.setdefault(clean(name).casefold(), name)
+        before = count()
+
+        for drug1, drug2, description, severity in rows:
+            stats['read'] += 1
+            a, b = sorted((spelling(drug1), spelling(drug2)))
+            if not a or a == b or max(len(a), len(b)) > field_max['drug1_name']:
+                stats['skipped'] += 1
+                continue
+            severity = clean(severity)[:field_max['severity']].title() or None
+            previous = batch.get((a, b))
+            if previous is not None and severity_rank(severity) <= severity_rank(previous[3]):
+                continue
+            batch[(a, b)] = (a, b, clean(description), severity)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        stats['inserted'] = count() - before
+    # Whatever was neither skipped nor inserted repeated a pair (in the file or already in the table)
+    stats['duplicates'] = stats['read'] - stats['skipped'] - stats['inserted']
+    # Raw inserts send no signals, so drop the checker's copy here
+    invalidate_interactions()
+    return dict(stats)
@@ -0,0 +1,84 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prescriptions.recommender import artifact_dir, current_version, list_versions
+from prescriptions.recommender_benchmark import compare_versions, load_engine, make_workload, run_benchmark
+
+
+def _mb(size):
+    return f'{size / 1024 / 1024:.1f} MB'
+
+
+class Command(BaseCommand):
+    help = ('Replays a workload of sampled and misspelled drug names against the recommender artifacts and '
+            'reports latency percentiles, load time, memory, name-match hit rate and overlap with another version.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Artifact directory (defaults to RECOMMENDER_ARTIFACT_DIR)')
+        parser.add_argument('--artifact-version', default=None, help='Version to benchmark (defaults to the live one)')
+        parser.add_argument('--compare', default='previous',
+                            help='Version to compare recommendations with ("previous", a version name or "none")')
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--misspell-rate', type=float, default=0.3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('-k', type=int, default=5, help='Recommendations per query')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        root = options['output'] or artifact_dir()
+        versions = list_versions(root) if os.path.isdir(root) else []
+        version = options['artifact_version'] or current_version(root)
+        try:
+            engine, load = load_engine(os.path.join(root, version) if version else root)
+        except ValueError as e:
+            raise CommandError(f'Could not load the recommender artifacts: {e}')
+
+        workload = make_workload(engine.names, options['queries'], options['misspell_rate'], options['seed'])
+        report = {'load': load, 'benchmark': run_benchmark(engine, workload, options['k'])}
+
+        other = options['compare']
+        if other == 'previous':
+            older = [v for v in versions if version and v < version]
+            other = older[-1] if older else None
+        if other and other != 'none':
+            if other not in versions:
+                raise CommandError(f'No artifact version {other} in {root}')
+            other_engine, other_load = load_engine(os.path.join(root, other))
+            report['comparison'] = {
+                'version': other,
+                'load': other_load,
+                **compare_versions(engine, other_engine, workload, options['k']),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.print_report(report, options['k'])
+
+    def print_report(self, report, k):
+        load, bench = report['load'], report['benchmark']
+        self.stdout.write(f"Version {load['version']}: {load['medicines']} medicines, "
+                          f"{_mb(load['artifact_bytes'])} of artifacts")
+        self.stdout.write(f"  load {load['load_seconds'] * 1000:.1f} ms, RSS {_mb(load['rss_bytes'])} "
+                          f"(+{_mb(load['rss_added_bytes'])})")
+        for label, key in (('recommend (cold cache)', 'latency_ms'), ('recommend (warm cache)', 'cached_latency_ms'),
+                           ('symptom search', 'symptom_search_ms')):
+            latency = bench[key]
+            if latency:
+                self.stdout.write(f"  {label}: p50 {latency['p50']:.3f} ms, p95 {latency['p95']:.3f} ms, "
+                                  f"p99 {latency['p99']:.3f} ms, max {latency['max']:.3f} ms")
+        self.stdout.write(f"  {bench['queries']} queries, {bench['queries_per_second']:.0f}/s")
+
+        def pct(value):
+            return 'n/a' if value is None else f'{value:.1%}'
+
+        self.stdout.write(f"  name hit rate {pct(bench['hit_rate'])} (clean {pct(bench['hit_rate_clean'])}, "
+                          f"misspelled {pct(bench['hit_rate_misspelled'])}), no match {pct(bench['no_match_rate'])}")
+        comparison = report.get('comparison')
+        if comparison:
+            self.stdout.write(f"Compared with {comparison['version']} over {comparison['compared_queries']} queries: "
+                              f"overlap@{k} {pct(comparison['mean_overlap_at_k'])}, "
+                              f"identical {pct(comparison['identical_rate'])}")
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
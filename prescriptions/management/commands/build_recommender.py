@@ -0,0 +1,63 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prescriptions.recommender import DEFAULT_NEIGHBOURS, KEEP_VERSIONS, RecommenderEngine, artifact_dir
+from prescriptions.recommender_build import TfidfMatrix, cosine_neighbours, read_medicines
+from prescriptions.substitutes import build_medicine_links, publish_with_stock_links
+from prescriptions.symptom_index import build_symptom_index
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+
+
+class Command(BaseCommand):
+    help = ('Builds the recommender artifacts from medicine.csv (TF-IDF of Drug_Name/Reason/Description, '
+            'top-k cosine neighbours, symptom search index) and publishes them as a new version that '
+            'running servers pick up.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=os.path.join(DATA_DIR, 'medicine.csv'))
+        parser.add_argument('--neighbours', type=int, default=DEFAULT_NEIGHBOURS, help='Neighbours kept per medicine')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes scoring row blocks (1 = no pool)')
+        parser.add_argument('--output', default=None, help='Artifact directory (defaults to RECOMMENDER_ARTIFACT_DIR)')
+        parser.add_argument('--keep', type=int, default=KEEP_VERSIONS, help='Versions to keep on disk')
+        parser.add_argument('--links-only', action='store_true',
+                            help='Only re-match the live version against local Medicine batches (after stock changes)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['links_only']:
+            engine = RecommenderEngine(options['output'])
+            if not engine.is_ready:
+                raise CommandError(f'No recommender artifacts to link: {engine.error}')
+            artifacts = engine.artifacts  # names and version from the same load
+            if artifacts.version is None:
+                raise CommandError('The artifacts are not versioned; run build_recommender without --links-only first')
+            links = build_medicine_links(artifacts.names, artifacts.version)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {links} links to local medicine batches for {artifacts.version}'))
+            return
+
+        try:
+            names, reasons, descriptions = read_medicines(options['csv'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        if len(names) < 2:
+            raise CommandError(f"{options['csv']} needs at least two medicines")
+
+        matrix = TfidfMatrix(
+            f'{name} {reason} {description}' for name, reason, description in zip(names, reasons, descriptions)
+        )
+        self.stdout.write(f'{len(names)} medicines, {matrix.shape[1]} terms, {matrix.nnz} non-zeros')
+        ids, scores = cosine_neighbours(matrix, options['neighbours'], workers=options['workers'])
+
+        output = options['output'] or artifact_dir()
+        symptom_index = build_symptom_index(reasons, descriptions)
+        version, links = publish_with_stock_links(
+            names, ids, scores, output, keep=max(options['keep'], 1), extra=symptom_index
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Published recommender version {version} to {output} in {time.perf_counter() - started:.1f}s '
+            f'({links} links to local medicine batches)'
+        ))
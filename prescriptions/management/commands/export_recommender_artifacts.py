@@ -0,0 +1,48 @@
+import os
+import pickle
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prescriptions.recommender import DEFAULT_NEIGHBOURS, artifact_dir, top_k_neighbours
+from prescriptions.substitutes import publish_with_stock_links
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+
+
+def load_pickle(path):
+    with open(path, 'rb') as f:
+        if f.read(40).startswith(b'version https://git-lfs'):
+            raise CommandError(f'{path} is a Git LFS pointer, run "git lfs pull" to fetch the real file first')
+        f.seek(0)
+        return pickle.load(f)
+
+
+class Command(BaseCommand):
+    help = 'Converts the recommender pickles (medicines.pkl, similarity.pkl) into the memory-mappable top-k neighbour artifacts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicines', default=os.path.join(DATA_DIR, 'medicines.pkl'))
+        parser.add_argument('--similarity', default=os.path.join(DATA_DIR, 'similarity.pkl'))
+        parser.add_argument('--neighbours', type=int, default=DEFAULT_NEIGHBOURS, help='Neighbours kept per medicine')
+        parser.add_argument('--output', default=None, help='Artifact directory (defaults to RECOMMENDER_ARTIFACT_DIR)')
+
+    def handle(self, *args, **options):
+        medicines = load_pickle(options['medicines'])
+        # medicines.pkl is either a DataFrame or its to_dict() form ({column: {row: value}})
+        if isinstance(medicines, dict):
+            drug_names = medicines['Drug_Name']
+            names = [drug_names[i] for i in sorted(drug_names)]
+        else:
+            names = medicines['Drug_Name'].astype(str).tolist()
+        if len(names) < 2:
+            raise CommandError(f"{options['medicines']} needs at least two medicines")
+
+        similarity = load_pickle(options['similarity'])
+        output = options['output'] or artifact_dir()
+        if similarity.shape != (len(names), len(names)):
+            raise CommandError(f"similarity is {similarity.shape}, expected ({len(names)}, {len(names)})")
+        version, links = publish_with_stock_links(names, *top_k_neighbours(similarity, options['neighbours']), output)
+        self.stdout.write(self.style.SUCCESS(
+            f'Published recommender version {version} for {len(names)} medicines to {output} '
+            f'({links} links to local medicine batches)'
+        ))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prescriptions.interactions import IMPORT_BATCH_SIZE, import_interactions, read_interaction_rows
+
+
+class Command(BaseCommand):
+    help = ('Bulk-loads drug interaction pairs from a CSV (or .csv.gz) file into DrugInteraction, streaming '
+            'the file, storing each pair one way round and skipping pairs that are already there.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with drug1/drug2 columns and optional description/severity')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows per insert batch')
+        parser.add_argument('--replace', action='store_true', help='Delete every existing interaction first')
+        parser.add_argument('--drug1-column', help='Header of the first drug column (default: guessed)')
+        parser.add_argument('--drug2-column', help='Header of the second drug column (default: guessed)')
+        parser.add_argument('--description-column', help='Header of the description column (default: guessed)')
+        parser.add_argument('--severity-column', help='Header of the severity column (default: guessed)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        columns = {field: options[f'{field}_column'] for field in ('drug1', 'drug2', 'description', 'severity')}
+        try:
+            stats = import_interactions(
+                read_interaction_rows(options['path'], columns),
+                batch_size=max(options['batch_size'], 1),
+                replace=options['replace'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {stats['inserted']} new interactions from {stats['read']} rows in "
+            f"{time.perf_counter() - started:.1f}s ({stats['duplicates']} duplicates, {stats['skipped']} skipped)"
+        ))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Medicine_inventory', '0005_image_digest'),
+        ('prescriptions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommenderMedicineLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64)),
+                ('drug_row', models.PositiveIntegerField()),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommender_links', to='Medicine_inventory.medicine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['version', 'drug_row'], name='prescriptio_version_55e314_idx')],
+                'unique_together': {('version', 'drug_row', 'medicine')},
+            },
+        ),
+    ]
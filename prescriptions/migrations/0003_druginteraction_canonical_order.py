@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:50
+
+from django.db import migrations, models
+
+
+def canonicalize_pairs(apps, schema_editor):
+    # Turn B + A rows into A + B before the check constraint goes on; if A + B is already there, B + A is a duplicate
+    DrugInteraction = apps.get_model('prescriptions', 'DrugInteraction')
+    for row in DrugInteraction.objects.filter(drug1_name__gt=models.F('drug2_name')).iterator():
+        if DrugInteraction.objects.filter(drug1_name=row.drug2_name, drug2_name=row.drug1_name).exists():
+            row.delete()
+        else:
+            row.drug1_name, row.drug2_name = row.drug2_name, row.drug1_name
+            row.save(update_fields=['drug1_name', 'drug2_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0002_recommendermedicinelink'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='druginteraction',
+            unique_together={('drug1_name', 'drug2_name')},
+        ),
+        migrations.RunPython(canonicalize_pairs, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='druginteraction',
+            index=models.Index(fields=['drug2_name', 'drug1_name'], name='druginteraction_drug2_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='druginteraction',
+            constraint=models.CheckConstraint(condition=models.Q(('drug1_name__lte', models.F('drug2_name'))), name='druginteraction_canonical_order'),
+        ),
+    ]
@@ -52,9 +52,10 @@ class Prescription(models.Model):
     # Optional notes for the prescription, e.g., general instructions.
     notes = models.TextField(blank=True, null=True)
     # Field to indicate if the prescription has been validated for drug interactions.
-    # Default is False. This will be updated by the Deep Learning model later.
+    # Default is False. Set by interactions.validate_prescription() whenever the items change
+    # (stays False while a severe interaction is on the prescription).
     is_validated = models.BooleanField(default=False)
-    # Field to store potential interaction warnings from the Deep Learning model.
+    # Field to store potential interaction warnings, one line per interacting pair.
     # This will be populated if drug interactions are detected.
     interaction_warning = models.TextField(blank=True, null=True)
     # New field to track if the prescription has been paid for.
@@ -135,12 +136,50 @@ class DrugInteraction(models.Model):
     severity = models.CharField(max_length=50, blank=True, null=True)
 
     class Meta:
-        # Ensures unique interactions, regardless of the order of drug names.
-        # (Drug A + Drug B is considered the same as Drug B + Drug A).
-        unique_together = (('drug1_name', 'drug2_name'), ('drug2_name', 'drug1_name'))
+        # Each pair is stored one way round (drug1_name <= drug2_name, see save()), so the
+        # unique pair plus the check constraint make Drug A + Drug B the same row as Drug B + Drug A.
+        unique_together = (('drug1_name', 'drug2_name'),)
+        constraints = [
+            models.CheckConstraint(condition=models.Q(drug1_name__lte=models.F('drug2_name')),
+                                   name='druginteraction_canonical_order'),
+        ]
+        # The unique pair index answers lookups by drug1_name; this one does the same for drug2_name
+        indexes = [models.Index(fields=['drug2_name', 'drug1_name'], name='druginteraction_drug2_idx')]
         # Orders interactions by severity for easier review.
         ordering = ['severity']
 
     def __str__(self):
         # String representation of the DrugInteraction object.
         return f"Interaction: {self.drug1_name} + {self.drug2_name} ({self.severity})"
+
+    def canonicalize(self):
+        # Put the pair in stored order (plain string order, the same as SQLite's default collation)
+        if self.drug1_name and self.drug2_name and self.drug1_name > self.drug2_name:
+            self.drug1_name, self.drug2_name = self.drug2_name, self.drug1_name
+
+    def clean(self):
+        # Runs before the unique/constraint checks in admin forms, so B + A is caught as a duplicate of A + B
+        self.canonicalize()
+
+    def save(self, *args, **kwargs):
+        self.canonicalize()
+        super().save(*args, **kwargs)
+
+
+# Links a row of the recommender's medicine list (medicine.csv) to our own Medicine batches,
+# so recommendations can say what is actually on the shelf.
+# Rebuilt by build_recommender for each artifact version (matched on normalized names).
+class RecommenderMedicineLink(models.Model):
+    # The artifact version the row number belongs to (see recommender.current_version).
+    version = models.CharField(max_length=64)
+    # Row of the medicine in that version's name list.
+    drug_row = models.PositiveIntegerField()
+    # The local batch it was matched to.
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='recommender_links')
+
+    class Meta:
+        unique_together = ('version', 'drug_row', 'medicine')
+        indexes = [models.Index(fields=['version', 'drug_row'])]
+
+    def __str__(self):
+        return f"Recommender row {self.drug_row} ({self.version}) -> {self.medicine}"
@@ -0,0 +1,111 @@
+"""
+Fuzzy drug-name lookup for the recommender.
+
+difflib.get_close_matches compares the query against every name. Instead we
+index the character trigrams of each (normalized) name once, count shared
+trigrams for the query with a single bincount over the posting lists, and only
+rescore the best few candidates with SequenceMatcher. That is the same ratio
+get_close_matches uses, so the cutoff means the same thing. Exact names
+resolve through a plain dict, and recent queries are answered from an LRU.
+"""
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import numpy as np
+
+NGRAM = 3
+MATCH_CUTOFF = 0.6
+CANDIDATES = 12  # names rescored per query
+QUERY_GRAMS = 8  # rarest query trigrams used to find candidates
+MATCH_CACHE_SIZE = 4096
+
+_spaces = re.compile(r'\s+')
+
+
+def normalize(name):
+    return _spaces.sub(' ', str(name)).strip().lower()
+
+
+def ngrams(text, n=NGRAM):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def encode_names(names):
+    """Names -> (uint8 UTF-8 blob, int64 offsets) as stored in name_data/name_offsets."""
+    encoded = [str(name).encode('utf-8') for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def decode_names(data, offsets):
+    blob = data.tobytes()
+    return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+class NameIndex:
+    def __init__(self, names, cutoff=MATCH_CUTOFF, candidates=CANDIDATES, cache_size=MATCH_CACHE_SIZE):
+        self.cutoff = cutoff
+        self.candidates = candidates
+        # One entry per distinct normalized name; rows keeps the first row it came from
+        self.row_by_name = {}
+        for row, name in enumerate(names):
+            self.row_by_name.setdefault(normalize(name), row)
+        self.keys = list(self.row_by_name)
+        self.rows = np.fromiter(self.row_by_name.values(), dtype=np.int64, count=len(self.keys))
+
+        postings = {}
+        for key_id, key in enumerate(self.keys):
+            for gram in ngrams(key):
+                postings.setdefault(gram, []).append(key_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidate_ids(self, query):
+        """Ids of the names sharing the most trigrams with `query` (best first)."""
+        lists = sorted((self.postings[g] for g in ngrams(query) if g in self.postings), key=len)
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        # A close match shares most of the query's trigrams, so it shows up in the rarest few;
+        # counting only those keeps the work proportional to short posting lists
+        ids = np.concatenate(lists[:QUERY_GRAMS])
+        if len(ids) * 8 < len(self.keys):
+            hits, counts = np.unique(ids, return_counts=True)  # sorting a few ids beats a full-size bincount
+        else:
+            counts = np.bincount(ids, minlength=len(self.keys))
+            hits = np.flatnonzero(counts)
+            counts = counts[hits]
+        if len(hits) > self.candidates:
+            # Counts are tiny integers with lots of ties, which argpartition handles badly;
+            # find the lowest count that still makes the cut from a histogram instead
+            at_least = np.cumsum(np.bincount(counts)[::-1])[::-1]
+            threshold = np.flatnonzero(at_least >= self.candidates)[-1]
+            keep = counts >= threshold
+            hits, counts = hits[keep], counts[keep]
+        return hits[np.argsort(-counts, kind='stable')][:self.candidates]
+
+    def _match(self, query):
+        query = normalize(query)
+        if query in self.row_by_name:
+            return self.row_by_name[query], 1.0
+        matcher = SequenceMatcher()
+        matcher.set_seq2(query)
+        best = (None, self.cutoff)
+        for key_id in self.candidate_ids(query):
+            matcher.set_seq1(self.keys[key_id])
+            # Cheap upper bounds first, like get_close_matches
+            if (matcher.real_quick_ratio() >= best[1] and matcher.quick_ratio() >= best[1]):
+                score = matcher.ratio()
+                if score > best[1] or (score == best[1] and best[0] is None):
+                    best = (int(self.rows[key_id]), score)
+        return best if best[0] is not None else (None, 0.0)
+
+    def best_row(self, query):
+        """Row of the closest name (ratio >= cutoff), or None."""
+        return self.match(query)[0]
@@ -58,4 +58,7 @@ urlpatterns = [
     # For now, it's primarily managed via Django Admin or by the DL model.
     
     path('recommend/', views.recommendation_test_view, name='recommendation_test'),
+    path('recommend/status/', views.recommender_status, name='recommender_status'),
+    path('recommend/batch/', views.batch_recommendations, name='batch_recommendations'),
+    path('recommend/search/', views.symptom_search, name='symptom_search'),
 ]
@@ -1,117 +1,399 @@
-import pickle
-import pandas as pd
-from difflib import get_close_matches
+"""
+Alternative-medicine recommendations from precomputed nearest neighbours.
+
+Nothing is loaded at import time. The engine opens its artifacts on first use
+(get_engine().recommend(...)) from .npy files in a version directory under
+RECOMMENDER_ARTIFACT_DIR, named by the CURRENT file next to it:
+
+    name_data.npy         every Drug_Name, UTF-8 encoded and concatenated (uint8)
+    name_offsets.npy      where each name starts/ends in name_data (int64, n + 1)
+    neighbour_ids.npy     each medicine's top-k most similar rows, best first (int32, n x k)
+    neighbour_scores.npy  the matching similarity scores (float32, n x k)
+    symptom_*.npy         the Reason/Description search index, if built from medicine.csv (see symptom_index.py)
+
+Only the top-k neighbours are kept (picked offline with argpartition by
+top_k_neighbours), so serving a recommendation is a slice of one row instead
+of sorting a full similarity row, and memory is O(n k) instead of O(n^2).
+The files are opened with mmap_mode='r', so pre-forked workers share the pages
+from the OS page cache instead of each holding a private copy.
+
+Each build is written to a new version directory and published by swapping
+CURRENT atomically. Running engines check CURRENT every RELOAD_CHECK_SECONDS
+and switch to the new version without a restart. `build_recommender` builds
+the artifacts from medicine.csv; `export_recommender_artifacts` converts the
+old pickles (medicines.pkl / similarity.pkl). Name lookups go through a
+trigram index built at load time (see name_index.py).
+"""
 import os
+import resource
+import shutil
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
 
-# --- Data Loading (Crucial Section for Fix) ---
-# NOTE: Please verify the paths ('new_data.pkl', 'similarity.pkl') are correct 
-# relative to where recommender.py is located.
-
-new_data = pd.DataFrame()
-similarity = None
-IS_READY = False
-
-try:
-    # Get the directory of the current script
-    base_dir = os.path.dirname(__file__)
-    # CORRECTED: Join with 'data' subdirectory for correct path
-    data_path = os.path.join(base_dir, 'data', 'medicines.pkl')
-    similarity_path = os.path.join(base_dir, 'data', 'similarity.pkl')
-
-    with open(data_path, 'rb') as f:
-        data_obj = pickle.load(f)
-    
-    # FIX: Check if the loaded object is a dictionary and convert it to a DataFrame.
-    # This prevents the 'dict' object has no attribute 'astype' error.
-    if isinstance(data_obj, dict):
-        new_data = pd.DataFrame(data_obj)
-        print("INFO: Loaded dictionary data was successfully coerced into a DataFrame.")
-    elif isinstance(data_obj, pd.DataFrame):
-        new_data = data_obj
-    else:
-        # Fallback for unexpected types
-        new_data = pd.DataFrame(data_obj)
-        print(f"WARNING: Loaded data object type ({type(data_obj)}) was unexpected. Coerced to DataFrame.")
-
-
-    with open(similarity_path, 'rb') as f:
-        similarity = pickle.load(f)
-
-    IS_READY = True
-    
-except FileNotFoundError:
-    print("ERROR: Data files (new_data.pkl or similarity.pkl) not found. Recommendation service disabled.")
-except Exception as e:
-    print(f"ERROR during data loading for recommender: {e}")
-
-# --- Recommender Function ---
+import numpy as np
+from django.conf import settings
 
-def get_recommendations(medicine_name, k=5):
+from .name_index import NameIndex, decode_names, encode_names
+from .symptom_index import SYMPTOM_FILES, SymptomIndex
+
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(__file__), 'data', 'recommender')
+CURRENT_FILE = 'CURRENT'
+NAME_DATA_FILE = 'name_data.npy'
+NAME_OFFSETS_FILE = 'name_offsets.npy'
+NEIGHBOUR_IDS_FILE = 'neighbour_ids.npy'
+NEIGHBOUR_SCORES_FILE = 'neighbour_scores.npy'
+ARTIFACT_FILES = (NAME_DATA_FILE, NAME_OFFSETS_FILE, NEIGHBOUR_IDS_FILE, NEIGHBOUR_SCORES_FILE)
+# Neighbours kept per medicine; recommend() can return at most this many
+DEFAULT_NEIGHBOURS = 50
+# A failed load (artifacts not built yet) is retried after this many seconds
+LOAD_RETRY_SECONDS = 60
+# How often a loaded engine looks at CURRENT for a newer version
+RELOAD_CHECK_SECONDS = 5
+# Old versions left on disk after publishing (workers may still have them mapped)
+KEEP_VERSIONS = 3
+
+
+def artifact_dir():
+    return getattr(settings, 'RECOMMENDER_ARTIFACT_DIR', DEFAULT_ARTIFACT_DIR)
+
+
+def _dense_rows(block):
+    return block.toarray() if hasattr(block, 'toarray') else block
+
+
+def top_k_rows(block, start, k):
+    """
+    Top k columns of each row of a float32 score block whose first row is row
+    `start` of the full matrix, as (ids int32, scores float32) sorted best
+    first (ties by column id). Modifies `block`.
+    """
+    rows = np.arange(len(block))
+    block[rows, rows + start] = -np.inf  # a medicine is not its own alternative
+    top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(block, top, axis=1)
+    order = np.lexsort((top, -top_scores), axis=1)
+    return (np.take_along_axis(top, order, axis=1).astype(np.int32),
+            np.take_along_axis(top_scores, order, axis=1))
+
+
+def top_k_neighbours(similarity, k=DEFAULT_NEIGHBOURS, chunk_rows=512):
+    """
+    Each row's k highest-scoring other rows, as (ids int32, scores float32),
+    both n x k and sorted best first (ties by row id). `similarity` can be a
+    dense array, a memmap or a scipy sparse matrix; it is read a block of rows
+    at a time, and argpartition keeps the selection O(n) per row.
+    """
+    n = similarity.shape[0]
+    k = min(k, n - 1)
+    ids = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float32)
+    for start in range(0, n, chunk_rows):
+        block = np.array(_dense_rows(similarity[start:start + chunk_rows]), dtype=np.float32)
+        ids[start:start + len(block)], scores[start:start + len(block)] = top_k_rows(block, start, k)
+    return ids, scores
+
+
+def current_version(root):
+    """The published version's directory name under `root`, or None if nothing was published."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def new_version():
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+
+
+def list_versions(root):
+    """Version directories under `root`, oldest first."""
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.startswith('.') and os.path.isfile(os.path.join(root, name, NAME_DATA_FILE))
+    )
+
+
+def publish_artifacts(names, neighbour_ids, neighbour_scores, root=None, keep=KEEP_VERSIONS, version=None,
+                      extra=None):
+    """
+    Write a new artifact version under `root` and make it the live one. The
+    files go into a hidden staging directory that is renamed into place, then
+    CURRENT is replaced with os.replace, so a reader sees either the old
+    version or the new one, never a mix. `extra` ({filename: array}) is saved
+    alongside, e.g. the symptom index. Returns the version name.
+    """
+    root = root or artifact_dir()
+    name_data, name_offsets = encode_names(names)
+    n = len(name_offsets) - 1
+    if neighbour_ids.shape != neighbour_scores.shape or neighbour_ids.shape[0] != n:
+        raise ValueError(f"neighbour arrays are {neighbour_ids.shape}/{neighbour_scores.shape} for {n} names")
+
+    os.makedirs(root, exist_ok=True)
+    version = version or new_version()
+    staging = os.path.join(root, f".{version}.tmp")
+    os.makedirs(staging)
+    try:
+        for filename, array in (
+            (NAME_DATA_FILE, name_data),
+            (NAME_OFFSETS_FILE, name_offsets),
+            (NEIGHBOUR_IDS_FILE, np.ascontiguousarray(neighbour_ids, dtype=np.int32)),
+            (NEIGHBOUR_SCORES_FILE, np.ascontiguousarray(neighbour_scores, dtype=np.float32)),
+            *(extra or {}).items(),
+        ):
+            np.save(os.path.join(staging, filename), array)
+        os.rename(staging, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(root, f".{CURRENT_FILE}.tmp")
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+    prune_versions(root, keep)
+    return version
+
+
+def prune_versions(root, keep=KEEP_VERSIONS):
     """
-    Retrieves recommended medicines based on the input medicine name using 
-    a pre-calculated similarity matrix.
-    
-    :param medicine_name: The name of the medicine to find recommendations for.
-    :param k: The number of recommendations to return (default is 5).
-    :return: A list of dictionaries containing the recommended medicine name 
-             and its similarity score, or an empty list if data is not ready 
-             or no match is found.
+    Delete all but the newest `keep` versions (never the live one). Workers that
+    still have a deleted version mapped keep reading it until they reload.
     """
-    
-    # Ensure the engine is initialized and data is valid
-    if not IS_READY or new_data.empty or similarity is None:
-        print("ERROR: Recommendation engine is not initialized or data is missing.")
-        return []
-
-    # Validate the necessary column exists
-    if 'Drug_Name' not in new_data.columns:
-        print("ERROR: 'Drug_Name' column not found in data.")
-        return []
-
-    # Line 57 (Original location of error): Now this is safe because new_data is a DataFrame.
-    df_drugs = new_data['Drug_Name'].astype(str).tolist()
-    
-    # 1. Find the closest matching medicine name
-    closest_match = get_close_matches(medicine_name, df_drugs, n=1, cutoff=0.6)
-
-    if not closest_match:
-        print(f"INFO: No close match found for '{medicine_name}'.")
-        return []
-
-    medicine_match = closest_match[0]
-    
-    # 2. Get the index of the matching medicine
+    live = current_version(root)
+    versions = [name for name in list_versions(root) if name != live]
+    for name in versions[:max(len(versions) - (keep - 1), 0)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def write_artifacts(names, similarity, directory=None, k=DEFAULT_NEIGHBOURS):
+    """Publish names and the top-k neighbours of a dense `similarity` (n x n) matrix."""
+    n = len(names)
+    if similarity.shape != (n, n):
+        raise ValueError(f"similarity is {similarity.shape}, expected ({n}, {n})")
+    return publish_artifacts(names, *top_k_neighbours(similarity, k), root=directory)
+
+
+def memory_usage():
+    """This process's resident memory in bytes, split into anonymous and file-backed (shared) pages."""
+    usage = {'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
     try:
-        # Use .loc[] for reliable index lookup
-        index = new_data.loc[new_data['Drug_Name'] == medicine_match].index[0]
-    except IndexError:
-        print(f"ERROR: Could not find index for matched medicine: {medicine_match}")
-        return []
-    
-    # 3. Get similarity scores and sort
-    distances = similarity[index]
-    
-    # If the similarity is a sparse matrix row (e.g., from TfidfVectorizer output), 
-    # ensure it's converted to a dense array for sorting
-    if hasattr(distances, 'toarray'):
-         distances = distances.toarray()[0]
-        
-    # Create a list of (index, distance) tuples and sort (excluding the medicine itself)
-    med_list = sorted(list(enumerate(distances)), reverse=True, key=lambda x: x[1])[1:k+1] 
-
-    recommendations = []
-    
-    # 4. Extract recommended medicine names
-    for i in med_list:
-        recommended_index = i[0]
-        similarity_score = i[1]
-
-        # Use iloc to get the row by index and extract 'Drug_Name'
-        recommended_medicine = new_data.iloc[recommended_index]['Drug_Name']
-        
-        recommendations.append({
-            'name': recommended_medicine,
-            'similarity': float(similarity_score) 
-        })
-        
-    return recommendations
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'RssAnon', 'RssFile', 'RssShmem'):
+                    usage[key.lower()] = int(value.split()[0]) * 1024
+    except OSError:
+        pass  # not Linux; max_rss is all we get
+    return usage
+
+
+# Everything one loaded version serves from. A reload swaps the whole tuple in one
+# assignment, so a request that reads `engine.artifacts` once never mixes versions.
+Artifacts = namedtuple('Artifacts', 'version directory names name_index neighbour_ids neighbour_scores symptom_index')
+NO_ARTIFACTS = Artifacts(None, None, [], None, None, None, None)
+
+
+class RecommenderEngine:
+    def __init__(self, directory=None):
+        self.root = directory or artifact_dir()
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.error = None
+        self.artifacts = NO_ARTIFACTS
+        self.load_seconds = None
+        self.loaded_at = None
+        self.checked_at = None
+        self.published = None
+
+    version = property(lambda self: self.artifacts.version)
+    directory = property(lambda self: self.artifacts.directory)
+    names = property(lambda self: self.artifacts.names)
+    name_index = property(lambda self: self.artifacts.name_index)
+    neighbour_ids = property(lambda self: self.artifacts.neighbour_ids)
+    neighbour_scores = property(lambda self: self.artifacts.neighbour_scores)
+    symptom_index = property(lambda self: self.artifacts.symptom_index)
+
+    def _is_current(self):
+        if not self.loaded:
+            return False
+        now = time.time()
+        if self.error is not None and self.version is None:
+            return now - self.loaded_at < LOAD_RETRY_SECONDS
+        if now - self.checked_at >= RELOAD_CHECK_SECONDS:
+            # One small file read every few seconds tells us whether a build was published
+            self.checked_at = now
+            self.published = current_version(self.root)
+        return self.published == self.version
+
+    def load(self):
+        """
+        Open the live version's artifacts; later calls reuse them until a new
+        version is published, which is then loaded and swapped in. Requests
+        already running keep the arrays they started with.
+        """
+        if self._is_current():
+            return
+        with self._lock:
+            if self._is_current():
+                return
+            started = time.perf_counter()
+            version = current_version(self.root)
+            directory = os.path.join(self.root, version) if version else self.root
+
+            def open_array(filename):
+                return np.load(os.path.join(directory, filename), mmap_mode='r')
+
+            try:
+                names = decode_names(open_array(NAME_DATA_FILE), open_array(NAME_OFFSETS_FILE))
+                neighbour_ids = open_array(NEIGHBOUR_IDS_FILE)
+                neighbour_scores = open_array(NEIGHBOUR_SCORES_FILE)
+                if neighbour_ids.shape != neighbour_scores.shape or neighbour_ids.shape[0] != len(names):
+                    raise ValueError(
+                        f"neighbour arrays are {neighbour_ids.shape}/{neighbour_scores.shape} "
+                        f"but there are {len(names)} names"
+                    )
+                name_index = NameIndex(names)
+                if all(os.path.exists(os.path.join(directory, filename)) for filename in SYMPTOM_FILES):
+                    symptom_index = SymptomIndex({filename: open_array(filename) for filename in SYMPTOM_FILES})
+                    if len(symptom_index) != len(names):
+                        raise ValueError(f"symptom index has {len(symptom_index)} rows for {len(names)} names")
+                else:
+                    symptom_index = None  # built from the old pickles, which have no Reason column
+            except (OSError, ValueError) as e:
+                # A broken new version doesn't take down the one we're already serving
+                self.error = str(e)
+            else:
+                self.artifacts = Artifacts(
+                    version, directory, names, name_index, neighbour_ids, neighbour_scores, symptom_index
+                )
+                self.error = None
+            # If the new version was broken, keep the old one and retry at the next check
+            self.published = self.version
+            self.load_seconds = time.perf_counter() - started
+            self.loaded_at = self.checked_at = time.time()
+            self.loaded = True
+
+    @property
+    def is_ready(self):
+        self.load()
+        return self.name_index is not None
+
+    def find_index(self, medicine_name):
+        """Row index of the closest matching name, or None."""
+        return self.name_index.best_row(medicine_name)
+
+    def recommend(self, medicine_name, k=5):
+        """[{'row', 'name', 'similarity'}, ...] for the k medicines most similar to the best name match."""
+        if not self.is_ready:
+            return []
+        # One read of the artifacts, in case a reload swaps them meanwhile
+        _, _, names, name_index, neighbour_ids, neighbour_scores, _ = self.artifacts
+        index = name_index.best_row(medicine_name)
+        if index is None or index >= len(names):
+            return []
+        # Already sorted offline: an O(k) slice of one row
+        ids = neighbour_ids[index, :k].tolist()
+        scores = neighbour_scores[index, :k].tolist()
+        return [{'row': i, 'name': names[i], 'similarity': score} for i, score in zip(ids, scores)]
+
+    def recommend_many(self, medicine_names, k=5, timings=False):
+        """
+        recommend() for a list of names in one go. Names are matched one by one
+        (through the LRU), then every matched row's neighbours are gathered with
+        a single fancy-indexing read. Returns (results, version): one dict per
+        name, in order, {'query', 'match', 'score', 'recommendations'} (plus
+        'match_ms' with `timings`), and the version the rows came from, so
+        anything looked up afterwards (stock links) matches them even if a
+        reload lands in between.
+        """
+        if not self.is_ready:
+            return [{'query': name, 'match': None, 'score': 0.0, 'recommendations': []} for name in medicine_names], None
+        version, _, names, name_index, neighbour_ids, neighbour_scores, _ = self.artifacts
+
+        results, rows = [], []
+        for name in medicine_names:
+            started = time.perf_counter()
+            row, score = name_index.match(name)
+            result = {'query': name, 'match': names[row] if row is not None else None,
+                      'score': score, 'recommendations': []}
+            if timings:
+                result['match_ms'] = (time.perf_counter() - started) * 1000
+            results.append(result)
+            rows.append(row)
+
+        matched = [i for i, row in enumerate(rows) if row is not None]
+        if matched:
+            row_ids = np.array([rows[i] for i in matched], dtype=np.int64)
+            # One (m x k) gather from the mapped arrays instead of m separate slices
+            ids = neighbour_ids[row_ids, :k].tolist()
+            scores = neighbour_scores[row_ids, :k].tolist()
+            for i, row_neighbours, row_scores in zip(matched, ids, scores):
+                results[i]['recommendations'] = [
+                    {'row': j, 'name': names[j], 'similarity': score} for j, score in zip(row_neighbours, row_scores)
+                ]
+        return results, version
+
+    def search_symptoms(self, query, limit=10):
+        """
+        ([{'row', 'name', 'reason', 'score'}, ...], version) for the medicines best
+        matching a symptom/reason query, read from one version like recommend_many().
+        """
+        if not self.is_ready:
+            return [], None
+        version, _, names, _, _, _, symptom_index = self.artifacts
+        if symptom_index is None:
+            return [], version
+        return [
+            {'row': row, 'name': names[row], 'reason': symptom_index.reason(row), 'score': score}
+            for row, score in symptom_index.search(query, limit)
+        ], version
+
+    def status(self):
+        files = {}
+        for name in ARTIFACT_FILES + SYMPTOM_FILES:
+            try:
+                files[name] = os.path.getsize(os.path.join(self.directory or self.root, name))
+            except OSError:
+                files[name] = None
+        return {
+            'loaded': self.loaded,
+            'ready': self.name_index is not None,
+            'error': self.error,
+            'version': self.version,
+            'published_version': current_version(self.root),
+            'load_seconds': self.load_seconds,
+            'loaded_at': self.loaded_at,
+            'medicines': len(self.names),
+            'neighbours_per_medicine': self.neighbour_ids.shape[1] if self.neighbour_ids is not None else None,
+            'symptom_terms': len(self.symptom_index.term_ids) if self.symptom_index is not None else None,
+            'name_match_cache': self.name_index.match.cache_info()._asdict() if self.name_index else None,
+            'artifact_dir': self.directory or self.root,
+            'artifact_bytes': files,
+            'memory': memory_usage(),
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The process-wide engine. Creating it is cheap; artifacts are opened on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RecommenderEngine()
+    return _engine
+
+
+def get_recommendations(medicine_name, k=5):
+    """
+    Recommended medicines for `medicine_name` as [{'name', 'similarity'}, ...],
+    or [] if the artifacts aren't available or no name is close enough.
+    """
+    return get_engine().recommend(medicine_name, k)
@@ -0,0 +1,146 @@
+"""
+Offline latency/quality numbers for the recommender (see `benchmark_recommender`).
+
+The workload is drug names sampled from the artifacts themselves, a share of
+them misspelled the way people type them (dropped, doubled, swapped or wrong
+letters), so we know which row each query *should* resolve to. That gives:
+
+    latency      p50/p95/p99 of recommend() per query, with a cold and a warm
+                 name-match cache
+    hit rate     share of queries resolved to the row they came from (clean and
+                 misspelled separately), and share that found nothing
+    overlap      for two artifact versions, how much of the top-k agrees for the
+                 same queries (by name, since row numbers move between builds)
+"""
+import os
+import random
+import string
+import time
+
+import numpy as np
+
+from .recommender import RecommenderEngine, memory_usage
+
+PERCENTILES = (50, 95, 99)
+
+
+def misspell(name, rng):
+    """One random typo in a letter of `name` (names without letters come back unchanged)."""
+    positions = [i for i, c in enumerate(name) if c.isalpha()]
+    if not positions:
+        return name
+    i = rng.choice(positions)
+    kind = rng.choice(('drop', 'double', 'swap', 'replace'))
+    if kind == 'drop':
+        return name[:i] + name[i + 1:]
+    if kind == 'double':
+        return name[:i] + name[i] + name[i:]
+    if kind == 'swap' and i + 1 < len(name):
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name[:i] + rng.choice(string.ascii_lowercase) + name[i + 1:]
+
+
+def make_workload(names, size, misspell_rate=0.3, seed=0):
+    """[(query, expected_row, misspelled), ...] sampled from `names` (a repeatable list for a given seed)."""
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(size):
+        row = rng.randrange(len(names))
+        if rng.random() < misspell_rate:
+            workload.append((misspell(names[row], rng), row, True))
+        else:
+            workload.append((names[row].lower() if rng.random() < 0.5 else names[row], row, False))
+    return workload
+
+
+def latency_summary(seconds):
+    """Percentiles and mean of a list of timings, in milliseconds."""
+    if not seconds:
+        return {}
+    ms = np.array(seconds) * 1000
+    summary = {f'p{p}': float(np.percentile(ms, p)) for p in PERCENTILES}
+    summary['mean'] = float(ms.mean())
+    summary['max'] = float(ms.max())
+    return summary
+
+
+def load_engine(directory):
+    """A fresh engine for `directory` with its load time and the memory it added."""
+    before = memory_usage()
+    engine = RecommenderEngine(directory)
+    started = time.perf_counter()
+    engine.load()
+    seconds = time.perf_counter() - started
+    after = memory_usage()
+    if engine.name_index is None:
+        raise ValueError(engine.error)
+    return engine, {
+        'version': engine.version or os.path.basename(os.path.normpath(directory)),
+        'medicines': len(engine.names),
+        'load_seconds': seconds,
+        'artifact_bytes': sum(size or 0 for size in engine.status()['artifact_bytes'].values()),
+        'rss_bytes': after.get('vmrss', after['max_rss']),
+        'rss_added_bytes': after.get('vmrss', after['max_rss']) - before.get('vmrss', before['max_rss']),
+    }
+
+
+def run_benchmark(engine, workload, k=5):
+    """Latency and hit-rate numbers for one engine over a workload."""
+    cold, warm = [], []
+    hits = {False: 0, True: 0}
+    totals = {False: 0, True: 0}
+    misses = 0
+    for query, expected, misspelled in workload:
+        started = time.perf_counter()
+        engine.recommend(query, k)
+        cold.append(time.perf_counter() - started)
+
+        row = engine.name_index.best_row(query)
+        totals[misspelled] += 1
+        if row is None:
+            misses += 1
+        elif engine.names[row] == engine.names[expected]:  # duplicate names count as a hit
+            hits[misspelled] += 1
+
+    for query, _, _ in workload:
+        started = time.perf_counter()
+        engine.recommend(query, k)
+        warm.append(time.perf_counter() - started)
+
+    symptom = []
+    if engine.symptom_index is not None:
+        for reason in engine.symptom_index.reasons[:200]:
+            started = time.perf_counter()
+            engine.search_symptoms(reason, 10)
+            symptom.append(time.perf_counter() - started)
+
+    n = len(workload)
+    return {
+        'queries': n,
+        'latency_ms': latency_summary(cold),
+        'cached_latency_ms': latency_summary(warm),
+        'symptom_search_ms': latency_summary(symptom),
+        'queries_per_second': n / sum(cold) if cold else 0.0,
+        'hit_rate': (hits[False] + hits[True]) / n if n else 0.0,
+        'hit_rate_clean': hits[False] / totals[False] if totals[False] else None,
+        'hit_rate_misspelled': hits[True] / totals[True] if totals[True] else None,
+        'no_match_rate': misses / n if n else 0.0,
+    }
+
+
+def compare_versions(engine, other, workload, k=5):
+    """How far `other`'s recommendations agree with `engine`'s for the workload's queries."""
+    overlaps = []
+    identical = 0
+    for query, _, _ in workload:
+        ours = [rec['name'] for rec in engine.recommend(query, k)]
+        theirs = [rec['name'] for rec in other.recommend(query, k)]
+        if not ours and not theirs:
+            continue
+        overlaps.append(len(set(ours) & set(theirs)) / max(len(ours), len(theirs)))
+        identical += ours == theirs
+    return {
+        'compared_queries': len(overlaps),
+        'mean_overlap_at_k': float(np.mean(overlaps)) if overlaps else None,
+        'identical_rate': identical / len(overlaps) if overlaps else None,
+    }
@@ -0,0 +1,145 @@
+"""
+Builds the recommender's neighbour artifacts from medicine.csv.
+
+Each medicine becomes a TF-IDF vector over the words of its Drug_Name, Reason
+and Description (sublinear tf, smoothed idf, L2-normalized, the same recipe as
+scikit-learn's TfidfVectorizer) kept as a sparse CSR matrix in plain numpy.
+Cosine similarity is then just a dot product, and it is computed a block of
+rows at a time through an inverted index: a row only scores documents it
+shares a term with, so a block costs its posting lists rather than n^2, and
+only the top k of each row is kept (recommender.top_k_rows). Blocks are
+independent, so they are spread over a process pool.
+"""
+import csv
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .recommender import DEFAULT_NEIGHBOURS, top_k_rows
+from .symptom_index import tokenize
+
+TEXT_COLUMNS = ('Drug_Name', 'Reason', 'Description')
+BLOCK_ROWS = 256
+MIN_DF = 2  # words seen once can't link two medicines
+MAX_DF = 0.5  # words in more than half the rows say nothing about any of them
+
+
+def read_medicines(path):
+    """(names, reasons, descriptions) from a medicine.csv with Drug_Name/Reason/Description columns."""
+    names, reasons, descriptions = [], [], []
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        missing = set(TEXT_COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(sorted(missing))} column")
+        for row in reader:
+            names.append(row['Drug_Name'].strip())
+            reasons.append((row['Reason'] or '').strip())
+            descriptions.append((row['Description'] or '').strip())
+    return names, reasons, descriptions
+
+
+class TfidfMatrix:
+    """Row-normalized TF-IDF vectors in CSR form (indptr, indices, data) plus the CSC transpose."""
+
+    def __init__(self, texts, min_df=MIN_DF, max_df=MAX_DF):
+        counts = [Counter(tokenize(text)) for text in texts]
+        n = len(counts)
+        df = Counter(word for row in counts for word in row)
+        self.vocabulary = {
+            word: i for i, word in enumerate(sorted(w for w, d in df.items() if min_df <= d <= max_df * n))
+        }
+        idf = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for word, i in self.vocabulary.items():
+            idf[i] = np.log((1 + n) / (1 + df[word])) + 1
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indices, data = [], []
+        for row, row_counts in enumerate(counts):
+            terms = sorted((self.vocabulary[w], c) for w, c in row_counts.items() if w in self.vocabulary)
+            indices.extend(t for t, _ in terms)
+            data.extend(c for _, c in terms)
+            indptr[row + 1] = len(indices)
+        self.shape = (n, len(self.vocabulary))
+        self.indptr = indptr
+        self.indices = np.array(indices, dtype=np.int32)
+        tf = np.array(data, dtype=np.float32)
+        self.data = (1 + np.log(tf)) * idf[self.indices] if len(tf) else tf
+
+        # L2-normalize each row so dot products are cosine similarities
+        row_of = np.repeat(np.arange(n), np.diff(indptr))
+        norms = np.sqrt(np.bincount(row_of, weights=self.data ** 2, minlength=n)).astype(np.float32)
+        norms[norms == 0] = 1
+        self.data /= norms[row_of]
+
+        # Column-major copy: for each term, which rows have it and with what weight
+        order = np.argsort(self.indices, kind='stable')
+        self.col_ptr = np.zeros(self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=self.shape[1]), out=self.col_ptr[1:])
+        self.col_rows = row_of[order].astype(np.int32)
+        self.col_data = self.data[order]
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def arrays(self):
+        return self.indptr, self.indices, self.data, self.col_ptr, self.col_rows, self.col_data
+
+
+def cosine_block(arrays, start, stop):
+    """Dense float32 cosine scores of rows [start, stop) against every row."""
+    indptr, indices, data, col_ptr, col_rows, col_data = arrays
+    n = len(indptr) - 1
+    lo, hi = indptr[start], indptr[stop]
+    # One entry per (row, term) in the block; expand each into that term's posting list
+    terms, weights = indices[lo:hi], data[lo:hi]
+    rows = np.repeat(np.arange(stop - start), np.diff(indptr[start:stop + 1]))
+    lengths = col_ptr[terms + 1] - col_ptr[terms]
+    total = int(lengths.sum())
+    # Positions into col_rows/col_data for every expanded posting, without a Python loop
+    offsets = np.repeat(col_ptr[terms] - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    keys = np.repeat(rows, lengths).astype(np.int64) * n + col_rows[offsets]
+    products = np.repeat(weights, lengths) * col_data[offsets]
+    return np.bincount(keys, weights=products, minlength=(stop - start) * n).astype(np.float32).reshape(-1, n)
+
+
+_worker_arrays = None
+
+
+def _init_worker(arrays):
+    global _worker_arrays
+    _worker_arrays = arrays
+
+
+def _neighbour_block(start, stop, k):
+    return start, top_k_rows(cosine_block(_worker_arrays, start, stop), start, k)
+
+
+def cosine_neighbours(matrix, k=DEFAULT_NEIGHBOURS, workers=1, block_rows=BLOCK_ROWS):
+    """
+    Top-k cosine neighbours of every row of a TfidfMatrix as (ids int32,
+    scores float32), n x k, best first. With workers > 1 the row blocks are
+    scored in a process pool; each worker gets the matrix once, at start-up.
+    """
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    ids = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float32)
+    blocks = [(start, min(start + block_rows, n), k) for start in range(0, n, block_rows)]
+    if workers <= 1:
+        _init_worker(matrix.arrays())
+        results = (_neighbour_block(*block) for block in blocks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix.arrays(),))
+        results = executor.map(_neighbour_block, *zip(*blocks))
+    try:
+        for start, (block_ids, block_scores) in results:
+            ids[start:start + len(block_ids)] = block_ids
+            scores[start:start + len(block_ids)] = block_scores
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return ids, scores
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .interactions import invalidate_interactions
+from .models import DrugInteraction
+
+
+@receiver(post_save, sender=DrugInteraction)
+@receiver(post_delete, sender=DrugInteraction)
+def reload_interactions(sender, **kwargs):
+    """Any change to the interaction table means this process's in-memory copy is stale."""
+    invalidate_interactions()
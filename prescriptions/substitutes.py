@@ -0,0 +1,202 @@
+"""
+Joins recommendations back to our own Medicine stock.
+
+The recommender's names come from medicine.csv ("Paracetamol 125mg Syrup
+60mlParacetamol 500mg Tablet 10'S"), ours are short ("Paracetamol 500mg",
+"Panadol"). Both are reduced to keys: each product in the cell, lower-cased,
+up to its dosage form, with the strength kept ("paracetamol 500mg") and
+without it ("paracetamol"). A local medicine is linked to every row sharing
+its key; local names without a strength match on the strength-less key. The
+links are stored per artifact version in RecommenderMedicineLink, so a
+recommendation's in-stock batches are one IN query away.
+
+This is also where the recommender meets the database: the batch and symptom
+search services used by the views live here, so recommender.py and the build
+code stay plain numpy (process-pool workers import them without Django set up).
+"""
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from Medicine_inventory.models import Medicine
+from .models import PrescriptionItem, RecommenderMedicineLink
+from .recommender import (
+    DEFAULT_NEIGHBOURS, KEEP_VERSIONS, artifact_dir, get_engine, list_versions, new_version, publish_artifacts,
+)
+
+# Words that end the product name ("Dolo 650mg Tablet 15'S" -> "dolo 650mg")
+FORM_WORDS = frozenset(
+    'tablet tablets tab capsule capsules cap syrup suspension injection infusion drops drop cream gel '
+    'ointment lotion solution powder spray inhaler soap shampoo liquid sachet granules respules '
+    'suppository kit wash oral eye ear nasal'.split()
+)
+# A medicine cell sometimes holds several products run together: "...20gmA Ret 0.1% Gel..."
+_product_boundary = re.compile(r"(?<=[a-z])(?=[A-Z])|(?<='[Ss])(?=[A-Z])")
+_parenthetical = re.compile(r'\([^)]*\)')
+_token = re.compile(r"\d+(?:\.\d+)?\s*(?:mg|mcg|gm|g|ml|iu|%)?|[a-z]+")
+_strength = re.compile(r'^\d')
+
+STOCK_MODES = ('rank', 'only')
+# Symptom search results scanned for stocked items when filtering by stock
+SYMPTOM_CANDIDATES = 200
+
+
+def _name_words(text):
+    words = []
+    for token in _token.findall(_parenthetical.sub(' ', text).lower()):
+        if token in FORM_WORDS:
+            break
+        words.append(token.replace(' ', ''))  # "500 mg" and "500mg" are the same strength
+    return words
+
+
+def name_keys(name):
+    """Keys (with and without the strength) for every product in a recommender name."""
+    keys = set()
+    for part in _product_boundary.split(str(name)):
+        words = _name_words(part)
+        keys.add(' '.join(words))
+        keys.add(' '.join(w for w in words if not _strength.match(w)))
+    keys.discard('')
+    return keys
+
+
+def local_key(name):
+    """The single key a local Medicine name is matched on."""
+    return ' '.join(_name_words(str(name)))
+
+
+def build_medicine_links(names, version):
+    """
+    Replace `version`'s links with a fresh match of every local Medicine
+    against the recommender's `names`. Returns how many links were written.
+    """
+    rows_by_key = defaultdict(list)
+    for row, name in enumerate(names):
+        for key in name_keys(name):
+            rows_by_key[key].append(row)
+
+    medicines_by_key = defaultdict(list)
+    for pk, name in Medicine.objects.values_list('pk', 'name'):
+        medicines_by_key[local_key(name)].append(pk)
+
+    links = [
+        RecommenderMedicineLink(version=version, drug_row=row, medicine_id=pk)
+        for key, pks in medicines_by_key.items()
+        for row in rows_by_key.get(key, ())
+        for pk in pks
+    ]
+    with transaction.atomic():
+        RecommenderMedicineLink.objects.filter(version=version).delete()
+        RecommenderMedicineLink.objects.bulk_create(links, batch_size=1000)
+    return len(links)
+
+
+def prune_medicine_links(versions):
+    """Drop links for artifact versions that are no longer on disk."""
+    return RecommenderMedicineLink.objects.exclude(version__in=list(versions)).delete()[0]
+
+
+def stocked_batches(version, rows):
+    """
+    {drug_row: [batch, ...]} of in-stock, unexpired local batches for the given
+    recommender rows, soonest expiry first. One query however many rows.
+    """
+    batches = defaultdict(list)
+    if version is None or not rows:
+        return batches
+    links = RecommenderMedicineLink.objects.filter(
+        version=version,
+        drug_row__in=rows,
+        medicine__quantity_in_stock__gt=0,
+        medicine__expiry_date__gt=timezone.localdate(),
+    ).order_by('medicine__expiry_date', 'medicine_id').values_list(
+        'drug_row', 'medicine_id', 'medicine__name', 'medicine__batch_number',
+        'medicine__quantity_in_stock', 'medicine__expiry_date', 'medicine__selling_price',
+    )
+    for row, pk, name, batch_number, quantity, expiry_date, price in links:
+        batches[row].append({
+            'medicine_id': pk,
+            'name': name,
+            'batch_number': batch_number,
+            'quantity_in_stock': quantity,
+            'expiry_date': expiry_date.isoformat(),
+            'selling_price': str(price),
+        })
+    return batches
+
+
+def attach_stock(results, version, k, mode='rank'):
+    """
+    Give every recommendation in recommend_many() `results` its local 'batches',
+    then keep k per result: in-stock ones first (mode='rank', similarity order
+    otherwise kept) or only in-stock ones (mode='only').
+    """
+    batches = stocked_batches(version, {rec['row'] for result in results for rec in result['recommendations']})
+    for result in results:
+        recommendations = result['recommendations']
+        for rec in recommendations:
+            rec['batches'] = batches.get(rec['row'], [])
+        if mode == 'only':
+            recommendations = [rec for rec in recommendations if rec['batches']]
+        else:
+            recommendations = sorted(recommendations, key=lambda rec: not rec['batches'])
+        result['recommendations'] = recommendations[:k]
+    return results
+
+
+def publish_with_stock_links(names, neighbour_ids, neighbour_scores, root=None, keep=KEEP_VERSIONS, extra=None):
+    """
+    publish_artifacts(), with the new version's links to local Medicine batches
+    written first so recommendations from it can show stock straight away.
+    Returns (version, links written).
+    """
+    root = root or artifact_dir()
+    version = new_version()
+    links = build_medicine_links(names, version)
+    publish_artifacts(names, neighbour_ids, neighbour_scores, root, keep, version, extra)
+    prune_medicine_links(list_versions(root))
+    return version, links
+
+
+def get_batch_recommendations(medicine_names=(), item_ids=(), k=5, timings=False, stock=None):
+    """
+    Substitutes for a whole prescription in one call: `medicine_names` and/or
+    the medicines of the PrescriptionItems in `item_ids` (read in one query).
+    With stock='rank' (in-stock first) or 'only', each recommendation also lists
+    our in-stock, unexpired batches (see attach_stock).
+    Returns (results, missing_item_ids, version); results from items carry an
+    'item' key, and version is the recommender version they (and their stock
+    links) were read from.
+    """
+    item_ids = list(dict.fromkeys(int(pk) for pk in item_ids))
+    item_names = dict(PrescriptionItem.objects.filter(pk__in=item_ids).values_list('pk', 'medicine__name'))
+    found = [pk for pk in item_ids if pk in item_names]
+    medicine_names = list(medicine_names)
+
+    engine = get_engine()
+    # Stock filtering needs the longer neighbour list to pick k stocked ones from
+    results, version = engine.recommend_many(
+        medicine_names + [item_names[pk] for pk in found], DEFAULT_NEIGHBOURS if stock else k, timings
+    )
+    if stock:
+        attach_stock(results, version, k, stock)
+    for result, pk in zip(results[len(medicine_names):], found):
+        result['item'] = pk
+    return results, [pk for pk in item_ids if pk not in item_names], version
+
+
+def search_by_symptom(query, limit=10, stock=None):
+    """
+    Medicines for a symptom or reason ("acne", "dry cough"), best BM25 match
+    first, as (results, version). stock='rank'/'only' adds our in-stock batches
+    the same way get_batch_recommendations does.
+    """
+    engine = get_engine()
+    # Stock filtering needs more candidates to find `limit` stocked ones among
+    results, version = engine.search_symptoms(query, SYMPTOM_CANDIDATES if stock else limit)
+    if stock:
+        results = attach_stock([{'recommendations': results}], version, limit, stock)[0]['recommendations']
+    return results, version
@@ -0,0 +1,135 @@
+"""
+"What do you have for X?" search over medicine.csv's Reason and Description.
+
+build_symptom_index() turns the columns into an inverted index of flat arrays
+that are saved with the other recommender artifacts:
+
+    symptom_term_data/offsets   the vocabulary, sorted, stored like the names
+    symptom_postings_ptr        where each term's postings start/end (int64, terms + 1)
+    symptom_postings_rows       medicine rows containing the term (int32)
+    symptom_postings_weights    the BM25 weight of the term in that row (float32)
+    symptom_reason_data/offsets the distinct Reason labels
+    symptom_reason_ids          each row's Reason label (int32)
+
+BM25's weight of a term in a document doesn't depend on the query, so it is
+computed once at build time; answering a query is then a bincount over the
+query terms' posting slices and a top-k pick, with no database involved.
+Reason words count REASON_WEIGHT times, so a medicine *for* acne outranks one
+whose description merely mentions it.
+"""
+import re
+from collections import Counter
+
+import numpy as np
+
+from .name_index import decode_names, encode_names
+
+K1 = 1.2
+B = 0.75
+REASON_WEIGHT = 3
+
+TERM_DATA_FILE = 'symptom_term_data.npy'
+TERM_OFFSETS_FILE = 'symptom_term_offsets.npy'
+POSTINGS_PTR_FILE = 'symptom_postings_ptr.npy'
+POSTINGS_ROWS_FILE = 'symptom_postings_rows.npy'
+POSTINGS_WEIGHTS_FILE = 'symptom_postings_weights.npy'
+REASON_DATA_FILE = 'symptom_reason_data.npy'
+REASON_OFFSETS_FILE = 'symptom_reason_offsets.npy'
+REASON_IDS_FILE = 'symptom_reason_ids.npy'
+SYMPTOM_FILES = (TERM_DATA_FILE, TERM_OFFSETS_FILE, POSTINGS_PTR_FILE, POSTINGS_ROWS_FILE,
+                 POSTINGS_WEIGHTS_FILE, REASON_DATA_FILE, REASON_OFFSETS_FILE, REASON_IDS_FILE)
+
+_token = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or that the this to used '
+    'was which with you your can may also other such these those who not'.split()
+)
+
+
+def stem(word):
+    # Just enough to fold plurals together ("infections" -> "infection", "allergies" -> "allergy")
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in _token.findall(str(text).lower()) if word not in STOP_WORDS and len(word) > 1]
+
+
+def build_symptom_index(reasons, descriptions, k1=K1, b=B):
+    """{filename: array} for SYMPTOM_FILES, one document per medicine row."""
+    documents = [
+        Counter(tokenize(reason) * REASON_WEIGHT + tokenize(description))
+        for reason, description in zip(reasons, descriptions)
+    ]
+    n = len(documents)
+    terms = sorted(set().union(*documents)) if documents else []
+    term_ids = {term: i for i, term in enumerate(terms)}
+
+    rows = np.fromiter((row for row, doc in enumerate(documents) for _ in doc), dtype=np.int32)
+    ids = np.fromiter((term_ids[term] for doc in documents for term in doc), dtype=np.int64, count=len(rows))
+    tf = np.fromiter((count for doc in documents for count in doc.values()), dtype=np.float64, count=len(rows))
+
+    lengths = np.array([sum(doc.values()) for doc in documents], dtype=np.float64)
+    avg_length = lengths.mean() if n and lengths.any() else 1.0
+    df = np.bincount(ids, minlength=len(terms))
+    idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+    weights = idf[ids] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[rows] / avg_length))
+
+    # Group postings by term (rows stay ascending within a term)
+    order = np.argsort(ids, kind='stable')
+    ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(df, out=ptr[1:])
+
+    labels = sorted(set(str(reason).strip() for reason in reasons))
+    label_ids = {label: i for i, label in enumerate(labels)}
+    term_data, term_offsets = encode_names(terms)
+    reason_data, reason_offsets = encode_names(labels)
+    return {
+        TERM_DATA_FILE: term_data,
+        TERM_OFFSETS_FILE: term_offsets,
+        POSTINGS_PTR_FILE: ptr,
+        POSTINGS_ROWS_FILE: rows[order],
+        POSTINGS_WEIGHTS_FILE: weights[order].astype(np.float32),
+        REASON_DATA_FILE: reason_data,
+        REASON_OFFSETS_FILE: reason_offsets,
+        REASON_IDS_FILE: np.array([label_ids[str(reason).strip()] for reason in reasons], dtype=np.int32),
+    }
+
+
+class SymptomIndex:
+    """Query side of build_symptom_index(), over the (memory-mapped) arrays."""
+
+    def __init__(self, arrays):
+        self.term_ids = {term: i for i, term in enumerate(decode_names(arrays[TERM_DATA_FILE], arrays[TERM_OFFSETS_FILE]))}
+        self.reasons = decode_names(arrays[REASON_DATA_FILE], arrays[REASON_OFFSETS_FILE])
+        self.reason_ids = arrays[REASON_IDS_FILE]
+        self.ptr = arrays[POSTINGS_PTR_FILE]
+        self.rows = arrays[POSTINGS_ROWS_FILE]
+        self.weights = arrays[POSTINGS_WEIGHTS_FILE]
+        if len(self.ptr) != len(self.term_ids) + 1 or len(self.rows) != len(self.weights):
+            raise ValueError("symptom index arrays don't match each other")
+
+    def __len__(self):
+        return len(self.reason_ids)
+
+    def search(self, query, limit=10):
+        """[(row, score), ...] for the best `limit` rows, best first (ties by row)."""
+        ids = sorted({self.term_ids[term] for term in tokenize(query) if term in self.term_ids})
+        if not ids or limit <= 0:
+            return []
+        rows = np.concatenate([self.rows[self.ptr[i]:self.ptr[i + 1]] for i in ids])
+        weights = np.concatenate([self.weights[self.ptr[i]:self.ptr[i + 1]] for i in ids])
+        hits, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)  # a row's score is the sum over the query terms it has
+        if len(hits) > limit:
+            keep = np.argpartition(-scores, limit - 1)[:limit]
+            hits, scores = hits[keep], scores[keep]
+        order = np.lexsort((hits, -scores))
+        return [(int(hits[i]), float(scores[i])) for i in order]
+
+    def reason(self, row):
+        return self.reasons[self.reason_ids[row]]
@@ -1,3 +1,365 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from unittest.mock import patch
 
-# Create your tests here.
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from Medicine_inventory.models import Medicine
+from . import recommender
+from . import interactions
+from .interactions import InteractionChecker, validate_prescription
+from .models import Doctor, DrugInteraction, Patient, Prescription, PrescriptionItem
+from .name_index import NameIndex
+from .recommender import NEIGHBOUR_SCORES_FILE, RecommenderEngine, current_version, top_k_neighbours, write_artifacts
+from .substitutes import get_batch_recommendations, name_keys, publish_with_stock_links
+from .symptom_index import SymptomIndex, build_symptom_index
+
+NAMES = ["Panadol 500mg", "Paracetamol 500mg", "Ibuprofen 400mg", "Amoxicillin 250mg"]
+SIMILARITY = np.array([
+    [1.0, 0.9, 0.4, 0.0],
+    [0.9, 1.0, 0.5, 0.1],
+    [0.4, 0.5, 1.0, 0.2],
+    [0.0, 0.1, 0.2, 1.0],
+])
+
+
+def make_medicine(name, batch_number, stock=10, expires_in=365):
+    return Medicine.objects.create(
+        name=name, brand="GSK", category="Antibiotic", medicine_type="RX", dosage="250mg",
+        selling_price=Decimal("8.00"), quantity_in_stock=stock, batch_number=batch_number,
+        manufacture_date=date.today() - timedelta(days=30), expiry_date=date.today() + timedelta(days=expires_in),
+    )
+
+
+class RecommenderEngineTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def test_loads_memory_mapped_artifacts_on_first_use(self):
+        write_artifacts(NAMES, SIMILARITY, self.dir)
+        engine = RecommenderEngine(self.dir)
+        self.assertFalse(engine.status()['loaded'])
+
+        recommendations = engine.recommend("Panadol 500", k=2)
+        self.assertEqual([r['name'] for r in recommendations], ["Paracetamol 500mg", "Ibuprofen 400mg"])
+        self.assertAlmostEqual(recommendations[0]['similarity'], 0.9, places=5)
+        self.assertIsInstance(engine.neighbour_ids, np.memmap)
+        status = engine.status()
+        self.assertTrue(status['ready'])
+        self.assertEqual(status['medicines'], 4)
+        self.assertIsNotNone(status['load_seconds'])
+        self.assertGreater(status['memory']['max_rss'], 0)
+
+    def test_top_k_matches_a_full_sort(self):
+        rng = np.random.default_rng(0)
+        similarity = rng.random((300, 300)).astype(np.float32)
+        ids, scores = top_k_neighbours(similarity, k=10, chunk_rows=64)
+        for row in (0, 123, 299):
+            expected = [i for i in np.argsort(-similarity[row], kind='stable') if i != row][:10]
+            self.assertEqual(ids[row].tolist(), expected)
+            self.assertTrue(np.array_equal(scores[row], similarity[row, expected]))
+
+    def test_missing_artifacts_disable_recommendations(self):
+        engine = RecommenderEngine(os.path.join(self.dir, 'missing'))
+        self.assertEqual(engine.recommend("Panadol"), [])
+        self.assertFalse(engine.status()['ready'])
+        self.assertIn('No such file', engine.status()['error'])
+
+    def test_export_command_converts_the_pickles(self):
+        medicines = os.path.join(self.dir, 'medicines.pkl')
+        similarity = os.path.join(self.dir, 'similarity.pkl')
+        with open(medicines, 'wb') as f:
+            pickle.dump({'Drug_Name': dict(enumerate(NAMES))}, f)
+        with open(similarity, 'wb') as f:
+            f.write(b'version https://git-lfs.github.com/spec/v1\n')
+        out = os.path.join(self.dir, 'artifacts')
+        with self.assertRaises(CommandError):
+            call_command('export_recommender_artifacts', medicines=medicines, similarity=similarity, output=out)
+
+        with open(similarity, 'wb') as f:
+            pickle.dump(SIMILARITY, f)
+        call_command('export_recommender_artifacts', medicines=medicines, similarity=similarity, output=out, stdout=io.StringIO())
+        scores = np.load(os.path.join(out, current_version(out), NEIGHBOUR_SCORES_FILE))
+        self.assertEqual(scores.dtype, np.float32)
+        self.assertEqual(RecommenderEngine(out).recommend("Amoxicillin")[0]['name'], "Ibuprofen 400mg")
+
+        with open(medicines, 'wb') as f:
+            pickle.dump({'Drug_Name': {0: NAMES[0]}}, f)
+        with open(similarity, 'wb') as f:
+            pickle.dump(np.ones((1, 1)), f)
+        with self.assertRaisesMessage(CommandError, "needs at least two medicines"):
+            call_command('export_recommender_artifacts', medicines=medicines, similarity=similarity, output=out)
+
+    def test_build_command_publishes_versions_that_running_engines_reload(self):
+        csv_path = os.path.join(self.dir, 'medicine.csv')
+        with open(csv_path, 'w') as f:
+            f.write(
+                "index,Drug_Name,Reason,Description\n"
+                "1,Panadol 500mg,Fever,Paracetamol tablet for fever and mild pain\n"
+                "2,Calpol 250mg,Fever,Paracetamol syrup for fever in children\n"
+                "3,Brufen 400mg,Pain,Ibuprofen tablet for pain and swelling\n"
+                "4,Nurofen 200mg,Pain,Ibuprofen capsule for pain\n"
+                "5,Amoxil 250mg,Infection,Amoxicillin antibiotic capsule for infection\n"
+            )
+        out = os.path.join(self.dir, 'artifacts')
+        call_command('build_recommender', csv=csv_path, output=out, workers=1, stdout=io.StringIO())
+        first = current_version(out)
+        engine = RecommenderEngine(out)
+        self.assertEqual(engine.recommend("Panadol")[0]['name'], "Calpol 250mg")
+        self.assertEqual(engine.recommend("Brufen")[0]['name'], "Nurofen 200mg")
+        self.assertEqual(engine.status()['version'], first)
+        self.assertEqual({r['name'] for r in engine.search_symptoms("infections")[0]}, {"Amoxil 250mg"})
+
+        with open(csv_path, 'a') as f:
+            f.write("6,Crocin 500mg,Fever,Paracetamol tablet for fever and mild pain\n")
+        call_command('build_recommender', csv=csv_path, output=out, workers=1, keep=1, stdout=io.StringIO())
+        self.assertNotEqual(current_version(out), first)
+        self.assertFalse(os.path.exists(os.path.join(out, first)))  # pruned
+        self.assertEqual(engine.recommend("Panadol")[0]['name'], "Calpol 250mg")  # still the mapped old version
+
+        engine.checked_at -= recommender.RELOAD_CHECK_SECONDS  # next request looks at CURRENT again
+        self.assertEqual(engine.recommend("Panadol")[0]['name'], "Crocin 500mg")
+        self.assertEqual(engine.status()['medicines'], 6)
+
+
+    def test_benchmark_reports_latency_hit_rate_and_version_overlap(self):
+        write_artifacts(NAMES, SIMILARITY, self.dir)
+        reordered = SIMILARITY.copy()
+        reordered[0, 2] = reordered[2, 0] = 0.95  # Panadol's best alternative changes in the new build
+        write_artifacts(NAMES, reordered, self.dir)
+        out = io.StringIO()
+        call_command('benchmark_recommender', output=self.dir, queries=40, k=1, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['load']['medicines'], 4)
+        self.assertEqual(report['benchmark']['queries'], 40)
+        self.assertEqual(set(report['benchmark']['latency_ms']), {'p50', 'p95', 'p99', 'mean', 'max'})
+        self.assertGreater(report['benchmark']['hit_rate'], 0.5)
+        comparison = report['comparison']
+        self.assertEqual(comparison['compared_queries'], 40)
+        self.assertLess(comparison['identical_rate'], 1)
+
+class BatchRecommendationTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        write_artifacts(NAMES, SIMILARITY, self.dir)
+        override = override_settings(RECOMMENDER_ARTIFACT_DIR=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        recommender._engine = None
+        self.addCleanup(setattr, recommender, '_engine', None)
+
+    def test_engine_gathers_every_match_at_once(self):
+        engine = RecommenderEngine(self.dir)
+        results, version = engine.recommend_many(["Panadol 500", "Zyrtec", "Ibuprofen"], k=2, timings=True)
+        self.assertEqual(version, engine.version)
+        self.assertEqual([r['match'] for r in results], ["Panadol 500mg", None, "Ibuprofen 400mg"])
+        self.assertEqual([r['name'] for r in results[0]['recommendations']], ["Paracetamol 500mg", "Ibuprofen 400mg"])
+        self.assertEqual(results[1]['recommendations'], [])
+        self.assertEqual(results[2]['recommendations'], engine.recommend("Ibuprofen", k=2))
+        self.assertIn('match_ms', results[0])
+
+    def test_prescription_items_are_resolved_in_one_query(self):
+        medicine = make_medicine("Amoxicillin 250mg", "AMX-1")
+        prescription = Prescription.objects.create(
+            patient=Patient.objects.create(first_name="Ann", last_name="Perera", date_of_birth=date(1990, 1, 1),
+                                           email="ann@example.com"),
+            doctor=Doctor.objects.create(first_name="Sam", last_name="Silva", medical_code="MC-1"),
+        )
+        item = PrescriptionItem.objects.create(prescription=prescription, medicine=medicine, dosage="1 tab",
+                                               duration="5 days", requested_quantity=10)
+
+        with self.assertNumQueries(1):
+            results, missing, _ = get_batch_recommendations(["Panadol"], [item.pk, 999], k=1)
+        self.assertEqual(missing, [999])
+        self.assertEqual(results[1]['item'], item.pk)
+        self.assertEqual(results[1]['recommendations'][0]['name'], "Ibuprofen 400mg")
+
+    def test_stock_modes_use_linked_in_stock_batches(self):
+        make_medicine("Amoxicillin 250 mg", "AMX-OLD", expires_in=30)
+        make_medicine("Amoxicillin 250mg", "AMX-NEW", expires_in=300)
+        make_medicine("Amoxicillin 250mg", "AMX-EXPIRED", expires_in=-1)
+        make_medicine("Ibuprofen", "IBU-EMPTY", stock=0)
+        make_medicine("Cetirizine 10mg", "CET-1")
+        version, links = publish_with_stock_links(NAMES, *top_k_neighbours(SIMILARITY), self.dir)
+        self.assertEqual(links, 4)  # three Amoxicillin batches to row 3, Ibuprofen (no strength) to row 2
+
+        with self.assertNumQueries(1):  # one IN query for the batches (no items to look up)
+            ranked, _, _ = get_batch_recommendations(["Panadol"], k=2, stock='rank')
+        recommendations = ranked[0]['recommendations']
+        self.assertEqual([r['name'] for r in recommendations], ["Amoxicillin 250mg", "Paracetamol 500mg"])
+        self.assertEqual([b['batch_number'] for b in recommendations[0]['batches']], ["AMX-OLD", "AMX-NEW"])
+        self.assertEqual(recommendations[1]['batches'], [])
+
+        only, _, _ = get_batch_recommendations(["Panadol"], k=2, stock='only')
+        self.assertEqual([r['name'] for r in only[0]['recommendations']], ["Amoxicillin 250mg"])
+
+    def test_stock_links_come_from_the_version_the_rows_were_read_from(self):
+        make_medicine("Amoxicillin 250mg", "AMX-NEW", expires_in=300)
+        version, _ = publish_with_stock_links(NAMES, *top_k_neighbours(SIMILARITY), self.dir)
+        recommend_many = RecommenderEngine.recommend_many
+
+        def reload_right_after(engine, *args, **kwargs):
+            result = recommend_many(engine, *args, **kwargs)
+            engine.artifacts = engine.artifacts._replace(version='published-meanwhile')
+            return result
+
+        with patch.object(RecommenderEngine, 'recommend_many', autospec=True, side_effect=reload_right_after):
+            results, _, used = get_batch_recommendations(["Panadol"], k=2, stock='only')
+        self.assertEqual(used, version)
+        self.assertEqual([b['batch_number'] for b in results[0]['recommendations'][0]['batches']], ["AMX-NEW"])
+
+    def test_name_keys_split_run_together_products(self):
+        self.assertEqual(
+            name_keys("Paracetamol 125mg Syrup 60mlParacetamol(GSK) 500 mg Tablet 10'S"),
+            {"paracetamol 125mg", "paracetamol 500mg", "paracetamol"},
+        )
+
+
+class SymptomIndexTests(SimpleTestCase):
+    def test_reason_matches_outrank_description_mentions(self):
+        reasons = ["Acne", "Skin care", "Acne", "Fever"]
+        descriptions = [
+            "Gel for spots and pimples",
+            "Face wash that can help with acne and oily skin",
+            "Cream for severe acne vulgaris",
+            "Tablets for fever and headaches",
+        ]
+        index = SymptomIndex(build_symptom_index(reasons, descriptions))
+        results = index.search("acne", limit=3)
+        self.assertEqual([row for row, _ in results][-1], 1)  # only mentions acne
+        self.assertEqual({row for row, _ in results[:2]}, {0, 2})
+        self.assertEqual(index.search("headache")[0][0], 3)  # plurals fold together
+        self.assertEqual(index.reason(3), "Fever")
+        self.assertEqual(index.search("zzz"), [])
+
+
+class NameIndexTests(SimpleTestCase):
+    def test_resolves_exact_typo_and_unknown_names(self):
+        index = NameIndex(NAMES + ["panadol 500MG"])
+        self.assertEqual(index.best_row("PANADOL  500mg"), 0)  # exact after normalizing, first row wins
+        self.assertEqual(index.best_row("Paracetmol 500"), 1)
+        self.assertEqual(index.best_row("Amoxcillin"), 3)
+        self.assertIsNone(index.best_row("Zyrtec"))
+
+    def test_repeated_queries_come_from_the_cache(self):
+        index = NameIndex(NAMES)
+        index.best_row("Ibuprofn")
+        index.best_row("Ibuprofn")
+        self.assertEqual(index.match.cache_info().hits, 1)
+
+
+class InteractionCheckerTests(TestCase):
+    def setUp(self):
+        interactions._checker = None
+        self.addCleanup(setattr, interactions, '_checker', None)
+
+    def test_pairs_match_in_either_order_by_ingredient_and_alias(self):
+        checker = InteractionChecker(
+            [(1, "Warfarin", "Aspirin", "Severe"),
+             (2, "aspirin", "WARFARIN", "Mild"),
+             (3, "Ibuprofen", "Paracetamol", "Mild")],
+            aliases={"Panadol": ["Paracetamol"]},
+        )
+        self.assertEqual(len(checker), 2)
+        hits = checker.check(["Aspirin 75mg Tablet", "Panadol 500mg", "Warfarin 5mg", "Ibuprofen 400mg"])
+        self.assertEqual([(h['medicines'], h['severity'], h['id']) for h in hits], [
+            (("Aspirin 75mg Tablet", "Warfarin 5mg"), "Severe", 1),  # worst copy of the pair wins
+            (("Panadol 500mg", "Ibuprofen 400mg"), "Mild", 3),
+        ])
+        self.assertEqual(checker.check(["Warfarin 5mg", "Warfarin 1mg"]), [])
+
+    def test_prescription_is_checked_without_a_query_per_pair(self):
+        DrugInteraction.objects.create(drug1_name="Warfarin", drug2_name="Aspirin",
+                                       interaction_description="Bleeding risk", severity="Severe")
+        prescription = Prescription.objects.create(
+            patient=Patient.objects.create(first_name="Ann", last_name="Perera", date_of_birth=date(1990, 1, 1),
+                                           email="ann@example.com"),
+            doctor=Doctor.objects.create(first_name="Sam", last_name="Silva", medical_code="MC-1"),
+        )
+        for i, name in enumerate(["Warfarin 5mg", "Aspirin 75mg", "Amoxicillin 250mg"]):
+            PrescriptionItem.objects.create(prescription=prescription, medicine=make_medicine(name, f"B-{i}"),
+                                            dosage="1 tab", duration="5 days", requested_quantity=1)
+
+        validate_prescription(prescription)
+        prescription.refresh_from_db()
+        self.assertFalse(prescription.is_validated)
+        self.assertEqual(prescription.interaction_warning, "Severe: Warfarin 5mg + Aspirin 75mg - Bleeding risk")
+
+        with self.assertNumQueries(2):  # item names + the hit's description; the pairs come from memory
+            validate_prescription(prescription, save=False)
+
+        # Editing the table reloads it once the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            DrugInteraction.objects.update(severity="Moderate")
+            DrugInteraction.objects.get().save()
+        validate_prescription(prescription)
+        self.assertTrue(prescription.is_validated)
+        self.assertTrue(prescription.interaction_warning.startswith("Moderate:"))
+
+
+class DrugInteractionLoaderTests(TestCase):
+    def test_loads_pairs_once_whichever_way_round(self):
+        path = os.path.join(tempfile.mkdtemp(), 'interactions.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        with open(path, 'w', newline='') as f:
+            f.write("Drug_A,Drug_B,Level,Description\n"
+                    "Warfarin,Aspirin,moderate,Bleeding risk\n"
+                    "aspirin ,  WARFARIN,major,Bleeding risk\n"  # same pair, worse: replaces the first
+                    "Ibuprofen,Aspirin,minor,Less antiplatelet effect\n"
+                    "Aspirin,aspirin,minor,Not a pair\n"
+                    ",Aspirin,minor,No name\n")
+        DrugInteraction.objects.create(drug1_name="Ibuprofen", drug2_name="Aspirin", interaction_description="x")
+
+        out = io.StringIO()
+        call_command('load_drug_interactions', path, '--batch-size', '2', stdout=out)
+        self.assertIn("Loaded 1 new interactions from 5 rows", out.getvalue())
+        self.assertEqual(
+            list(DrugInteraction.objects.order_by('drug1_name').values_list('drug1_name', 'drug2_name', 'severity')),
+            [("Aspirin", "Ibuprofen", None), ("Aspirin", "Warfarin", "Major")],
+        )
+
+        call_command('load_drug_interactions', path, stdout=io.StringIO())  # a re-run adds nothing
+        self.assertEqual(DrugInteraction.objects.count(), 2)
+
+        with self.assertRaises(CommandError):
+            call_command('load_drug_interactions', path, '--drug1-column', 'nope', '--replace')
+        self.assertEqual(DrugInteraction.objects.count(), 2)
+
+    def test_pairs_already_stored_in_another_case_are_not_added_again(self):
+        path = os.path.join(tempfile.mkdtemp(), 'interactions.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        with open(path, 'w', newline='') as f:
+            f.write("drug1,drug2,severity\naspirin,warfarin,major\nWARFARIN,ibuprofen,minor\n")
+        DrugInteraction.objects.create(drug1_name="Aspirin", drug2_name="Warfarin", interaction_description="x")
+
+        call_command('load_drug_interactions', path, stdout=io.StringIO())
+        self.assertEqual(
+            list(DrugInteraction.objects.order_by('drug1_name').values_list('drug1_name', 'drug2_name')),
+            [("Aspirin", "Warfarin"), ("Warfarin", "ibuprofen")],
+        )
+
+    def test_replace_keeps_the_old_rows_if_the_file_fails_part_way(self):
+        path = os.path.join(tempfile.mkdtemp(), 'interactions.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        with open(path, 'wb') as f:
+            f.write(b"drug1,drug2\n" + b"".join(b"Drug %d,Aspirin\n" % i for i in range(5000)) + b"Caf\xe9,Aspirin\n")
+        DrugInteraction.objects.create(drug1_name="Aspirin", drug2_name="Warfarin", interaction_description="x")
+
+        with self.assertRaises(CommandError):  # the last line is not UTF-8: fails after many batches are in
+            call_command('load_drug_interactions', path, '--batch-size', '100', '--replace')
+        self.assertEqual(
+            list(DrugInteraction.objects.values_list('drug1_name', 'drug2_name', 'interaction_description')),
+            [("Aspirin", "Warfarin", "x")],
+        )
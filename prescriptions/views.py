@@ -10,6 +10,7 @@ from django.db.models.deletion import ProtectedError
 # Import models and forms from your prescriptions app
 from .models import Patient, Doctor, Prescription, PrescriptionItem, DrugInteraction
 from .forms import PatientForm, DoctorForm, PrescriptionForm, PrescriptionItemForm
+from .interactions import validate_prescription
 
 # Import the Medicine model from the Medicine_Inventory app
 from Medicine_inventory.models import Medicine
@@ -234,6 +235,15 @@ class PrescriptionDetailView(DetailView):
 # --- PrescriptionItem Views (for adding/updating/deleting items within a Prescription) ---
 # These are function-based views for more granular control over stock management.
 
+def revalidate_prescription(request, prescription):
+    # Re-check the prescription's medicines against each other (in memory, see interactions.py)
+    # and tell the pharmacist about anything found. The caller saves the prescription.
+    hits = validate_prescription(prescription, save=False)
+    for hit in hits:
+        messages.warning(request, f"{hit['severity']} interaction: {hit['medicines'][0]} + {hit['medicines'][1]}. {hit['description']}")
+    return hits
+
+
 def add_prescription_item(request, pk):
     # Get the parent prescription or return a 404 if not found.
     prescription = get_object_or_404(Prescription, pk=pk)
@@ -301,8 +311,7 @@ def add_prescription_item(request, pk):
                     medicine_in_stock.quantity_in_stock -= dispensed_quantity
                     medicine_in_stock.save()
 
-                    prescription.is_validated = False
-                    prescription.interaction_warning = None
+                    revalidate_prescription(request, prescription)
                     prescription.save()
 
                     return redirect('prescription_detail', pk=prescription.pk)
@@ -374,9 +383,8 @@ def update_prescription_item(request, pk, item_pk):
                 prescription_item.save()
                 medicine_in_stock.save() # Save the updated medicine stock
 
-                # --- Drug Interaction Re-validation (Future Integration Point) ---
-                prescription.is_validated = False # Mark as needing re-validation
-                prescription.interaction_warning = None # Clear old warnings
+                # --- Drug Interaction Re-validation ---
+                revalidate_prescription(request, prescription)
                 prescription.save() # Save the prescription to update its validation status
 
                 messages.success(request, "Prescription item updated successfully.")
@@ -420,9 +428,8 @@ def delete_prescription_item(request, pk, item_pk):
             # Delete the prescription item.
             prescription_item.delete()
 
-            # --- Drug Interaction Re-validation (Future Integration Point) ---
-            prescription.is_validated = False # Mark as needing re-validation
-            prescription.interaction_warning = None # Clear old warnings
+            # --- Drug Interaction Re-validation ---
+            revalidate_prescription(request, prescription)
             prescription.save() # Save the prescription to update its validation status
 
             messages.success(request, f"Medicine '{prescription_item.medicine.name}' removed from prescription and stock returned.")
@@ -443,10 +450,8 @@ class PrescriptionUpdateView(UpdateView):
     def form_valid(self, form):
         # The 'doctor' object is now available in form.cleaned_data due to custom validation in PrescriptionForm.
         form.instance.doctor = form.cleaned_data['doctor']
-        # When main prescription details are updated, re-evaluate interactions if needed.
-        # For now, just mark for re-validation.
-        form.instance.is_validated = False
-        form.instance.interaction_warning = None
+        # When main prescription details are updated, re-evaluate interactions too.
+        revalidate_prescription(self.request, form.instance)
         messages.success(self.request, "Prescription details updated successfully!")
         return super().form_valid(form)
 
@@ -612,7 +617,15 @@ def generate_prescription_pdf(request, pk):
 
 
 from django.shortcuts import render
-from .recommender import get_recommendations 
+from django.http import JsonResponse
+from django.conf import settings
+from django.views.decorators.http import require_http_methods
+import json
+import time
+from .recommender import get_engine
+from .substitutes import STOCK_MODES, get_batch_recommendations, search_by_symptom
+
+BATCH_MAX_ITEMS = 100
 
 
 def recommendation_test_view(request):
@@ -622,8 +635,9 @@ def recommendation_test_view(request):
     recommendations = []
     
     if medicine_name:
-        
-        recommendations = get_recommendations(medicine_name)
+        # In-stock substitutes first, each with the batches that can be dispensed right now
+        results, _, _ = get_batch_recommendations([medicine_name], stock='rank')
+        recommendations = results[0]['recommendations']
     
     context = {
         'medicine_name': medicine_name,
@@ -631,3 +645,85 @@ def recommendation_test_view(request):
     }
     
     return render(request, 'prescriptions/recommendation_test.html', context)
+
+
+def recommender_status(request):
+    """This worker's recommender: whether it has loaded, how long that took and its memory use."""
+    engine = get_engine()
+    if request.GET.get('load'):
+        engine.load()  # warm up on purpose, e.g. from a deploy script
+    return JsonResponse(engine.status())
+
+
+def _id_list(values):
+    # Accepts [1, 2], ["1", "2"] or "1,2"
+    if isinstance(values, str):
+        values = values.split(',')
+    return [int(value) for value in values if str(value).strip()]
+
+
+@require_http_methods(['GET', 'POST'])
+def batch_recommendations(request):
+    """
+    Substitutes for every item on a prescription in one request.
+    GET ?name=...&name=...&items=1,2&k=5&stock=rank, or POST {"names": [...], "items": [...], "k": 5, "stock": "only"}.
+    stock=rank puts substitutes we have in stock first, stock=only drops the rest.
+    With DEBUG on, each result also says how long its name match took.
+    """
+    try:
+        if request.method == 'POST':
+            payload = json.loads(request.body or b'{}')
+            names, items, k = payload.get('names', []), payload.get('items', []), payload.get('k', 5)
+            stock = payload.get('stock')
+            if not isinstance(names, list):
+                raise TypeError("names must be a list")  # a bare string would be read one character at a time
+        else:
+            names, items, k = request.GET.getlist('name'), request.GET.get('items', ''), request.GET.get('k', 5)
+            stock = request.GET.get('stock')
+        names = [str(name) for name in names if str(name).strip()]
+        items = _id_list(items)
+        k = max(1, min(int(k), 50))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Send names as a list of strings, items as a list of ids and k as a number'}, status=400)
+    if stock and stock not in STOCK_MODES:
+        return JsonResponse({'error': f"stock must be one of {', '.join(STOCK_MODES)}"}, status=400)
+    if not names and not items:
+        return JsonResponse({'error': 'Give at least one medicine name or prescription item id'}, status=400)
+    if len(names) + len(items) > BATCH_MAX_ITEMS:
+        return JsonResponse({'error': f'At most {BATCH_MAX_ITEMS} medicines per request'}, status=400)
+
+    started = time.perf_counter()
+    results, missing_items, version = get_batch_recommendations(
+        names, items, k, timings=settings.DEBUG, stock=stock or None
+    )
+    data = {'results': results, 'missing_items': missing_items, 'version': version}
+    if settings.DEBUG:
+        data['total_ms'] = (time.perf_counter() - started) * 1000
+    return JsonResponse(data)
+
+
+def symptom_search(request):
+    """
+    "What do you have for X?": medicines whose Reason/Description best match ?q=,
+    ranked by BM25 over the prebuilt index. ?stock=rank|only works like the batch API.
+    """
+    query = request.GET.get('q', '').strip()
+    stock = request.GET.get('stock') or None
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    if not query:
+        return JsonResponse({'error': 'Give a symptom or reason to search for with ?q='}, status=400)
+    if stock and stock not in STOCK_MODES:
+        return JsonResponse({'error': f"stock must be one of {', '.join(STOCK_MODES)}"}, status=400)
+    engine = get_engine()
+    if not engine.is_ready or engine.symptom_index is None:
+        return JsonResponse({'error': 'Symptom search needs artifacts built with build_recommender'}, status=503)
+
+    started = time.perf_counter()
+    results, version = search_by_symptom(query, limit, stock)
+    data = {'query': query, 'results': results, 'version': version}
+    if settings.DEBUG:
+        data['total_ms'] = (time.perf_counter() - started) * 1000
+    return JsonResponse(data)